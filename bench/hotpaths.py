@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Time the hot paths of a build on synthetic syllabi.
+
+Each benchmark is called in a loop that runs long enough to time reliably,
+and the loop is repeated; the median and fastest times per call are
+reported. Results can be saved as a JSON baseline, and a later run compared
+against it, which fails if any benchmark got slower by more than a threshold.
+Comparisons use the fastest loop, which is the one least disturbed by
+whatever else the machine was doing.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Importing synthetic puts src/ on the path
+from synthetic import (
+    ROOT,
+    add_size_arguments,
+    make_syllabus,
+    size_from_args,
+    write_department,
+)
+
+from batch import BatchCompiler
+from compile import (
+    ScheduleFormatter,
+    SyllabusCompiler,
+    SyllabusDataFormatter,
+    TemplateRenderer,
+)
+from schedule import Schedule, Scheduler
+from utils import flatten_config, wrap_paragraphs
+
+TEMPLATES = sorted((ROOT / "docs").glob("*.md"))
+
+NAMES = (
+    "make_schedule",
+    "ScheduleFormatter.format",
+    "wrap_paragraphs",
+    "flatten_config",
+    "TemplateRenderer.render",
+    "SyllabusCompiler.compile",
+    "batch",
+)
+
+
+def measure(func, repeat=7, min_time=0.05):
+    """Time a function.
+
+    The function is first called once to choose how many calls make up a
+    loop of at least min_time seconds, as timeit's autorange does.
+
+    Parameters
+    ----------
+    func : callable
+        Function to time, called without arguments
+    repeat : int
+        Number of timed loops
+    min_time : float
+        Minimum duration of a loop, in seconds
+
+    Returns
+    -------
+    dict
+        Calls per loop, number of loops, and the median and fastest time
+        per call in microseconds
+    """
+    start = time.perf_counter()
+    func()
+    once = time.perf_counter() - start
+    number = max(1, round(min_time / max(once, 1e-9)))
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+
+    return {
+        "number": number,
+        "repeat": repeat,
+        "median_us": statistics.median(times) * 1e6,
+        "min_us": min(times) * 1e6,
+    }
+
+
+def benchmarks(size, courses, workdir, seed=0):
+    """Set up the benchmarks.
+
+    Parameters
+    ----------
+    size : dict
+        Size parameters of each syllabus
+    courses : int
+        Number of syllabi in the department batch
+    workdir : Path
+        Scratch directory for the department batch
+    seed : int or str
+        Random seed
+
+    Returns
+    -------
+    dict[str, callable]
+        Benchmark functions, by name
+    """
+    config, schedule = make_syllabus(seed, **size)
+    year = config["schedule"]["year"]
+    description = config["course"]["description"]
+
+    scheduler = Scheduler()
+    formatter = ScheduleFormatter(Schedule.from_toml(schedule, year=year))
+    renderer = TemplateRenderer(TEMPLATES)
+    context = SyllabusDataFormatter(config, schedule).format()
+
+    # After the first run, every output is unchanged, as in a rebuild
+    config_dir, schedule_dir = write_department(
+        workdir, courses=courses, seed=seed, **size
+    )
+    batch = BatchCompiler(
+        config_dir, schedule_dir, TEMPLATES, Path(workdir) / "md"
+    )
+
+    def compile_batch():
+        with contextlib.redirect_stdout(io.StringIO()):
+            failures = batch.compile()
+        if failures:
+            raise RuntimeError(f"Batch failed: {', '.join(failures)}")
+
+    return {
+        "make_schedule": lambda: scheduler.make_schedule(
+            **config["schedule"]
+        ),
+        "ScheduleFormatter.format": formatter.format,
+        "wrap_paragraphs": lambda: wrap_paragraphs(description),
+        "flatten_config": lambda: flatten_config(config),
+        "TemplateRenderer.render": lambda: renderer.render(context),
+        "SyllabusCompiler.compile": lambda: SyllabusCompiler(
+            config, schedule, TEMPLATES
+        ).compile(),
+        "batch": compile_batch,
+    }
+
+
+def format_time(us):
+    """Format a duration.
+
+    Parameters
+    ----------
+    us : float
+        Duration in microseconds
+
+    Returns
+    -------
+    str
+        The duration, in the largest unit that keeps it above 1
+    """
+    if us >= 1e6:
+        return f"{us / 1e6:.2f} s"
+    if us >= 1e3:
+        return f"{us / 1e3:.2f} ms"
+
+    return f"{us:.2f} us"
+
+
+def compare(results, baseline, threshold):
+    """Compare results against a baseline.
+
+    Parameters
+    ----------
+    results : dict
+        Results of this run
+    baseline : dict
+        Saved results
+    threshold : float
+        Fractional slowdown of the fastest loop that counts as a regression
+
+    Returns
+    -------
+    list[str]
+        Regressed benchmarks, with their change
+    """
+    if baseline["params"] != results["params"]:
+        raise SystemExit(
+            "Baseline was run with different sizes: "
+            f"{baseline['params']} (now {results['params']})"
+        )
+    if baseline["python"] != results["python"]:
+        print(
+            f"Warning: baseline was run on Python {baseline['python']}",
+            file=sys.stderr,
+        )
+
+    regressions = []
+    print(f"{'':26}{'min':>12}{'baseline':>12}{'change':>10}")
+    for name, result in results["benchmarks"].items():
+        if name not in baseline["benchmarks"]:
+            continue
+
+        before = baseline["benchmarks"][name]["min_us"]
+        change = result["min_us"] / before - 1
+        flag = ""
+        if change > threshold:
+            flag = "  regressed"
+            regressions.append(f"{name} ({change:+.1%})")
+        elif change < -threshold:
+            flag = "  improved"
+
+        print(
+            f"{name:26}{format_time(result['min_us']):>12}"
+            f"{format_time(before):>12}{change:>+10.1%}{flag}"
+        )
+
+    return regressions
+
+
+def main():
+    """Run the script."""
+    parser = argparse.ArgumentParser(
+        description="Time the hot paths of a build on synthetic syllabi",
+    )
+    add_size_arguments(parser)
+    parser.add_argument(
+        "-n",
+        "--courses",
+        type=int,
+        default=24,
+        metavar="N",
+        help="Number of syllabi in the department batch (default: 24)",
+    )
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        choices=NAMES,
+        default=NAMES,
+        metavar="NAME",
+        help=f"Benchmarks to run (default: all of {', '.join(NAMES)})",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=7,
+        metavar="N",
+        help="Timed loops per benchmark (default: 7)",
+    )
+    parser.add_argument(
+        "--save",
+        type=Path,
+        default=None,
+        metavar="BASELINE",
+        help="Save the results as a baseline (.json)",
+    )
+    parser.add_argument(
+        "--compare",
+        type=Path,
+        default=None,
+        metavar="BASELINE",
+        help="Compare against a baseline, failing on regressions",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        metavar="FRACTION",
+        help="Slowdown that counts as a regression (default: 0.2)",
+    )
+    args = parser.parse_args()
+
+    size = size_from_args(args)
+    results = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "params": {**size, "courses": args.courses},
+        "benchmarks": {},
+    }
+
+    with tempfile.TemporaryDirectory() as workdir:
+        funcs = benchmarks(size, args.courses, workdir)
+        for name in args.only:
+            # A department batch takes long enough that fewer loops will do
+            repeat = min(args.repeat, 3) if name == "batch" else args.repeat
+            result = measure(funcs[name], repeat=repeat)
+            results["benchmarks"][name] = result
+            print(
+                f"{name:26}{format_time(result['median_us']):>12} median"
+                f"{format_time(result['min_us']):>12} min",
+                file=sys.stderr,
+            )
+
+    if args.save is not None:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        args.save.write_text(f"{json.dumps(results, indent=2)}\n")
+        print(f"Saved baseline: {args.save}")
+
+    if args.compare is not None:
+        baseline = json.loads(args.compare.read_text())
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            for regression in regressions:
+                print(f"Regressed: {regression}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
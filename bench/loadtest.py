@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Load-test the render server and report its latency.
+
+Clients send synthetic syllabi to POST /render over keep-alive connections,
+each waiting for its answer before sending the next. A set of distinct
+syllabi is cycled through, so after the first pass every request is a
+cache hit; the hit and miss latencies are reported apart. By default, the
+server runs in this process on a free port; --url targets one that is
+already running (e.g. `make serve`).
+"""
+
+import argparse
+import http.client
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+# Importing synthetic puts src/ on the path
+from synthetic import (
+    ROOT,
+    add_size_arguments,
+    make_syllabus,
+    size_from_args,
+)
+
+TEMPLATES = sorted((ROOT / "docs").glob("*.md"))
+
+
+def percentiles(latencies):
+    """Summarize latencies.
+
+    Parameters
+    ----------
+    latencies : list[float]
+        Latencies in seconds
+
+    Returns
+    -------
+    dict
+        Count, and the p50, p90, p99, and maximum in milliseconds
+    """
+    if not latencies:
+        return {"count": 0}
+    if len(latencies) == 1:
+        ms = latencies[0] * 1e3
+        return {"count": 1, "p50": ms, "p90": ms, "p99": ms, "max": ms}
+
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "count": len(latencies),
+        "p50": cuts[49] * 1e3,
+        "p90": cuts[89] * 1e3,
+        "p99": cuts[98] * 1e3,
+        "max": max(latencies) * 1e3,
+    }
+
+
+def make_payloads(distinct, to, size, seed=0):
+    """Build request bodies for distinct synthetic syllabi.
+
+    Parameters
+    ----------
+    distinct : int
+        Number of syllabi
+    to : str
+        Output format
+    size : dict
+        Size parameters of each syllabus
+    seed : int or str
+        Random seed
+
+    Returns
+    -------
+    list[bytes]
+        JSON request bodies
+    """
+    payloads = []
+    for i in range(distinct):
+        config, schedule = make_syllabus(f"{seed}-{i}", **size)
+        payload = {"config": config, "schedule": schedule, "to": to}
+        payloads.append(json.dumps(payload).encode())
+
+    return payloads
+
+
+def client(url, bodies, results, lock):
+    """Send requests one after another over one connection.
+
+    Parameters
+    ----------
+    url : str
+        Base URL of the server
+    bodies : list[bytes]
+        Request bodies, in order
+    results : list
+        Receives a (seconds, status, cache) tuple per request
+    lock : threading.Lock
+        Guards the results
+    """
+    parts = urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port)
+    headers = {"Content-Type": "application/json"}
+    mine = []
+    try:
+        for body in bodies:
+            start = time.perf_counter()
+            try:
+                connection.request("POST", "/render", body, headers)
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+                cache = response.headers.get("X-Cache", "")
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                status, cache = 0, ""
+            mine.append((time.perf_counter() - start, status, cache))
+    finally:
+        connection.close()
+        with lock:
+            results.extend(mine)
+
+
+def run(url, payloads, requests, concurrency, seed=0):
+    """Send requests from concurrent clients.
+
+    Parameters
+    ----------
+    url : str
+        Base URL of the server
+    payloads : list[bytes]
+        Distinct request bodies
+    requests : int
+        Total number of requests
+    concurrency : int
+        Number of clients
+    seed : int or str
+        Random seed for the order of the requests
+
+    Returns
+    -------
+    tuple[list, float]
+        A (seconds, status, cache) tuple per request, and the wall time
+    """
+    # Each payload is sent once before any is repeated, so the first pass
+    # is all misses
+    order = [payloads[i % len(payloads)] for i in range(requests)]
+    rng = random.Random(seed)
+    first, rest = order[: len(payloads)], order[len(payloads) :]
+    rng.shuffle(rest)
+    order = first + rest
+
+    shares = [order[i::concurrency] for i in range(concurrency)]
+    results = []
+    lock = threading.Lock()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for share in shares:
+            executor.submit(client, url, share, results, lock)
+
+    return results, time.perf_counter() - start
+
+
+def report(results, seconds):
+    """Print the latency report.
+
+    Parameters
+    ----------
+    results : list
+        A (seconds, status, cache) tuple per request
+    seconds : float
+        Wall time of the run
+
+    Returns
+    -------
+    dict
+        Latency summaries: all, hit, and miss
+    """
+    ok = [result for result in results if result[1] == 200]
+    summaries = {
+        "all": percentiles([latency for latency, _, _ in ok]),
+        "hit": percentiles([lat for lat, _, c in ok if c == "HIT"]),
+        "miss": percentiles([lat for lat, _, c in ok if c == "MISS"]),
+    }
+
+    print(
+        f"{len(results)} requests in {seconds:.2f} s "
+        f"({len(results) / seconds:.0f} req/s), "
+        f"{len(results) - len(ok)} failed"
+    )
+    print(f"{'':8}{'count':>8}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}")
+    for name, summary in summaries.items():
+        if not summary["count"]:
+            continue
+
+        cells = "".join(
+            f"{summary[key]:>7.2f} ms" for key in ("p50", "p90", "p99", "max")
+        )
+        print(f"{name:8}{summary['count']:>8}{cells}")
+
+    return summaries
+
+
+def main():
+    """Run the script."""
+    parser = argparse.ArgumentParser(
+        description="Load-test the render server and report its latency",
+    )
+    parser.add_argument(
+        "--url",
+        default=None,
+        metavar="URL",
+        help="Server to test (default: start one in this process)",
+    )
+    parser.add_argument(
+        "-n",
+        "--requests",
+        type=int,
+        default=2000,
+        metavar="N",
+        help="Total number of requests (default: 2000)",
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=8,
+        metavar="N",
+        help="Number of concurrent clients (default: 8)",
+    )
+    parser.add_argument(
+        "--distinct",
+        type=int,
+        default=50,
+        metavar="N",
+        help="Number of distinct syllabi (default: 50)",
+    )
+    parser.add_argument(
+        "-t",
+        "--to",
+        choices=["markdown", "json", "html", "docx"],
+        default="markdown",
+        help="Output format (default: markdown)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        metavar="JOBS",
+        help="Syllabi the in-process server builds at once",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=64,
+        metavar="MB",
+        help="Cache size of the in-process server (default: 64)",
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=None,
+        metavar="MS",
+        help="Fail if the p99 latency is over this many milliseconds",
+    )
+    add_size_arguments(parser)
+    args = parser.parse_args()
+
+    print("Generating syllabi...", file=sys.stderr)
+    payloads = make_payloads(args.distinct, args.to, size_from_args(args))
+
+    server = None
+    url = args.url
+    if url is None:
+        from serve import RenderServer, SyllabusService
+
+        service = SyllabusService(
+            TEMPLATES,
+            cache_bytes=args.cache_size * 1024 * 1024,
+            jobs=args.jobs,
+        )
+        server = RenderServer(("127.0.0.1", 0), service, quiet=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = server.url
+
+    print(f"Testing {url}", file=sys.stderr)
+    try:
+        results, seconds = run(
+            url, payloads, args.requests, args.concurrency
+        )
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    summaries = report(results, seconds)
+    failed = any(status != 200 for _, status, _ in results)
+    if failed:
+        print("Some requests failed", file=sys.stderr)
+    if args.budget is not None and summaries["all"]["count"]:
+        if summaries["all"]["p99"] > args.budget:
+            print(
+                f"p99 of {summaries['all']['p99']:.2f} ms is over the "
+                f"budget of {args.budget:.2f} ms",
+                file=sys.stderr,
+            )
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
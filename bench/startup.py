@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Check the CLI's cold start time against a budget.
+
+Each command is run in a fresh interpreter several times. The script reports
+the median wall time, the total import time from ``-X importtime``, and the
+slowest top-level imports. It fails if a command goes over its budget or
+imports a module that only other commands need.
+"""
+
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Modules that belong to other commands: the HTTP client (reference), asyncio
+# (render), and process pools (compile-all)
+HEAVY = (
+    "asyncio",
+    "concurrent.futures.process",
+    "html.parser",
+    "http.client",
+    "multiprocessing",
+    "urllib.request",
+)
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def commands():
+    """Get the commands to time, using the first config in the repo.
+
+    Returns
+    -------
+    dict[str, list[str]]
+        Arguments for the CLI, by label
+    """
+    config = sorted((ROOT / "config").glob("*.toml"))[0]
+    schedule = ROOT / "schedules" / config.name
+    templates = sorted(str(path) for path in (ROOT / "docs").glob("*.md"))
+
+    return {
+        "help": ["--help"],
+        "schedule": ["schedule", "-c", str(config), "--no-cache"],
+        "compile": [
+            "compile",
+            "-c",
+            str(config),
+            "-s",
+            str(schedule),
+            "-f",
+            *templates,
+            "--no-cache",
+        ],
+    }
+
+
+def wall_time(target, args, runs):
+    """Time a command in fresh interpreters.
+
+    Parameters
+    ----------
+    target : str
+        The CLI: the src directory or a zipapp
+    args : list[str]
+        Arguments for the CLI
+    runs : int
+        Number of runs
+
+    Returns
+    -------
+    float
+        Median wall time in milliseconds
+    """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, target, *args],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        )
+        times.append((time.perf_counter() - start) * 1000)
+
+    return statistics.median(times)
+
+
+def import_times(target, args):
+    """Run a command with ``-X importtime``.
+
+    Parameters
+    ----------
+    target : str
+        The CLI: the src directory or a zipapp
+    args : list[str]
+        Arguments for the CLI
+
+    Returns
+    -------
+    tuple[float, dict[str, float], set[str]]
+        Total import time in milliseconds, the cumulative time of each
+        top-level import, and the name of every imported module
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", target, *args],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+
+    total = 0
+    top_level = {}
+    loaded = set()
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match is None:
+            continue
+
+        own, cumulative, indent, name = match.groups()
+        total += int(own)
+        loaded.add(name)
+
+        # Nested imports are indented past the single leading space
+        if len(indent) == 1:
+            top_level[name] = int(cumulative) / 1000
+
+    return total / 1000, top_level, loaded
+
+
+def main():
+    """Run the script."""
+    parser = argparse.ArgumentParser(
+        description="Check the CLI's cold start time against a budget",
+    )
+    parser.add_argument(
+        "--target",
+        default=str(ROOT / "src"),
+        metavar="TARGET",
+        help="The CLI to time: the src directory or a zipapp (default: src)",
+    )
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=15,
+        metavar="N",
+        help="Runs per command (default: 15)",
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=120,
+        metavar="MS",
+        help="Maximum median wall time per command (default: 120)",
+    )
+    parser.add_argument(
+        "--import-budget",
+        type=float,
+        default=80,
+        metavar="MS",
+        help="Maximum total import time per command (default: 80)",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=5,
+        metavar="N",
+        help="Number of slowest imports to show (default: 5)",
+    )
+    args = parser.parse_args()
+
+    failures = []
+    for label, cli_args in commands().items():
+        wall = wall_time(args.target, cli_args, args.runs)
+        imports, top_level, loaded = import_times(args.target, cli_args)
+
+        print(f"{label}: {wall:.1f} ms wall, {imports:.1f} ms importing")
+        slowest = sorted(top_level.items(), key=lambda item: -item[1])
+        for name, ms in slowest[: args.top]:
+            print(f"  {ms:7.1f} ms  {name}")
+
+        if wall > args.budget:
+            failures.append(f"{label} took {wall:.1f} ms")
+        if imports > args.import_budget:
+            failures.append(f"{label} spent {imports:.1f} ms importing")
+
+        heavy = [name for name in HEAVY if name in loaded]
+        if heavy:
+            failures.append(f"{label} imported {', '.join(heavy)}")
+
+    if failures:
+        for failure in failures:
+            print(f"Over budget: {failure}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,514 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Generate synthetic syllabus configs and schedules.
+
+A syllabus's size is set by its number of weeks, meetings per week, agenda
+items per meeting, objectives, and assignments, and by the length of its
+descriptions. The same seed always generates the same department.
+"""
+
+import argparse
+import json
+import random
+import sys
+import textwrap
+from datetime import date, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from schedule import Scheduler  # noqa: E402
+
+SIZES = {
+    "small": {
+        "weeks": 10,
+        "days": 2,
+        "agenda": 1,
+        "objectives": 3,
+        "assignments": 3,
+        "words": 150,
+    },
+    "medium": {
+        "weeks": 16,
+        "days": 3,
+        "agenda": 3,
+        "objectives": 6,
+        "assignments": 6,
+        "words": 600,
+    },
+    "large": {
+        "weeks": 52,
+        "days": 5,
+        "agenda": 8,
+        "objectives": 30,
+        "assignments": 30,
+        "words": 5000,
+    },
+}
+
+# Meeting patterns for each number of days per week
+WEEKDAYS = {1: "W", 2: "TR", 3: "MWF", 4: "MTWR", 5: "MTWRF"}
+
+VOCABULARY = """
+aesthetics allegory argument author canon character criticism culture desire
+discourse empire fiction form genre history ideology image imitation language
+lyric meaning memory metaphor mimesis modernity narrative nature novel poetics
+politics power reader reading realism representation rhetoric romance self
+sign society style subject sublime symbol taste text theory tradition tragedy
+truth value voice work writing
+""".split()
+
+
+def phrase(rng, n):
+    """Generate a run of words.
+
+    Parameters
+    ----------
+    rng : random.Random
+        Random number generator
+    n : int
+        Number of words
+
+    Returns
+    -------
+    str
+        The words, separated by spaces
+    """
+    return " ".join(rng.choices(VOCABULARY, k=n))
+
+
+def title(rng, n):
+    """Generate a title-cased run of words.
+
+    Parameters
+    ----------
+    rng : random.Random
+        Random number generator
+    n : int
+        Number of words
+
+    Returns
+    -------
+    str
+        The title
+    """
+    return phrase(rng, n).title()
+
+
+def sentence(rng, n):
+    """Generate a sentence.
+
+    Parameters
+    ----------
+    rng : random.Random
+        Random number generator
+    n : int
+        Number of words
+
+    Returns
+    -------
+    str
+        The sentence
+    """
+    return phrase(rng, n).capitalize()
+
+
+def paragraphs(rng, n, per_paragraph=90, width=72):
+    """Generate hard-wrapped paragraphs, as descriptions are written in TOML.
+
+    Parameters
+    ----------
+    rng : random.Random
+        Random number generator
+    n : int
+        Total number of words
+    per_paragraph : int
+        Words per paragraph
+    width : int
+        Width of the hard wrap
+
+    Returns
+    -------
+    str
+        Paragraphs separated by blank lines
+    """
+    sizes = [per_paragraph] * (n // per_paragraph)
+    if n % per_paragraph:
+        sizes.append(n % per_paragraph)
+
+    return "\n\n".join(
+        textwrap.fill(f"{phrase(rng, size).capitalize()}.", width)
+        for size in sizes
+    )
+
+
+def make_config(
+    rng,
+    weeks=16,
+    days=3,
+    objectives=6,
+    assignments=6,
+    words=600,
+    **kwargs,
+):
+    """Generate a syllabus config.
+
+    Every fifth week, the first meeting is excluded, so that schedules have
+    no-class days.
+
+    Parameters
+    ----------
+    rng : random.Random
+        Random number generator
+    weeks : int
+        Number of weeks
+    days : int
+        Meetings per week (1-5)
+    objectives : int
+        Number of objectives
+    assignments : int
+        Number of assignments
+    words : int
+        Length of the course description; the catalog and assignment
+        descriptions are a quarter and a half as long
+    kwargs : dict
+        Pass-through keywords
+
+    Returns
+    -------
+    dict
+        Config data, shaped like a TOML config
+    """
+    weekdays = WEEKDAYS[days]
+    start = date(2026, 1, 5)
+    end = start + timedelta(weeks=weeks) - timedelta(days=3)
+    first = start + timedelta(days="MTWRF".index(weekdays[0]))
+
+    return {
+        "instructor": {
+            "name": title(rng, 2),
+            "email": "instructor@example.edu",
+            "office": f"LAAH {rng.randint(100, 599)}",
+            "hours": "MW 3:00--4:00pm",
+        },
+        "course": {
+            "number": f"ENGL {rng.randint(100, 499)}",
+            "title": title(rng, 4),
+            "section": rng.randint(500, 599),
+            "credits": 3,
+            "catalog": paragraphs(rng, max(words // 4, 20)),
+            "description": paragraphs(rng, words),
+            "assignments": paragraphs(rng, words // 2),
+            "prerequisites": "3 credits of literature at 200-level or above",
+            "designation": "None",
+        },
+        "schedule": {
+            "year": "2026",
+            "start": start.strftime("%m-%d"),
+            "end": end.isoformat(),
+            "weekdays": weekdays,
+            "exclude": [
+                (first + timedelta(weeks=week)).isoformat()
+                for week in range(4, weeks, 5)
+            ],
+            "time": "8:00--8:50am",
+            "location": "LAAH 372",
+        },
+        "objective": [
+            {"description": sentence(rng, 18)} for _ in range(objectives)
+        ],
+        "book": [
+            {
+                "title": f"_{title(rng, 5)}_",
+                "author": title(rng, 2),
+                "isbn": f"978-{rng.randrange(10**10):010d}",
+            }
+            for _ in range(3)
+        ],
+        "assignment": [
+            {
+                "name": f"{title(rng, 2)} {i + 1}",
+                "points": 100 // max(assignments, 1),
+                "due": f"By {rng.randint(1, 12)}/{rng.randint(1, 28)}",
+            }
+            for i in range(assignments)
+        ],
+    }
+
+
+def make_schedule(rng, config, agenda=3):
+    """Generate the filled-out schedule of a config.
+
+    Parameters
+    ----------
+    rng : random.Random
+        Random number generator
+    config : dict
+        Config data
+    agenda : int
+        Agenda items per meeting
+
+    Returns
+    -------
+    dict
+        Schedule data, shaped like a TOML schedule
+    """
+    schedule = {}
+    for week in Scheduler().iter_weeks(**config["schedule"]):
+        schedule[f"week-{week.num}"] = {
+            "num": week.num,
+            "title": title(rng, 2),
+            "days": [
+                {
+                    "date": day.date,
+                    "weekday": day.weekday,
+                    "no_class": day.no_class,
+                    "agenda": (
+                        []
+                        if day.no_class
+                        else [
+                            f"{title(rng, 2)}. {title(rng, 4)}: "
+                            f"{rng.randint(1, 900)}-{rng.randint(901, 999)}"
+                            for _ in range(agenda)
+                        ]
+                    ),
+                }
+                for day in week.days
+            ],
+        }
+
+    return schedule
+
+
+def make_syllabus(seed=0, **size):
+    """Generate a config and its schedule.
+
+    Parameters
+    ----------
+    seed : int or str
+        Random seed
+    size : dict
+        Size parameters (see SIZES)
+
+    Returns
+    -------
+    tuple[dict, dict]
+        Config and schedule data
+    """
+    rng = random.Random(seed)
+    config = make_config(rng, **size)
+
+    return config, make_schedule(rng, config, agenda=size.get("agenda", 3))
+
+
+def _value(value):
+    """Format a TOML value.
+
+    Parameters
+    ----------
+    value : bool, int, str, or list
+        The value
+
+    Returns
+    -------
+    str
+        TOML for the value
+    """
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, list):
+        return f"[{', '.join(_value(item) for item in value)}]"
+
+    # JSON's string escapes are all valid in TOML basic strings
+    return json.dumps(value)
+
+
+def _is_table_array(value):
+    """Check whether a value is an array of tables.
+
+    Parameters
+    ----------
+    value : any
+        The value
+
+    Returns
+    -------
+    bool
+        If True, the value is a non-empty list of dicts
+    """
+    return (
+        isinstance(value, list)
+        and bool(value)
+        and all(isinstance(item, dict) for item in value)
+    )
+
+
+def dump_toml(data, prefix=""):
+    """Write data as TOML.
+
+    Only the types that configs and schedules use are supported.
+
+    Parameters
+    ----------
+    data : dict
+        The data
+    prefix : str
+        Name of the enclosing table
+
+    Returns
+    -------
+    str
+        The TOML
+    """
+    lines = []
+    tables = []
+    for key, value in data.items():
+        if isinstance(value, dict) or _is_table_array(value):
+            tables.append((key, value))
+        else:
+            lines.append(f"{key} = {_value(value)}")
+
+    for key, value in tables:
+        name = f"{prefix}.{key}" if prefix else key
+        items = value if isinstance(value, list) else [value]
+        header = f"[[{name}]]" if isinstance(value, list) else f"[{name}]"
+        for item in items:
+            lines.extend(["", header, dump_toml(item, name)])
+
+    return "\n".join(lines).strip("\n")
+
+
+def write_department(directory, courses=24, seed=0, **size):
+    """Write configs and schedules for a department.
+
+    Parameters
+    ----------
+    directory : Path
+        Directory for the config and schedules subdirectories
+    courses : int
+        Number of syllabi
+    seed : int or str
+        Random seed
+    size : dict
+        Size parameters (see SIZES)
+
+    Returns
+    -------
+    tuple[Path, Path]
+        Config and schedule directories
+    """
+    config_dir = Path(directory) / "config"
+    schedule_dir = Path(directory) / "schedules"
+    config_dir.mkdir(parents=True, exist_ok=True)
+    schedule_dir.mkdir(parents=True, exist_ok=True)
+
+    for i in range(courses):
+        config, schedule = make_syllabus(f"{seed}-{i}", **size)
+        name = f"2026-spring_engl-{i:03d}_synthetic.toml"
+        (config_dir / name).write_text(f"{dump_toml(config)}\n")
+        (schedule_dir / name).write_text(f"{dump_toml(schedule)}\n")
+
+    return config_dir, schedule_dir
+
+
+def add_size_arguments(parser):
+    """Add the size options to a parser.
+
+    Parameters
+    ----------
+    parser : argparse.ArgumentParser
+        The parser
+    """
+    parser.add_argument(
+        "--size",
+        choices=sorted(SIZES),
+        default="medium",
+        help="Preset size of each syllabus (default: medium)",
+    )
+    for name, help in [
+        ("weeks", "Number of weeks"),
+        ("days", "Meetings per week (1-5)"),
+        ("agenda", "Agenda items per meeting"),
+        ("objectives", "Number of objectives"),
+        ("assignments", "Number of assignments"),
+        ("words", "Words in the course description"),
+    ]:
+        parser.add_argument(
+            f"--{name}",
+            type=int,
+            default=None,
+            metavar="N",
+            help=f"{help} (overrides the preset)",
+        )
+
+
+def size_from_args(args):
+    """Get the size parameters from parsed arguments.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Parsed arguments
+
+    Returns
+    -------
+    dict
+        Size parameters
+    """
+    size = dict(SIZES[args.size])
+    for name in size:
+        if getattr(args, name) is not None:
+            size[name] = getattr(args, name)
+
+    if size["days"] not in WEEKDAYS:
+        raise SystemExit("--days must be between 1 and 5")
+
+    return size
+
+
+def main():
+    """Run the script."""
+    parser = argparse.ArgumentParser(
+        description="Write a department of synthetic configs and schedules",
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        type=Path,
+        required=True,
+        metavar="OUTPUT_DIR",
+        help="Directory for the config and schedules subdirectories",
+    )
+    parser.add_argument(
+        "-n",
+        "--courses",
+        type=int,
+        default=24,
+        metavar="N",
+        help="Number of syllabi (default: 24)",
+    )
+    parser.add_argument(
+        "--seed",
+        default="0",
+        metavar="SEED",
+        help="Random seed (default: 0)",
+    )
+    add_size_arguments(parser)
+    args = parser.parse_args()
+
+    config_dir, schedule_dir = write_department(
+        args.output_dir,
+        courses=args.courses,
+        seed=args.seed,
+        **size_from_args(args),
+    )
+    print(f"Wrote {args.courses} configs to {config_dir}")
+    print(f"Wrote {args.courses} schedules to {schedule_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,33 +2,17 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import os
 import sys
-import tomllib
+from datetime import date
 from pathlib import Path
 
-from compile import compile_md
-from reference import get_reference_docx
-from schedule import build_schedule
-
-
-def load_toml(path):
-    """Load TOML file.
-
-    Parameters
-    ----------
-    path : Path or str
-        Path to the file
-
-    Returns
-    -------
-    dict
-        TOML data
-    """
-    path = Path(path)
-    with path.open("rb") as f:
-        data = tomllib.load(f)
-
-    return data
+CACHE_HOME = (
+    Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+    / "syllabus-factory"
+)
+TOML_CACHE_DIR = CACHE_HOME / "toml"
+HTTP_CACHE_DIR = CACHE_HOME / "http"
 
 
 def main(argv=None):
@@ -39,8 +23,34 @@ def main(argv=None):
 
     subparsers = parser.add_subparsers(dest="command", help="Command to run")
 
+    # Options for the commands that read configs and schedules
+    toml_parser = argparse.ArgumentParser(add_help=False)
+    toml_parser.add_argument(
+        "--toml-cache",
+        type=Path,
+        default=TOML_CACHE_DIR,
+        metavar="DIR",
+        help=f"Directory for parsed TOML (default: {TOML_CACHE_DIR})",
+    )
+    toml_parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Parse every TOML file from scratch",
+    )
+
+    # Options for the commands that build syllabi
+    metrics_parser = argparse.ArgumentParser(add_help=False)
+    metrics_parser.add_argument(
+        "--metrics-dir",
+        type=Path,
+        default=None,
+        metavar="DIR",
+        help="Log the run's metrics (builds.jsonl, <command>.prom) here",
+    )
+
     schedule_parser = subparsers.add_parser(
         "schedule",
+        parents=[toml_parser],
         help="Build the schedule",
         description="Create a schedule from a syllabus config",
     )
@@ -53,8 +63,37 @@ def main(argv=None):
         help="Syllabus config (.toml)",
     )
 
+    schedule_all_parser = subparsers.add_parser(
+        "schedule-all",
+        parents=[toml_parser, metrics_parser],
+        help="Build the schedule for every config",
+        description="Create schedules for every config in a directory",
+    )
+    schedule_all_parser.add_argument(
+        "-c",
+        "--config-dir",
+        type=Path,
+        required=True,
+        metavar="CONFIG_DIR",
+        help="Directory of syllabus configs (.toml)",
+    )
+    schedule_all_parser.add_argument(
+        "-o",
+        "--output-dir",
+        type=Path,
+        required=True,
+        metavar="OUTPUT_DIR",
+        help="Directory for the course schedules (.toml)",
+    )
+    schedule_all_parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Overwrite existing schedules",
+    )
+
     compile_parser = subparsers.add_parser(
         "compile",
+        parents=[toml_parser, metrics_parser],
         help="Compile the Markdown",
         description="Compile Markdown from syllabus and schedule configs",
     )
@@ -83,38 +122,605 @@ def main(argv=None):
         metavar="FILES",
         help="Templates (.md)",
     )
+    compile_parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        default=None,
+        metavar="OUTPUT",
+        help="Write to this file instead of stdout, unless unchanged",
+    )
+    compile_parser.add_argument(
+        "-t",
+        "--to",
+        choices=["markdown", "json"],
+        default="markdown",
+        help="Output Markdown or a pandoc JSON AST (default: markdown)",
+    )
+    compile_parser.add_argument(
+        "--docx-layout",
+        action="store_true",
+        help="Apply the docx layout rules to the JSON AST",
+    )
+    compile_parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=None,
+        metavar="CACHE_DIR",
+        help="Reuse stage outputs and sections cached in this directory",
+    )
+    compile_parser.add_argument(
+        "--explain",
+        action="store_true",
+        help="Report which stages and sections were reused",
+    )
+    compile_parser.add_argument(
+        "--trace",
+        type=Path,
+        default=None,
+        metavar="TRACE",
+        help="Write a Chrome trace of the build's stages (.json)",
+    )
+    compile_parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Profile the build with cProfile, next to the trace (.prof)",
+    )
+    compile_parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Record the memory each stage allocates in the trace",
+    )
+
+    compile_all_parser = subparsers.add_parser(
+        "compile-all",
+        parents=[toml_parser, metrics_parser],
+        help="Compile the Markdown for every config",
+        description="Compile Markdown for every config in a directory",
+    )
+    compile_all_parser.add_argument(
+        "-c",
+        "--config-dir",
+        type=Path,
+        required=True,
+        metavar="CONFIG_DIR",
+        help="Directory of syllabus configs (.toml)",
+    )
+    compile_all_parser.add_argument(
+        "-s",
+        "--schedule-dir",
+        type=Path,
+        required=True,
+        metavar="SCHEDULE_DIR",
+        help="Directory of course schedules (.toml)",
+    )
+    compile_all_parser.add_argument(
+        "-f",
+        "--files",
+        type=Path,
+        nargs="+",
+        required=True,
+        metavar="FILES",
+        help="Templates (.md)",
+    )
+    compile_all_parser.add_argument(
+        "-o",
+        "--output-dir",
+        type=Path,
+        required=True,
+        metavar="OUTPUT_DIR",
+        help="Directory for the compiled Markdown",
+    )
+    compile_all_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        metavar="JOBS",
+        help="Number of worker processes (default: CPU count)",
+    )
+    compile_all_parser.add_argument(
+        "--max-tasks-per-child",
+        type=int,
+        default=32,
+        metavar="N",
+        help="Syllabi a worker compiles before it is replaced",
+    )
+    compile_all_parser.add_argument(
+        "-t",
+        "--to",
+        choices=["markdown", "json"],
+        default="markdown",
+        help="Output Markdown or pandoc JSON ASTs (default: markdown)",
+    )
+
+    watch_parser = subparsers.add_parser(
+        "watch",
+        parents=[toml_parser],
+        help="Recompile the Markdown as inputs change",
+        description="Watch configs, schedules, and templates and recompile",
+    )
+    watch_parser.add_argument(
+        "-c",
+        "--config-dir",
+        type=Path,
+        required=True,
+        metavar="CONFIG_DIR",
+        help="Directory of syllabus configs (.toml)",
+    )
+    watch_parser.add_argument(
+        "-s",
+        "--schedule-dir",
+        type=Path,
+        required=True,
+        metavar="SCHEDULE_DIR",
+        help="Directory of course schedules (.toml)",
+    )
+    watch_parser.add_argument(
+        "-d",
+        "--template-dir",
+        type=Path,
+        required=True,
+        metavar="TEMPLATE_DIR",
+        help="Directory of templates (.md)",
+    )
+    watch_parser.add_argument(
+        "-o",
+        "--output-dir",
+        type=Path,
+        required=True,
+        metavar="OUTPUT_DIR",
+        help="Directory for the compiled Markdown",
+    )
+    watch_parser.add_argument(
+        "-i",
+        "--interval",
+        type=float,
+        default=0.5,
+        metavar="SECONDS",
+        help="Seconds between polls (default: 0.5)",
+    )
+
+    render_parser = subparsers.add_parser(
+        "render",
+        parents=[metrics_parser],
+        help="Render compiled Markdown with pandoc",
+        description="Render every compiled syllabus to docx and html",
+    )
+    render_parser.add_argument(
+        "-i",
+        "--input-dir",
+        type=Path,
+        required=True,
+        metavar="INPUT_DIR",
+        help="Directory of compiled Markdown",
+    )
+    render_parser.add_argument(
+        "-o",
+        "--output-dir",
+        type=Path,
+        required=True,
+        metavar="OUTPUT_DIR",
+        help="Directory with one subdirectory per format",
+    )
+    render_parser.add_argument(
+        "-t",
+        "--to",
+        nargs="+",
+        choices=["docx", "html"],
+        default=["docx", "html"],
+        metavar="FORMAT",
+        help="Output formats (default: docx html)",
+    )
+    render_parser.add_argument(
+        "--reference-doc",
+        type=Path,
+        default=None,
+        metavar="REFERENCE_DOC",
+        help="Reference document (.docx)",
+    )
+    render_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        metavar="JOBS",
+        help="Maximum pandoc jobs at once (default: CPU count)",
+    )
+    render_parser.add_argument(
+        "--server",
+        default=None,
+        metavar="URL",
+        help="URL of a running pandoc server (e.g. http://localhost:3030)",
+    )
+    render_parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Render outputs that are newer than their Markdown",
+    )
+    render_parser.add_argument(
+        "--docx-writer",
+        choices=["pandoc", "native"],
+        default="pandoc",
+        help=(
+            "Write docx with pandoc, or by patching the reference document "
+            "in Python (default: pandoc)"
+        ),
+    )
+
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="Serve rendered syllabi over HTTP",
+        description=(
+            "Compile syllabi on request: POST a config and schedule as JSON "
+            "to /render"
+        ),
+    )
+    serve_parser.add_argument(
+        "-f",
+        "--files",
+        type=Path,
+        nargs="+",
+        required=True,
+        metavar="FILES",
+        help="Templates (.md)",
+    )
+    serve_parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        metavar="HOST",
+        help="Host to listen on (default: 127.0.0.1)",
+    )
+    serve_parser.add_argument(
+        "-p",
+        "--port",
+        type=int,
+        default=8000,
+        metavar="PORT",
+        help="Port to listen on (default: 8000)",
+    )
+    serve_parser.add_argument(
+        "--reference-doc",
+        type=Path,
+        default=None,
+        metavar="REFERENCE_DOC",
+        help="Reference document (.docx)",
+    )
+    serve_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        metavar="JOBS",
+        help="Maximum syllabi built at once (default: CPU count)",
+    )
+    serve_parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=64,
+        metavar="MB",
+        help="Maximum size of the cached outputs (default: 64)",
+    )
+    serve_parser.add_argument(
+        "-q",
+        "--quiet",
+        action="store_true",
+        help="Don't log requests",
+    )
+
+    archive_parser = subparsers.add_parser(
+        "archive",
+        parents=[toml_parser],
+        help="Pack every schedule into an archive",
+        description="Pack course schedules into a binary archive for queries",
+    )
+    archive_parser.add_argument(
+        "-c",
+        "--config-dir",
+        type=Path,
+        required=True,
+        metavar="CONFIG_DIR",
+        help="Directory of syllabus configs (.toml)",
+    )
+    archive_parser.add_argument(
+        "-s",
+        "--schedule-dir",
+        type=Path,
+        required=True,
+        metavar="SCHEDULE_DIR",
+        help="Directory of course schedules (.toml)",
+    )
+    archive_parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        required=True,
+        metavar="ARCHIVE",
+        help="Archive to build or update",
+    )
+
+    query_parser = subparsers.add_parser(
+        "query",
+        help="Look up meetings in a schedule archive",
+        description="Find class meetings by date, course, or agenda text",
+    )
+    query_parser.add_argument(
+        "-a",
+        "--archive",
+        type=Path,
+        required=True,
+        metavar="ARCHIVE",
+        help="Schedule archive",
+    )
+    query = query_parser.add_mutually_exclusive_group(required=True)
+    query.add_argument(
+        "--on",
+        type=date.fromisoformat,
+        default=None,
+        metavar="DATE",
+        help="Meetings on a date (YYYY-MM-DD)",
+    )
+    query.add_argument(
+        "--course",
+        default=None,
+        metavar="COURSE",
+        help="Meetings of a course (its schedule's file name, without .toml)",
+    )
+    query.add_argument(
+        "--search",
+        default=None,
+        metavar="TEXT",
+        help="Meetings whose agenda or week title mentions some text",
+    )
 
     reference_parser = subparsers.add_parser(
         "reference",
         help="Download a reference document",
         description="Download a TAMU minimum syllabus requirements .docx file",
     )
-    reference_parser.add_argument(
+    reference_output = reference_parser.add_mutually_exclusive_group(
+        required=True
+    )
+    reference_output.add_argument(
         "-f",
         "--filename",
         type=Path,
-        required=True,
+        default=None,
         metavar="FILENAME",
         help="Name of the file (.docx)",
     )
+    reference_output.add_argument(
+        "--all",
+        type=Path,
+        default=None,
+        metavar="DIR",
+        help="Download every listed file (or every match) into a directory",
+    )
+    reference_parser.add_argument(
+        "--http-cache",
+        type=Path,
+        default=HTTP_CACHE_DIR,
+        metavar="DIR",
+        help=f"Directory for downloads (default: {HTTP_CACHE_DIR})",
+    )
+    reference_parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Use only what is already in the download cache",
+    )
+    reference_select = reference_parser.add_mutually_exclusive_group()
+    reference_select.add_argument(
+        "--match",
+        default=None,
+        metavar="PATTERN",
+        help="Download the first file whose name matches a glob (no prompt)",
+    )
+    reference_select.add_argument(
+        "--index",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Download the Nth file listed on the page (no prompt)",
+    )
+    reference_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=4,
+        metavar="JOBS",
+        help="Downloads at once with --all (default: 4)",
+    )
 
     args = parser.parse_args()
     if not args.command:
         parser.print_help()
         sys.exit(1)
 
+    if getattr(args, "explain", False) and args.cache_dir is None:
+        parser.error("--explain requires --cache-dir")
+
+    for flag in ("profile", "trace_memory"):
+        if getattr(args, flag, False) and args.trace is None:
+            parser.error(f"--{flag.replace('_', '-')} requires --trace")
+
+    if args.command == "reference":
+        if args.index is not None and args.index < 1:
+            parser.error("--index counts from 1")
+        if args.index is not None and args.all is not None:
+            parser.error("--index can't be used with --all")
+        if args.jobs < 1:
+            parser.error("--jobs must be at least 1")
+
+    toml_cache = None
+    if not getattr(args, "no_cache", True):
+        from toml_cache import TomlCache
+
+        toml_cache = TomlCache(args.toml_cache)
+
+    metrics = None
+    if getattr(args, "metrics_dir", None) is not None:
+        from metrics import BuildMetrics
+
+        metrics = BuildMetrics(args.command)
+
+    # Metrics are saved even when the run fails
+    try:
+        run(args, toml_cache=toml_cache, metrics=metrics)
+    finally:
+        if metrics is not None:
+            if toml_cache is not None:
+                metrics.cache("toml", toml_cache.hits, toml_cache.misses)
+            metrics.save(args.metrics_dir)
+
+
+def run(args, toml_cache=None, metrics=None):
+    """Run a command.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Parsed arguments
+    toml_cache : TomlCache, optional
+        Cache of parsed TOML
+    metrics : BuildMetrics, optional
+        Records what the command builds
+    """
+    # Each command imports its own modules when it runs, so that a quick
+    # command like schedule doesn't load the HTTP, asyncio, and
+    # multiprocessing stacks that only other commands need
     if args.command == "reference":
-        get_reference_docx(args.filename)
+        from http_cache import HttpCache
+        from reference import get_reference_docx
+
+        cache = HttpCache(args.http_cache, offline=args.offline)
+        get_reference_docx(
+            args.filename,
+            cache=cache,
+            match=args.match,
+            index=args.index,
+            directory=args.all,
+            jobs=args.jobs,
+        )
         return
 
-    syllabus_data = load_toml(args.config)
+    if args.command == "archive":
+        from archive import build_archive
+
+        build_archive(
+            args.config_dir,
+            args.schedule_dir,
+            args.output,
+            toml_cache=toml_cache,
+        )
+        return
+
+    if args.command == "query":
+        from archive import query_archive
+
+        query_archive(
+            args.archive, on=args.on, course=args.course, search=args.search
+        )
+        return
+
+    if args.command == "schedule-all":
+        from batch import schedule_all
+
+        schedule_all(
+            args.config_dir,
+            args.output_dir,
+            force=args.force,
+            toml_cache=toml_cache,
+            metrics=metrics,
+        )
+        return
+
+    if args.command == "compile-all":
+        from batch import compile_all
+
+        compile_all(
+            args.config_dir,
+            args.schedule_dir,
+            args.files,
+            args.output_dir,
+            workers=args.jobs,
+            max_tasks_per_child=args.max_tasks_per_child,
+            to=args.to,
+            toml_cache=toml_cache,
+            metrics=metrics,
+        )
+        return
+
+    if args.command == "render":
+        from render import render_all
+
+        render_all(
+            args.input_dir,
+            args.output_dir,
+            formats=args.to,
+            reference_doc=args.reference_doc,
+            concurrency=args.jobs,
+            server=args.server,
+            force=args.force,
+            metrics=metrics,
+            docx_writer=args.docx_writer,
+        )
+        return
+
+    if args.command == "serve":
+        from serve import serve
+
+        serve(
+            args.files,
+            host=args.host,
+            port=args.port,
+            reference_doc=args.reference_doc,
+            cache_bytes=args.cache_size * 1024 * 1024,
+            jobs=args.jobs,
+            quiet=args.quiet,
+        )
+        return
+
+    if args.command == "watch":
+        from watch import watch
+
+        watch(
+            args.config_dir,
+            args.schedule_dir,
+            args.template_dir,
+            args.output_dir,
+            interval=args.interval,
+            toml_cache=toml_cache,
+        )
+        return
+
+    from utils import load_toml
+
+    syllabus_data = load_toml(args.config, cache=toml_cache)
 
     if args.command == "schedule":
-        build_schedule(syllabus_data)
+        from schedule import build_schedule
+
+        build_schedule(syllabus_data, config=args.config)
 
     elif args.command == "compile":
-        schedule = load_toml(args.schedule)
-        compile_md(syllabus_data, schedule, args.files)
+        from compile import compile_md
+
+        schedule = load_toml(args.schedule, cache=toml_cache)
+        compile_md(
+            syllabus_data,
+            schedule,
+            args.files,
+            cache_dir=args.cache_dir,
+            explain=args.explain,
+            output_path=args.output,
+            to=args.to,
+            docx_layout=args.docx_layout,
+            trace_path=args.trace,
+            profile=args.profile,
+            trace_memory=args.trace_memory,
+            metrics=metrics,
+            name=args.config.stem,
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,171 @@
+from bisect import bisect_right
+from datetime import date
+from functools import lru_cache
+from pathlib import Path
+
+from utils import load_toml
+
+
+class DateIndex:
+    """Interval index over inclusive ranges of dates.
+
+    Overlapping and adjacent ranges are merged when the index is built, so a
+    lookup is a single binary search over the range starts.
+    """
+
+    def __init__(self, ranges=()):
+        """Initialize the object.
+
+        Parameters
+        ----------
+        ranges : iterable[tuple[date, date]]
+            Inclusive start and end dates
+        """
+        self.starts = []
+        self.ends = []
+
+        spans = sorted((s.toordinal(), e.toordinal()) for s, e in ranges)
+        for start, end in spans:
+            if self.ends and start <= self.ends[-1] + 1:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def __len__(self):
+        """Count the merged ranges.
+
+        Returns
+        -------
+        int
+            Number of merged ranges
+        """
+        return len(self.starts)
+
+    def __contains__(self, day):
+        """Check whether a date falls in any range.
+
+        Parameters
+        ----------
+        day : date or int
+            A date or its ordinal
+
+        Returns
+        -------
+        bool
+            If True, the date is in the index
+        """
+        if isinstance(day, date):
+            day = day.toordinal()
+
+        i = bisect_right(self.starts, day) - 1
+        return i >= 0 and day <= self.ends[i]
+
+
+class AcademicCalendar:
+    """Named date ranges from a term calendar file.
+
+    A calendar file has one array of tables per kind of range. Each range has
+    a name, a start date, and an optional end date (YYYY-MM-DD):
+
+        [[breaks]]
+        name = "Spring break"
+        start = "2026-03-09"
+        end = "2026-03-13"
+    """
+
+    kinds = ("holidays", "breaks", "reading_days")
+
+    def __init__(self, data):
+        """Initialize the object.
+
+        Parameters
+        ----------
+        data : dict
+            Calendar data
+
+        Raises
+        ------
+        ValueError
+            If the calendar has an unknown kind of range or an invalid range
+        """
+        unknown = [kind for kind in data if kind not in self.kinds]
+        if unknown:
+            raise ValueError(f"Unknown calendar entries: {', '.join(unknown)}")
+
+        self.ranges = []
+        for kind in self.kinds:
+            for entry in data.get(kind, []):
+                start = date.fromisoformat(entry["start"])
+                end = date.fromisoformat(entry.get("end", entry["start"]))
+                if end < start:
+                    raise ValueError(f"{entry['name']} ends before it starts")
+
+                self.ranges.append((entry["name"], kind, start, end))
+
+        self.index = DateIndex((start, end) for *_, start, end in self.ranges)
+
+    def __contains__(self, day):
+        """Check whether a date falls in any of the calendar's ranges.
+
+        Parameters
+        ----------
+        day : date or int
+            A date or its ordinal
+
+        Returns
+        -------
+        bool
+            If True, there is no class on the date
+        """
+        return day in self.index
+
+
+@lru_cache(maxsize=32)
+def _load_calendar(path, mtime_ns, size):
+    """Load and index a calendar file.
+
+    The file's modification time and size are part of the cache key, so an
+    edited calendar is loaded again.
+
+    Parameters
+    ----------
+    path : Path
+        Resolved path to the calendar file (.toml)
+    mtime_ns : int
+        Modification time of the file, in nanoseconds
+    size : int
+        Size of the file in bytes
+
+    Returns
+    -------
+    AcademicCalendar
+        The indexed calendar
+    """
+    return AcademicCalendar(load_toml(path))
+
+
+def load_calendar(path, base=None):
+    """Load a term calendar, reusing any earlier build of the same file.
+
+    Parameters
+    ----------
+    path : Path or str
+        Path to the calendar file (.toml)
+    base : Path or str, optional
+        Directory that a relative path is resolved against (defaults to the
+        current directory)
+
+    Returns
+    -------
+    AcademicCalendar
+        The indexed calendar
+    """
+    path = Path(path)
+    if base is not None and not path.is_absolute():
+        path = Path(base) / path
+
+    path = path.resolve()
+    st = path.stat()
+
+    return _load_calendar(path, st.st_mtime_ns, st.st_size)
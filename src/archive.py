@@ -0,0 +1,644 @@
+import hashlib
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+from pathlib import Path
+
+from output import atomic_write
+from schedule import Day, Schedule
+from utils import load_toml
+
+# File layout (all integers little-endian):
+#
+#   header     magic, version, counts, and the offset of each section
+#   courses    one fixed-width record per course, sorted by name
+#   days       one fixed-width record per class meeting, grouped by course
+#   agenda     string ids of every day's agenda items (u32)
+#   ordinals   date ordinal of each entry in the date index (u32, sorted)
+#   records    day record of each entry in the date index (u32)
+#   strings    end offset of each string (u32), then the UTF-8 text
+#
+# String 0 is the empty string. A day's ordinal is 0 if its year is unknown.
+HEADER = struct.Struct("<8sI9I")
+COURSE = struct.Struct("<IIIIQq32s")
+DAY = struct.Struct("<IHHBxHIIII")
+
+
+class Meeting:
+    """A class meeting read from an archive."""
+
+    __slots__ = ("course", "week", "title", "day")
+
+    def __init__(self, course, week, title, day):
+        """Initialize the object.
+
+        Parameters
+        ----------
+        course : str
+            Name of the course (its schedule's file stem)
+        week : int or str
+            Week number
+        title : str
+            Title of the week
+        day : Day
+            The meeting
+        """
+        self.course = course
+        self.week = week
+        self.title = title
+        self.day = day
+
+    @property
+    def date(self):
+        """Get the date of the meeting.
+
+        Returns
+        -------
+        date or None
+            The date, if the archive knows its year
+        """
+        if not self.day.ordinal:
+            return None
+
+        return date.fromordinal(self.day.ordinal)
+
+
+class ScheduleArchive:
+    """Read-only view of a packed schedule archive.
+
+    The file is memory-mapped, and records are unpacked only as queries
+    reach them, so opening an archive costs the same however many schedules
+    it holds.
+    """
+
+    magic = b"SYLSCHED"
+    version = 1
+
+    def __init__(self, path):
+        """Initialize the object.
+
+        Parameters
+        ----------
+        path : Path or str
+            Path to the archive
+
+        Raises
+        ------
+        ValueError
+            If the file isn't an archive of this version
+        """
+        self.path = Path(path)
+        with self.path.open("rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._view = memoryview(self._mmap)
+        if len(self._view) < HEADER.size:
+            magic, version, fields = None, None, []
+        else:
+            magic, version, *fields = HEADER.unpack_from(self._view)
+
+        if magic != self.magic or version != self.version:
+            self.close()
+            raise ValueError(
+                f"{self.path} is not a version {self.version} schedule archive"
+            )
+
+        (
+            self.n_courses,
+            self.n_days,
+            n_agenda,
+            n_strings,
+            self._courses_at,
+            self._days_at,
+            agenda_at,
+            index_at,
+            strings_at,
+        ) = fields
+
+        self._agenda = self._u32(agenda_at, n_agenda)
+        self._ordinals = self._u32(index_at, self.n_days)
+        self._records = self._u32(index_at + 4 * self.n_days, self.n_days)
+        self._string_ends = self._u32(strings_at, n_strings)
+        self._text_at = strings_at + 4 * n_strings
+        self._strings = {}
+
+    def _u32(self, offset, count):
+        """Get an array of unsigned 32-bit integers from the file.
+
+        Parameters
+        ----------
+        offset : int
+            Offset of the array
+        count : int
+            Number of integers
+
+        Returns
+        -------
+        memoryview or array
+            The integers, without a copy on little-endian machines
+        """
+        view = self._view[offset : offset + 4 * count]
+        if sys.byteorder == "little":
+            return view.cast("I")
+
+        values = array("I", view)
+        values.byteswap()
+        return values
+
+    def close(self):
+        """Release the memory map."""
+        for name in ("_agenda", "_ordinals", "_records", "_string_ends"):
+            values = getattr(self, name, None)
+            if isinstance(values, memoryview):
+                values.release()
+
+        self._view.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        """Use the archive as a context manager."""
+        return self
+
+    def __exit__(self, *exc):
+        """Close the archive."""
+        self.close()
+
+    def string(self, sid):
+        """Decode a string from the string table.
+
+        Parameters
+        ----------
+        sid : int
+            String id
+
+        Returns
+        -------
+        str
+            The string
+        """
+        if sid not in self._strings:
+            start = self._string_ends[sid - 1] if sid else 0
+            end = self._string_ends[sid]
+            text = self._view[self._text_at + start : self._text_at + end]
+            self._strings[sid] = str(text, "utf-8")
+
+        return self._strings[sid]
+
+    def _course(self, i):
+        """Unpack a course record.
+
+        Parameters
+        ----------
+        i : int
+            Index of the course
+
+        Returns
+        -------
+        tuple
+            Name id, year, first day, day count, size, mtime, and digest
+        """
+        offset = self._courses_at + i * COURSE.size
+        return COURSE.unpack_from(self._view, offset)
+
+    @property
+    def courses(self):
+        """List the courses in the archive.
+
+        Returns
+        -------
+        list[str]
+            Course names, sorted
+        """
+        return [
+            self.string(self._course(i)[0]) for i in range(self.n_courses)
+        ]
+
+    def _find_course(self, name):
+        """Find a course by name.
+
+        Parameters
+        ----------
+        name : str
+            Name of the course
+
+        Returns
+        -------
+        tuple or None
+            The course record, if the archive has the course
+        """
+        lo, hi = 0, self.n_courses
+        while lo < hi:
+            mid = (lo + hi) // 2
+            record = self._course(mid)
+            found = self.string(record[0])
+            if found == name:
+                return record
+            if found < name:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        return None
+
+    def _meeting(self, i):
+        """Unpack a day record.
+
+        Parameters
+        ----------
+        i : int
+            Index of the day
+
+        Returns
+        -------
+        Meeting
+            The meeting
+        """
+        (
+            ordinal,
+            course,
+            week,
+            no_class,
+            n_agenda,
+            agenda_at,
+            date_id,
+            weekday_id,
+            title_id,
+        ) = DAY.unpack_from(self._view, self._days_at + i * DAY.size)
+
+        agenda = self._agenda[agenda_at : agenda_at + n_agenda]
+        day = Day(
+            self.string(date_id),
+            self.string(weekday_id),
+            no_class=bool(no_class),
+            agenda=[self.string(sid) for sid in agenda],
+            ordinal=ordinal or None,
+        )
+
+        return Meeting(
+            self.string(self._course(course)[0]),
+            week or "",
+            self.string(title_id),
+            day,
+        )
+
+    def on(self, day):
+        """Find the meetings on a date.
+
+        Parameters
+        ----------
+        day : date
+            The date
+
+        Returns
+        -------
+        list[Meeting]
+            Meetings on the date, by course
+        """
+        ordinal = day.toordinal()
+        lo = bisect_left(self._ordinals, ordinal)
+        hi = bisect_right(self._ordinals, ordinal, lo)
+
+        return [self._meeting(self._records[i]) for i in range(lo, hi)]
+
+    def course(self, name):
+        """Get every meeting of a course.
+
+        Parameters
+        ----------
+        name : str
+            Name of the course
+
+        Returns
+        -------
+        list[Meeting]
+            The course's meetings, in order
+        """
+        record = self._find_course(name)
+        if record is None:
+            return []
+
+        _, _, first, count, *_ = record
+        return [self._meeting(i) for i in range(first, first + count)]
+
+    def search(self, text):
+        """Find the meetings whose agenda or week title mentions some text.
+
+        Parameters
+        ----------
+        text : str
+            Text to look for, ignoring case
+
+        Returns
+        -------
+        list[Meeting]
+            Matching meetings, by course and date
+        """
+        text = text.casefold()
+        matches = {
+            sid
+            for sid in range(1, len(self._string_ends))
+            if text in self.string(sid).casefold()
+        }
+        if not matches:
+            return []
+
+        found = []
+        for i in range(self.n_days):
+            record = DAY.unpack_from(self._view, self._days_at + i * DAY.size)
+            n_agenda, agenda_at, *_, title_id = record[4:]
+            agenda = self._agenda[agenda_at : agenda_at + n_agenda]
+            if title_id in matches or not matches.isdisjoint(agenda):
+                found.append(self._meeting(i))
+
+        return found
+
+    def stamps(self):
+        """Get what each course was built from.
+
+        Returns
+        -------
+        dict[str, tuple]
+            Size, mtime, and digest of each course's schedule, plus the
+            year it was archived with
+        """
+        stamps = {}
+        for i in range(self.n_courses):
+            name_id, year, _, _, size, mtime_ns, digest = self._course(i)
+            stamps[self.string(name_id)] = (size, mtime_ns, digest, year)
+
+        return stamps
+
+
+class ArchiveWriter:
+    """Packs course schedules into the archive format."""
+
+    def __init__(self):
+        """Initialize the object."""
+        self.strings = {"": 0}
+        self.courses = []
+        self.days = []
+        self.agenda = []
+
+    def _sid(self, text):
+        """Get the id of a string, adding it to the table if it's new.
+
+        Parameters
+        ----------
+        text : str
+            The string
+
+        Returns
+        -------
+        int
+            String id
+        """
+        return self.strings.setdefault(text, len(self.strings))
+
+    def add(self, name, meetings, stamp):
+        """Add a course.
+
+        Parameters
+        ----------
+        name : str
+            Name of the course
+        meetings : iterable[tuple[int or str, str, Day]]
+            Week number, week title, and day of each meeting
+        stamp : tuple
+            Size, mtime, and digest of the course's schedule, plus its year
+
+        Raises
+        ------
+        ValueError
+            If a week number doesn't fit the archive
+        """
+        course = len(self.courses)
+        first = len(self.days)
+        for week, title, day in meetings:
+            if week != "" and not 0 < week < 1 << 16:
+                raise ValueError(f"Week number out of range: {week}")
+
+            self.days.append(
+                (
+                    day.ordinal or 0,
+                    course,
+                    week or 0,
+                    day.no_class,
+                    len(day.agenda),
+                    len(self.agenda),
+                    self._sid(day.date),
+                    self._sid(day.weekday),
+                    self._sid(title),
+                )
+            )
+            self.agenda.extend(self._sid(item) for item in day.agenda)
+
+        size, mtime_ns, digest, year = stamp
+        count = len(self.days) - first
+        self.courses.append(
+            (self._sid(name), year, first, count, size, mtime_ns, digest)
+        )
+
+    def pack(self):
+        """Pack the archive.
+
+        Returns
+        -------
+        bytes
+            The archive
+        """
+        # Courses are written by name so they can be found with a binary
+        # search, but their days stay where they were added
+        names = sorted(self.strings, key=self.strings.get)
+        courses = sorted(self.courses, key=lambda course: names[course[0]])
+        position = {course[0]: i for i, course in enumerate(courses)}
+
+        index = sorted((day[0], i) for i, day in enumerate(self.days))
+        text = [name.encode() for name in names]
+        ends = []
+        total = 0
+        for encoded in text:
+            total += len(encoded)
+            ends.append(total)
+
+        sections = [
+            b"".join(COURSE.pack(*course) for course in courses),
+            b"".join(
+                DAY.pack(day[0], position[self.courses[day[1]][0]], *day[2:])
+                for day in self.days
+            ),
+            array("I", self.agenda),
+            array("I", [ordinal for ordinal, _ in index])
+            + array("I", [i for _, i in index]),
+            array("I", ends),
+        ]
+        for i, section in enumerate(sections):
+            if isinstance(section, array):
+                if sys.byteorder != "little":
+                    section.byteswap()
+                sections[i] = section.tobytes()
+
+        offsets = []
+        at = HEADER.size
+        for section in sections:
+            offsets.append(at)
+            at += len(section)
+
+        header = HEADER.pack(
+            ScheduleArchive.magic,
+            ScheduleArchive.version,
+            len(courses),
+            len(self.days),
+            len(self.agenda),
+            len(names),
+            *offsets,
+        )
+
+        return b"".join([header, *sections, *text])
+
+
+def build_archive(config_dir, schedule_dir, path, toml_cache=None):
+    """Pack every course schedule into an archive.
+
+    Only schedules that changed since the last build are parsed; the rest
+    are copied over from the existing archive. Each course's meetings are
+    dated with the year in its config.
+
+    Parameters
+    ----------
+    config_dir : Path
+        Directory of syllabus configs (.toml)
+    schedule_dir : Path
+        Directory of course schedules (.toml)
+    path : Path
+        Path to the archive
+    toml_cache : TomlCache, optional
+        Cache of parsed TOML
+
+    Raises
+    ------
+    SystemExit
+        If any schedule fails to archive
+    """
+    path = Path(path)
+    config_dir = Path(config_dir)
+
+    previous = None
+    if path.exists():
+        try:
+            previous = ScheduleArchive(path)
+        except ValueError:
+            print(f"Rebuilding {path} from scratch", file=sys.stderr)
+
+    stamps = previous.stamps() if previous else {}
+    writer = ArchiveWriter()
+    failures = {}
+    for schedule_path in sorted(Path(schedule_dir).glob("*.toml")):
+        name = schedule_path.stem
+        try:
+            config_path = config_dir / schedule_path.name
+            config = load_toml(config_path, cache=toml_cache)
+            year = int(config["schedule"]["year"])
+
+            st = schedule_path.stat()
+            stamp = stamps.get(name)
+            if stamp is None or stamp[:2] != (st.st_size, st.st_mtime_ns):
+                raw = schedule_path.read_bytes()
+                digest = hashlib.sha256(raw).digest()
+            else:
+                digest = stamp[2]
+            new_stamp = (st.st_size, st.st_mtime_ns, digest, year)
+
+            if stamp is not None and stamp[2:] == new_stamp[2:]:
+                meetings = [
+                    (m.week, m.title, m.day) for m in previous.course(name)
+                ]
+                status = "Unchanged"
+            else:
+                schedule = Schedule.from_toml(
+                    load_toml(schedule_path, cache=toml_cache), year=year
+                )
+                meetings = [
+                    (week.num, week.title, day)
+                    for week, day in schedule.days()
+                ]
+                status = "Archived"
+
+            writer.add(name, meetings, new_stamp)
+        except Exception as e:
+            failures[name] = e
+            print(f"Failed: {name}: {e}", file=sys.stderr)
+            continue
+
+        print(f"{status}: {name}")
+
+    if previous:
+        previous.close()
+
+    atomic_write(path, writer.pack())
+
+    if failures:
+        print(f"{len(failures)} schedule(s) failed", file=sys.stderr)
+        sys.exit(1)
+
+
+def format_meeting(meeting):
+    """Format a meeting as a line of query output.
+
+    Parameters
+    ----------
+    meeting : Meeting
+        The meeting
+
+    Returns
+    -------
+    str
+        Date, course, week, and agenda, separated by tabs
+    """
+    day = meeting.day
+    when = meeting.date.isoformat() if meeting.date else day.date
+    agenda = "No class" if day.no_class else "; ".join(day.agenda)
+    week = f"Week {meeting.week}"
+    if meeting.title:
+        week = f"{week} -- {meeting.title}"
+
+    return "\t".join([when, day.weekday, meeting.course, week, agenda])
+
+
+def query_archive(path, on=None, course=None, search=None):
+    """Print the meetings in an archive that match a query.
+
+    Parameters
+    ----------
+    path : Path
+        Path to the archive
+    on : date, optional
+        Find the meetings on this date
+    course : str, optional
+        Find the meetings of this course
+    search : str, optional
+        Find the meetings whose agenda or week title mentions this text
+
+    Raises
+    ------
+    SystemExit
+        If the archive can't be read
+    """
+    try:
+        archive = ScheduleArchive(path)
+    except (OSError, ValueError) as e:
+        print(f"Could not read archive: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    with archive:
+        if on is not None:
+            meetings = archive.on(on)
+        elif course is not None:
+            meetings = archive.course(course)
+        else:
+            meetings = archive.search(search)
+
+        for meeting in meetings:
+            print(format_meeting(meeting))
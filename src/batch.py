@@ -0,0 +1,347 @@
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from compile import SyllabusCompiler, TemplateRenderer
+from output import OutputWriter, atomic_write
+from schedule import Scheduler, schedule_args
+from utils import load_toml
+
+# Each worker process holds one renderer, which it receives (with its
+# templates already compiled) from the parent when the process starts
+_renderer = None
+_toml_cache = None
+
+
+def _init_worker(renderer, toml_cache=None):
+    """Store the shared renderer in a worker process.
+
+    Parameters
+    ----------
+    renderer : TemplateRenderer
+        Renderer with its templates already compiled
+    toml_cache : TomlCache, optional
+        Cache of parsed TOML
+    """
+    global _renderer, _toml_cache
+    _renderer = renderer
+    _toml_cache = toml_cache
+
+
+def _compile_one(config_path, schedule_path, to):
+    """Compile a single syllabus in a worker process.
+
+    Parameters
+    ----------
+    config_path : Path
+        Syllabus config (.toml)
+    schedule_path : Path
+        Course schedule (.toml)
+    to : str
+        Output format: markdown or json (a pandoc AST)
+
+    Returns
+    -------
+    tuple[str, float, int, int]
+        Compiled markdown or JSON, the seconds it took, and the hits and
+        misses of the TOML cache
+    """
+    start = time.perf_counter()
+    before = (
+        (_toml_cache.hits, _toml_cache.misses)
+        if _toml_cache is not None
+        else (0, 0)
+    )
+
+    syllabus_data = load_toml(config_path, cache=_toml_cache)
+    schedule = load_toml(schedule_path, cache=_toml_cache)
+
+    compiler = SyllabusCompiler(
+        syllabus_data, schedule, _renderer.template_paths, renderer=_renderer
+    )
+    if to == "json":
+        output = json.dumps(compiler.compile_ast())
+    else:
+        output = compiler.compile()
+
+    # The worker's cache outlives this task, so count only its lookups
+    after = (
+        (_toml_cache.hits, _toml_cache.misses)
+        if _toml_cache is not None
+        else (0, 0)
+    )
+    hits, misses = after[0] - before[0], after[1] - before[1]
+
+    return output, time.perf_counter() - start, hits, misses
+
+
+class BatchCompiler:
+    """Compiles every config in a directory with a pool of workers."""
+
+    def __init__(
+        self,
+        config_dir,
+        schedule_dir,
+        template_paths,
+        output_dir,
+        workers=None,
+        max_tasks_per_child=32,
+        to="markdown",
+        toml_cache=None,
+        metrics=None,
+    ):
+        """Initialize the object.
+
+        Parameters
+        ----------
+        config_dir : Path
+            Directory of syllabus configs (.toml)
+        schedule_dir : Path
+            Directory of course schedules (.toml)
+        template_paths : list[Path]
+            Paths to template files
+        output_dir : Path
+            Directory for the compiled markdown
+        workers : int, optional
+            Number of worker processes (defaults to the CPU count)
+        max_tasks_per_child : int
+            Number of syllabi a worker compiles before it is replaced
+        to : str
+            Output format: markdown or json (a pandoc AST)
+        toml_cache : TomlCache, optional
+            Cache of parsed TOML
+        metrics : BuildMetrics, optional
+            Records each syllabus's compile time, output size, and status
+        """
+        self.config_dir = Path(config_dir)
+        self.schedule_dir = Path(schedule_dir)
+        self.template_paths = template_paths
+        self.output_dir = Path(output_dir)
+        self.workers = workers
+        self.max_tasks_per_child = max_tasks_per_child
+        self.to = to
+        self.toml_cache = toml_cache
+        self.metrics = metrics
+
+    def _jobs(self):
+        """Pair each config with its schedule.
+
+        Returns
+        -------
+        list[tuple[Path, Path]]
+            Config and schedule paths
+        """
+        return [
+            (config, self.schedule_dir / config.name)
+            for config in sorted(self.config_dir.glob("*.toml"))
+        ]
+
+    def compile(self):
+        """Compile all configs, continuing past any failures.
+
+        Returns
+        -------
+        dict[str, Exception]
+            Failed configs and their errors
+        """
+        # Compile the templates here so that workers don't each do it
+        renderer = TemplateRenderer(self.template_paths)
+        renderer.plans
+
+        # Workers send their output back so that one writer keeps the
+        # manifest of unchanged files
+        writer = OutputWriter(self.output_dir)
+
+        failures = {}
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            max_tasks_per_child=self.max_tasks_per_child,
+            initializer=_init_worker,
+            initargs=(renderer, self.toml_cache),
+        ) as executor:
+            futures = {
+                executor.submit(_compile_one, *job, self.to): job[0].stem
+                for job in self._jobs()
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    output, seconds, hits, misses = future.result()
+                except Exception as e:
+                    failures[name] = e
+                    print(f"Failed: {name}: {e}", file=sys.stderr)
+                    self._record(name, "failed", error=str(e))
+                    continue
+
+                suffix = ".json" if self.to == "json" else ".md"
+                path = self.output_dir / f"{name}{suffix}"
+                text = f"{output}\n"
+                written = writer.write(path.name, text)
+                if written:
+                    print(f"Compiled: {path}")
+                else:
+                    print(f"Unchanged: {path}")
+
+                self._record(
+                    name,
+                    "built" if written else "unchanged",
+                    seconds=seconds,
+                    size=len(text.encode()),
+                    toml_lookups=(hits, misses),
+                )
+
+        writer.save()
+        return failures
+
+    def _record(self, name, status, toml_lookups=None, **kwargs):
+        """Record a syllabus in the metrics, if there are any.
+
+        Parameters
+        ----------
+        name : str
+            Name of the syllabus
+        status : str
+            Outcome of the compile
+        toml_lookups : tuple[int, int], optional
+            Hits and misses of the worker's TOML cache
+        kwargs : dict
+            Keywords for BuildMetrics.record
+        """
+        if self.metrics is None:
+            return
+
+        self.metrics.record(name, "compile", status, fmt=self.to, **kwargs)
+        if toml_lookups is not None and self.toml_cache is not None:
+            self.metrics.cache("toml", *toml_lookups)
+
+
+def compile_all(
+    config_dir,
+    schedule_dir,
+    template_paths,
+    output_dir,
+    workers=None,
+    max_tasks_per_child=32,
+    to="markdown",
+    toml_cache=None,
+    metrics=None,
+):
+    """Compile every config in a directory to markdown (or AST) files.
+
+    Parameters
+    ----------
+    config_dir : Path
+        Directory of syllabus configs (.toml)
+    schedule_dir : Path
+        Directory of course schedules (.toml)
+    template_paths : list[Path]
+        Paths to template files
+    output_dir : Path
+        Directory for the compiled markdown
+    workers : int, optional
+        Number of worker processes
+    max_tasks_per_child : int
+        Number of syllabi a worker compiles before it is replaced
+    to : str
+        Output format: markdown or json (a pandoc AST)
+    toml_cache : TomlCache, optional
+        Cache of parsed TOML
+    metrics : BuildMetrics, optional
+        Records each syllabus's compile time, output size, and status
+
+    Raises
+    ------
+    SystemExit
+        If any config fails to compile
+    """
+    batch = BatchCompiler(
+        config_dir,
+        schedule_dir,
+        template_paths,
+        output_dir,
+        workers=workers,
+        max_tasks_per_child=max_tasks_per_child,
+        to=to,
+        toml_cache=toml_cache,
+        metrics=metrics,
+    )
+    failures = batch.compile()
+    if failures:
+        print(f"{len(failures)} config(s) failed", file=sys.stderr)
+        sys.exit(1)
+
+
+def schedule_all(
+    config_dir,
+    schedule_dir,
+    force=False,
+    toml_cache=None,
+    metrics=None,
+):
+    """Build a schedule for every config in a directory.
+
+    Configs that share a term calendar share a single build of its index.
+    Existing schedules are filled out by hand, so they are only overwritten
+    when forced.
+
+    Parameters
+    ----------
+    config_dir : Path
+        Directory of syllabus configs (.toml)
+    schedule_dir : Path
+        Directory for the course schedules (.toml)
+    force : bool
+        If True, overwrite existing schedules
+    toml_cache : TomlCache, optional
+        Cache of parsed TOML
+    metrics : BuildMetrics, optional
+        Records each schedule's build time, size, and status
+
+    Raises
+    ------
+    SystemExit
+        If any schedule fails to build
+    """
+    schedule_dir = Path(schedule_dir)
+    schedule_dir.mkdir(parents=True, exist_ok=True)
+
+    scheduler = Scheduler()
+    failures = {}
+    for config in sorted(Path(config_dir).glob("*.toml")):
+        output_path = schedule_dir / config.name
+        if output_path.exists() and not force:
+            print(f"Skipped (exists): {output_path}")
+            if metrics is not None:
+                metrics.record(config.stem, "schedule", "skipped")
+            continue
+
+        start = time.perf_counter()
+        try:
+            syllabus_data = load_toml(config, cache=toml_cache)
+            schedule = scheduler.make_schedule(
+                **schedule_args(syllabus_data, config)
+            )
+        except Exception as e:
+            failures[config.stem] = e
+            print(f"Failed: {config.stem}: {e}", file=sys.stderr)
+            if metrics is not None:
+                metrics.record(config.stem, "schedule", "failed", error=str(e))
+            continue
+
+        text = f"{schedule}\n"
+        atomic_write(output_path, text.encode())
+        print(f"Scheduled: {output_path}")
+        if metrics is not None:
+            metrics.record(
+                config.stem,
+                "schedule",
+                "built",
+                seconds=time.perf_counter() - start,
+                size=len(text.encode()),
+            )
+
+    if failures:
+        print(f"{len(failures)} config(s) failed", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+from output import atomic_write
+
+
+def _source_digest():
+    """Hash the source of this package.
+
+    Cache keys include this digest, so editing any formatter or template
+    invalidates everything built with the old code.
+
+    Returns
+    -------
+    str
+        Hex digest of the package's source files
+    """
+    root = Path(__file__).parent
+    if root.is_file():
+        # Running from a zipapp, which holds all of the code
+        return hashlib.sha256(root.read_bytes()).hexdigest()
+
+    digest = hashlib.sha256()
+    for path in sorted(root.glob("*.py")):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+
+    return digest.hexdigest()
+
+
+# Entries that no build has read or written for this long are pruned
+MAX_AGE = 30 * 24 * 60 * 60
+
+
+class BuildCache:
+    """Content-addressed store of build outputs on disk.
+
+    Entries are keyed by a hash of everything that went into them. Every
+    lookup is recorded so that a build can explain what it reused. Reading
+    an entry updates its modification time, so prune evicts the entries
+    that have gone unused longest.
+    """
+
+    def __init__(self, root, max_age=MAX_AGE):
+        """Initialize the object.
+
+        Parameters
+        ----------
+        root : Path
+            Directory for the cache
+        max_age : float
+            Seconds an entry may go unused before prune removes it
+        """
+        self.root = Path(root)
+        self.max_age = max_age
+        self.version = _source_digest()
+        self.events = []
+
+    def key(self, *parts):
+        """Hash the inputs of a build step.
+
+        Parameters
+        ----------
+        parts : any
+            JSON-serializable inputs (dates and other TOML scalars are
+            converted to strings)
+
+        Returns
+        -------
+        str
+            The cache key
+        """
+        payload = json.dumps(
+            [self.version, *parts], sort_keys=True, default=str
+        ).encode()
+
+        return hashlib.sha256(payload).hexdigest()
+
+    def _path(self, key):
+        """Get the file for a cache entry.
+
+        Parameters
+        ----------
+        key : str
+            The cache key
+
+        Returns
+        -------
+        Path
+            Path to the entry
+        """
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key):
+        """Read an entry.
+
+        Parameters
+        ----------
+        key : str
+            The cache key
+
+        Returns
+        -------
+        any or None
+            The cached value, or None if there is no (readable) entry
+        """
+        path = self._path(key)
+        try:
+            with path.open() as f:
+                value = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return value
+
+    def put(self, key, value):
+        """Write an entry atomically.
+
+        Parameters
+        ----------
+        key : str
+            The cache key
+        value : any
+            JSON-serializable value
+        """
+        atomic_write(self._path(key), json.dumps(value).encode())
+
+    def prune(self):
+        """Remove entries that have gone unused for longer than max_age.
+
+        Returns
+        -------
+        int
+            Number of entries removed
+        """
+        cutoff = time.time() - self.max_age
+        removed = 0
+        for path in self.root.glob("*/*.json"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                # Another build pruned it first
+                continue
+
+        return removed
+
+    def fetch(self, kind, name, key, build):
+        """Get an entry, building and storing it on a miss.
+
+        Parameters
+        ----------
+        kind : str
+            What is being built (e.g. stage or section)
+        name : str
+            Name of the item being built
+        key : str
+            The cache key
+        build : callable
+            Function that builds the value
+
+        Returns
+        -------
+        any
+            The cached or newly built value
+        """
+        value = self.get(key)
+        reused = value is not None
+        if not reused:
+            value = build()
+            self.put(key, value)
+
+        self.events.append((kind, name, reused))
+        return value
+
+    @property
+    def hits(self):
+        """Count the reused entries."""
+        return sum(reused for *_, reused in self.events)
+
+    @property
+    def misses(self):
+        """Count the rebuilt entries."""
+        return len(self.events) - self.hits
+
+    def explain(self):
+        """Describe what the build reused and what it rebuilt.
+
+        Returns
+        -------
+        str
+            One line per lookup, plus a summary
+        """
+        lines = [
+            f"{kind} {name}: {'reused' if reused else 'rebuilt'}"
+            for kind, name, reused in self.events
+        ]
+        lines.append(f"{self.hits} reused, {self.misses} rebuilt")
+
+        return "\n".join(lines)
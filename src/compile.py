@@ -1,7 +1,18 @@
-from string import Template
-
-from templates import MarkdownEntry, SpecialCourseDesignation
-from utils import flatten_config, wrap_paragraphs
+import itertools
+import json
+import sys
+import time
+from collections import Counter
+from collections.abc import Iterator
+from pathlib import Path
+
+from cache import BuildCache
+from output import OutputWriter
+from pandoc_ast import apply_docx_layout, markdown_to_ast, splice_blocks
+from schedule import Schedule
+from templates import MarkdownEntry, SpecialCourseDesignation, TemplatePlan
+from tracing import NULL_TRACER, Tracer
+from utils import flatten_config, wrap_many, wrap_paragraphs
 
 
 class SyllabusValidator:
@@ -101,26 +112,25 @@ class TableFormatter:
         str
             Formatted markdown entries
         """
-        entries = []
-        for entry in items:
-            entry_md = MarkdownEntry[item_type.upper()].render(**entry)
-            entries.append(wrap_paragraphs(entry_md))
-
-        return "\n".join(entries)
+        entries = MarkdownEntry[item_type.upper()].render_many(items)
+        return "\n".join(wrap_many(entries))
 
 
 class ScheduleFormatter:
     """Formats schedule data into markdown."""
 
-    def __init__(self, schedule_data):
+    def __init__(self, schedule):
         """Initialize the object.
 
         Parameters
         ----------
-        schedule_data : dict
-            Schedule data
+        schedule : Schedule or dict
+            Schedule, or its TOML data
         """
-        self.schedule = schedule_data
+        if isinstance(schedule, dict):
+            schedule = Schedule.from_toml(schedule)
+
+        self.schedule = schedule
 
     def format(self):
         """Format complete schedule.
@@ -130,37 +140,35 @@ class ScheduleFormatter:
         str
             Formatted schedule markdown
         """
-        return "\n".join(
-            self._format_week(week) for week in self.schedule.values()
-        )
+        return "".join(self.iter_chunks())
 
-    def _format_week(self, week):
-        """Format a single week.
+    def iter_chunks(self):
+        """Generate the schedule markdown in a single pass.
 
-        Parameters
-        ----------
-        week : dict
-            Week data
+        Each week heading and each day is a chunk, so memory use doesn't
+        grow with the length of the schedule.
 
-        Returns
-        -------
+        Yields
+        ------
         str
-            Formatted week markdown
+            A chunk of the schedule markdown
         """
-        num = week.get("num", "")
-        title = week.get("title", "")
+        render_week = MarkdownEntry.WEEK.plan.render
+        for i, week in enumerate(self.schedule):
+            week_md = render_week({"num": week.num, "title": week.title})
+            yield f"\n{week_md}\n" if i else f"{week_md}\n"
 
-        week_md = MarkdownEntry.WEEK.render(num=num, title=title)
-        days = "\n".join(self._format_day(day) for day in week.get("days", []))
+            for j, day in enumerate(week.days):
+                day_md = self._format_day(day)
+                yield f"\n{day_md}" if j else day_md
 
-        return f"{week_md}\n{days}"
-
-    def _format_day(self, day):
+    @staticmethod
+    def _format_day(day):
         """Format a single day.
 
         Parameters
         ----------
-        day : dict
+        day : Day
             Day information
 
         Returns
@@ -168,24 +176,14 @@ class ScheduleFormatter:
         str
             Rendered day markdown
         """
-        no_class = day.get("no_class", False)
-        weekday = day.get("weekday", "")
-        date = day.get("date", "")
-
-        if no_class:
-            return MarkdownEntry.DAY.render(
-                weekday=weekday,
-                date=date,
-                agenda=MarkdownEntry.NO_CLASS.render(),
-            )
-
-        agenda_md = "".join(
-            MarkdownEntry.AGENDA_ITEM.render(item=item)
-            for item in day.get("agenda", [])
-        )
-
-        return MarkdownEntry.DAY.render(
-            weekday=weekday, date=date, agenda=agenda_md
+        if day.no_class:
+            agenda_md = MarkdownEntry.NO_CLASS.plan.render({})
+        else:
+            render_item = MarkdownEntry.AGENDA_ITEM.plan.render
+            agenda_md = "".join(render_item({"item": i}) for i in day.agenda)
+
+        return MarkdownEntry.DAY.plan.render(
+            {"weekday": day.weekday, "date": day.date, "agenda": agenda_md}
         )
 
 
@@ -259,7 +257,14 @@ class SyllabusDataFormatter:
         ("assignment_description", "course_assignments"),
     ]
 
-    def __init__(self, syllabus_data, schedule):
+    def __init__(
+        self,
+        syllabus_data,
+        schedule,
+        cache=None,
+        stream=False,
+        tracer=None,
+    ):
         """Initialize the object.
 
         Parameters
@@ -268,9 +273,19 @@ class SyllabusDataFormatter:
             Course metadata
         schedule : dict
             Schedule data
+        cache : BuildCache, optional
+            Cache of stage outputs
+        stream : bool
+            If True and there is no cache, the schedule is formatted lazily,
+            as an iterator of markdown chunks
+        tracer : Tracer, optional
+            Records a span per stage
         """
         self.data = syllabus_data.copy()
         self.schedule = schedule
+        self.cache = cache
+        self.stream = stream
+        self.tracer = tracer or NULL_TRACER
         self.registry = self._create_registry()
 
     def _create_registry(self):
@@ -302,49 +317,138 @@ class SyllabusDataFormatter:
         dict
             Formatted syllabus data
         """
-        self._format_tables()
-        self._format_schedule()
-        self._flatten_data()
-        self._format_descriptions()
-        self._format_designation()
+        self._run_stage("tables", self._format_tables)
+        self._run_stage("schedule", self._format_schedule)
+        with self.tracer.span("flatten"):
+            self._flatten_data()
+        self._run_stage("descriptions", self._format_descriptions)
+        self._run_stage("designation", self._format_designation)
 
         return self.data
 
+    def _stage_inputs(self, stage):
+        """Get the data a formatting stage reads.
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage
+
+        Returns
+        -------
+        any
+            The stage's inputs
+        """
+        match stage:
+            case "tables":
+                return {key: self.data.get(key) for key in self.tables}
+            case "schedule":
+                return self.schedule
+            case "descriptions":
+                return {key: self.data.get(key) for _, key in self.descriptors}
+            case "designation":
+                return self.data.get("course_designation", "None")
+
+    def _run_stage(self, stage, func):
+        """Run a formatting stage and merge its output into the data.
+
+        With a cache, the output is reused whenever the stage's inputs are
+        unchanged.
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage
+        func : callable
+            Stage function, which returns a dict of formatted values
+        """
+        with self.tracer.span(stage):
+            if self.cache is None:
+                self.data.update(func())
+                return
+
+            key = self.cache.key("stage", stage, self._stage_inputs(stage))
+            self.data.update(self.cache.fetch("stage", stage, key, func))
+
     def _format_tables(self):
-        """Format TOML table arrays."""
+        """Format TOML table arrays.
+
+        Returns
+        -------
+        dict
+            Formatted tables
+        """
+        formatted = {}
         for item_type in self.tables:
             if item_type not in self.data:
                 continue
 
             md = self.registry.format(item_type, self.data[item_type])
-            self.data[f"{item_type}s"] = md
+            formatted[f"{item_type}s"] = md
+
+        return formatted
 
     def _format_schedule(self):
-        """Format the schedule."""
-        formatter = ScheduleFormatter(self.schedule)
-        self.data["course_schedule"] = formatter.format()
+        """Format the schedule.
+
+        Returns
+        -------
+        dict
+            Formatted schedule
+        """
+        year = self.data.get("schedule", {}).get("year")
+        formatter = ScheduleFormatter(
+            Schedule.from_toml(self.schedule, year=year)
+        )
+
+        # Cached outputs are stored as JSON, so they can't be streamed
+        if self.stream and self.cache is None:
+            return {"course_schedule": formatter.iter_chunks()}
+
+        return {"course_schedule": formatter.format()}
 
     def _flatten_data(self):
         """Flatten nested data structure."""
         self.data = flatten_config(self.data)
 
     def _format_descriptions(self):
-        """Format catalog and course descriptions."""
+        """Format catalog and course descriptions.
+
+        Returns
+        -------
+        dict
+            Formatted descriptions
+        """
         formatter = DescriptionFormatter()
+        formatted = {}
         for new_key, old_key in self.descriptors:
             if old_key not in self.data:
                 continue
 
-            self.data[new_key] = formatter.format(self.data[old_key])
+            formatted[new_key] = formatter.format(self.data[old_key])
+
+        return formatted
 
     def _format_designation(self):
-        """Format course designation."""
+        """Format course designation.
+
+        Returns
+        -------
+        dict
+            Formatted designation
+        """
         desig = self.data.get("course_designation", "None")
-        self.data["course_designation"] = DesignationFormatter.format(desig)
+        return {"course_designation": DesignationFormatter.format(desig)}
 
 
 class TemplateRenderer:
-    """Renders markdown templates with formatted data."""
+    """Renders markdown templates with formatted data.
+
+    Each template is a section of the syllabus and compiles to its own plan,
+    so a plan's placeholder index records the keys its section uses.
+    """
+
+    static_marker = "syllabus-static"
 
     def __init__(self, template_paths):
         """Initialize the object.
@@ -355,30 +459,235 @@ class TemplateRenderer:
             Paths to template files
         """
         self.template_paths = template_paths
+        self._plans = None
+        self._stamp = None
+        self._fragments = {}
+
+    def _stat(self):
+        """Get the modification time and size of each template file.
+
+        Returns
+        -------
+        tuple
+            One (mtime, size) pair per template
+        """
+        stats = (path.stat() for path in self.template_paths)
+        return tuple((st.st_mtime_ns, st.st_size) for st in stats)
+
+    @property
+    def plans(self):
+        """Compile the templates, reusing the plans until a file changes.
+
+        Returns
+        -------
+        list[TemplatePlan]
+            One compiled plan per template
+        """
+        stamp = self._stat()
+        if self._plans is None or stamp != self._stamp:
+            self._plans = [
+                TemplatePlan(path.read_text().strip())
+                for path in self.template_paths
+            ]
+            self._stamp = stamp
+
+        return self._plans
+
+    def _render_section(self, path, plan, context, cache):
+        """Render one section, reusing a cached rendering if possible.
+
+        Parameters
+        ----------
+        path : Path
+            Path to the section's template
+        plan : TemplatePlan
+            The section's compiled template
+        context : dict
+            Template context data
+        cache : BuildCache or None
+            Cache of rendered sections
+
+        Returns
+        -------
+        str
+            Rendered section
+        """
+        if plan.is_static:
+            return plan.segments[0]
+
+        if cache is None:
+            return plan.render(context)
+
+        used = {
+            name: str(context[name]) for name in plan.index if name in context
+        }
+        key = cache.key("section", plan.segments, used)
+        return cache.fetch(
+            "section", path.name, key, lambda: plan.render(context)
+        )
 
-    def render(self, context):
+    def render(self, context, cache=None):
         """Render templates with provided context.
 
         Parameters
         ----------
         context : dict
             Template context data
+        cache : BuildCache, optional
+            Cache of rendered sections
 
         Returns
         -------
         str
             Rendered markdown content
         """
-        docs = [path.read_text().strip() for path in self.template_paths]
-        template = Template("\n\n".join(docs))
+        return "".join(self.iter_render(context, cache=cache))
 
-        return template.safe_substitute(**context)
+    def iter_render(self, context, cache=None):
+        """Render templates with provided context, in chunks.
+
+        Without a cache, context values that are iterators of strings (e.g.
+        a streamed schedule) are spliced into their slots as they are
+        generated. Cached sections are rendered whole, since their key
+        depends on the values they use.
+
+        Parameters
+        ----------
+        context : dict
+            Template context data
+        cache : BuildCache, optional
+            Cache of rendered sections
+
+        Yields
+        ------
+        str
+            A chunk of the rendered markdown
+        """
+        plans = self.plans
+
+        # An iterator can only be consumed once, so one that fills slots in
+        # several sections is joined up front
+        uses = Counter(name for plan in plans for name in plan.names)
+        streamed = [
+            name
+            for name, value in context.items()
+            if isinstance(value, Iterator) and uses[name] > 1
+        ]
+        if streamed:
+            context = context.copy()
+            for name in streamed:
+                context[name] = "".join(context[name])
+
+        for i, (path, plan) in enumerate(zip(self.template_paths, plans)):
+            if i:
+                yield "\n\n"
+
+            if cache is None:
+                yield from plan.iter_render(context)
+            else:
+                yield self._render_section(path, plan, context, cache)
+
+    def _fragment(self, path, plan, docx_layout, cache):
+        """Get the AST blocks of a static section.
+
+        Fragments are parsed once per template revision and kept in memory,
+        and on disk if there is a cache.
+
+        Parameters
+        ----------
+        path : Path
+            Path to the section's template
+        plan : TemplatePlan
+            The section's compiled template
+        docx_layout : bool
+            If True, apply the docx layout rules to the fragment
+        cache : BuildCache or None
+            Cache of fragments
+
+        Returns
+        -------
+        list[dict]
+            The fragment's blocks
+        """
+        text = plan.segments[0]
+        memo_key = (text, docx_layout)
+        if memo_key not in self._fragments:
+
+            def build():
+                ast = markdown_to_ast(text)
+                if docx_layout:
+                    ast = apply_docx_layout(ast)
+                return ast["blocks"]
+
+            if cache is None:
+                blocks = build()
+            else:
+                key = cache.key("fragment", text, docx_layout)
+                blocks = cache.fetch("fragment", path.name, key, build)
+
+            self._fragments[memo_key] = blocks
+
+        return self._fragments[memo_key]
+
+    def render_ast(self, context, cache=None, docx_layout=False):
+        """Render templates with provided context to a pandoc AST.
+
+        Only the sections with placeholders go through pandoc. Each static
+        section stands in as a marker div, which is replaced by the section's
+        prerendered fragment. A static section must not continue a block
+        from the section before it (e.g. as indented list content), since it
+        is parsed on its own.
+
+        Parameters
+        ----------
+        context : dict
+            Template context data
+        cache : BuildCache, optional
+            Cache of rendered sections and fragments
+        docx_layout : bool
+            If True, apply the docx layout rules of the Lua filters
+
+        Returns
+        -------
+        dict
+            The document AST
+        """
+        sections = []
+        fragments = []
+        for path, plan in zip(self.template_paths, self.plans):
+            if not plan.is_static:
+                sections.append(
+                    self._render_section(path, plan, context, cache)
+                )
+                continue
+
+            marker = f"{self.static_marker}-{len(fragments)}"
+            sections.append(f"::: {{#{marker}}}\n{path.name}\n:::")
+            fragments.append(self._fragment(path, plan, docx_layout, cache))
+
+        ast = markdown_to_ast("\n\n".join(sections))
+        if docx_layout:
+            ast = apply_docx_layout(ast)
+
+        ast["blocks"] = splice_blocks(
+            ast["blocks"], fragments, self.static_marker
+        )
+
+        return ast
 
 
 class SyllabusCompiler:
     """Compiles syllabus data into markdown."""
 
-    def __init__(self, syllabus_data, schedule, template_paths):
+    def __init__(
+        self,
+        syllabus_data,
+        schedule,
+        template_paths,
+        renderer=None,
+        cache=None,
+        tracer=None,
+    ):
         """Initialize the object.
 
         Parameters
@@ -389,12 +698,52 @@ class SyllabusCompiler:
             Schedule data
         template_paths : list[Path]
             Paths to template files
+        renderer : TemplateRenderer, optional
+            A renderer whose templates have already been compiled
+        cache : BuildCache, optional
+            Cache of stage outputs and rendered sections
+        tracer : Tracer, optional
+            Records a span per stage of the build
         """
         self.syllabus_data = syllabus_data
         self.schedule = schedule
         self.template_paths = template_paths
+        self.renderer = renderer
+        self.cache = cache
+        self.tracer = tracer or NULL_TRACER
         self.validator = SyllabusValidator()
 
+    def _format(self, stream=False):
+        """Validate and format the syllabus data.
+
+        Parameters
+        ----------
+        stream : bool
+            If True, format the schedule lazily (see SyllabusDataFormatter)
+
+        Returns
+        -------
+        dict
+            Formatted syllabus data
+
+        Raises
+        ------
+        ValueError
+            If validation fails
+        """
+        with self.tracer.span("validate"):
+            self.validator.validate(self.syllabus_data)
+
+        formatter = SyllabusDataFormatter(
+            self.syllabus_data,
+            self.schedule,
+            cache=self.cache,
+            stream=stream,
+            tracer=self.tracer,
+        )
+        with self.tracer.span("format"):
+            return formatter.format()
+
     def compile(self):
         """Execute the compilation pipeline.
 
@@ -408,19 +757,79 @@ class SyllabusCompiler:
         ValueError
             If validation fails
         """
-        self.validator.validate(self.syllabus_data)
-
-        formatter = SyllabusDataFormatter(self.syllabus_data, self.schedule)
-        formatted = formatter.format()
+        formatted = self._format()
 
-        renderer = TemplateRenderer(self.template_paths)
-        output = renderer.render(formatted)
+        renderer = self.renderer or TemplateRenderer(self.template_paths)
+        with self.tracer.span("render"):
+            output = renderer.render(formatted, cache=self.cache)
 
         return output
 
+    def iter_compile(self):
+        """Execute the compilation pipeline, generating markdown in chunks.
+
+        The schedule is streamed into its slot, so the markdown never has to
+        be held in memory all at once. Rendering happens as the chunks are
+        consumed, so it is traced by the caller.
+
+        Returns
+        -------
+        iterator[str]
+            Compiled markdown, in chunks
+
+        Raises
+        ------
+        ValueError
+            If validation fails
+        """
+        formatted = self._format(stream=True)
+
+        renderer = self.renderer or TemplateRenderer(self.template_paths)
+        return renderer.iter_render(formatted, cache=self.cache)
 
-def compile_md(syllabus_data, schedule, template_paths):
-    """Compile to markdown and send to stdout.
+    def compile_ast(self, docx_layout=False):
+        """Compile to a pandoc JSON AST.
+
+        Parameters
+        ----------
+        docx_layout : bool
+            If True, apply the docx layout rules of the Lua filters
+
+        Returns
+        -------
+        dict
+            The document AST
+
+        Raises
+        ------
+        ValueError
+            If validation fails
+        """
+        formatted = self._format()
+
+        renderer = self.renderer or TemplateRenderer(self.template_paths)
+        with self.tracer.span("render"):
+            return renderer.render_ast(
+                formatted, cache=self.cache, docx_layout=docx_layout
+            )
+
+
+def compile_md(
+    syllabus_data,
+    schedule,
+    template_paths,
+    cache_dir=None,
+    explain=False,
+    output_path=None,
+    to="markdown",
+    docx_layout=False,
+    trace_path=None,
+    profile=False,
+    trace_memory=False,
+    metrics=None,
+    name=None,
+):
+    """Compile to markdown (or a pandoc AST) and send to stdout or a file.
 
     Parameters
     ----------
@@ -430,7 +839,80 @@ def compile_md(syllabus_data, schedule, template_paths):
         Schedule data
     template_paths : list[Path]
         Paths to template files
+    cache_dir : Path, optional
+        Directory for the build cache
+    explain : bool
+        If True, report what the build reused to stderr
+    output_path : Path, optional
+        File to write, which is left untouched if its content is unchanged
+    to : str
+        Output format: markdown or json (a pandoc AST)
+    docx_layout : bool
+        If True, apply the docx layout rules to the AST
+    trace_path : Path, optional
+        Write a Chrome trace of the build's stages to this file, and report
+        the stages to stderr
+    profile : bool
+        If True, also profile the build with cProfile (with a trace path)
+    trace_memory : bool
+        If True, also record the memory each stage allocates (with a trace
+        path)
+    metrics : BuildMetrics, optional
+        Records the compile time, output size, and status
+    name : str, optional
+        Name of the syllabus in the metrics
     """
-    compiler = SyllabusCompiler(syllabus_data, schedule, template_paths)
-    output = compiler.compile()
-    print(output)
+    tracer = NULL_TRACER
+    if trace_path is not None:
+        tracer = Tracer(profile=profile, trace_memory=trace_memory)
+        tracer.start()
+
+    start = time.perf_counter()
+    cache = BuildCache(cache_dir) if cache_dir else None
+    compiler = SyllabusCompiler(
+        syllabus_data, schedule, template_paths, cache=cache, tracer=tracer
+    )
+    written = True
+    try:
+        if to == "json":
+            ast = compiler.compile_ast(docx_layout=docx_layout)
+            chunks = [json.dumps(ast)]
+        else:
+            chunks = compiler.iter_compile()
+
+        # Markdown is rendered as it is written
+        chunks = itertools.chain(chunks, ["\n"])
+        with tracer.span("write"):
+            if output_path is None:
+                sys.stdout.writelines(chunks)
+            else:
+                output_path = Path(output_path)
+                writer = OutputWriter(output_path.parent)
+                written = writer.write_chunks(output_path.name, chunks)
+                writer.save()
+    except Exception as e:
+        if metrics is not None:
+            metrics.record(name, "compile", "failed", error=str(e), fmt=to)
+        raise
+
+    if metrics is not None:
+        metrics.record(
+            name,
+            "compile",
+            "built" if written else "unchanged",
+            seconds=time.perf_counter() - start,
+            size=output_path.stat().st_size if output_path else None,
+            fmt=to,
+        )
+        if cache is not None:
+            metrics.cache("build", cache.hits, cache.misses)
+
+    if cache is not None:
+        cache.prune()
+    if explain and cache is not None:
+        print(cache.explain(), file=sys.stderr)
+
+    if trace_path is not None:
+        tracer.stop()
+        tracer.save(trace_path)
+        print(tracer.report(), file=sys.stderr)
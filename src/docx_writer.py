@@ -0,0 +1,1338 @@
+import re
+import struct
+import zipfile
+import zlib
+from pathlib import Path
+from xml.sax.saxutils import escape, quoteattr
+
+from output import atomic_write_chunks
+
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PACKAGE_REL_NS = (
+    "http://schemas.openxmlformats.org/package/2006/relationships"
+)
+WORD_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+HYPERLINK_REL = f"{REL_NS}/hyperlink"
+NUMBERING_REL = f"{REL_NS}/numbering"
+NUMBERING_TYPE = (
+    "application/vnd.openxmlformats-officedocument."
+    "wordprocessingml.numbering+xml"
+)
+
+# Width of the text block in twips (5.5in), which pandoc's docx writer sizes
+# table columns against
+TEXT_WIDTH = 7920
+
+# Table width in fiftieths of a percent, as tblW measures it
+FULL_ROW = 5000
+
+ALIGNMENTS = {
+    "AlignLeft": "left",
+    "AlignCenter": "center",
+    "AlignRight": "right",
+}
+
+NUMBER_FORMATS = {
+    "DefaultStyle": "decimal",
+    "Example": "decimal",
+    "Decimal": "decimal",
+    "LowerAlpha": "lowerLetter",
+    "UpperAlpha": "upperLetter",
+    "LowerRoman": "lowerRoman",
+    "UpperRoman": "upperRoman",
+}
+
+DELIMITERS = {
+    "DefaultDelim": "{}.",
+    "Period": "{}.",
+    "OneParen": "{})",
+    "TwoParens": "({})",
+}
+
+BULLETS = "•◦▪"
+
+QUOTES = {"SingleQuote": ("‘", "’"), "DoubleQuote": ("“", "”")}
+
+# Formatting that inline elements add to their text, as run properties
+MARKS = {
+    "Strong": "b",
+    "Emph": "i",
+    "Underline": "u",
+    "Strikeout": "strike",
+    "Superscript": "sup",
+    "Subscript": "sub",
+    "SmallCaps": "smallcaps",
+}
+
+# Characters XML 1.0 doesn't allow
+INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+# Members are written with a fixed timestamp, so the same syllabus always
+# gives the same bytes
+DOS_EPOCH = (0, 0x21)
+
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+END_RECORD = struct.Struct("<IHHHHIIH")
+
+
+class ZipMember:
+    """A member of a ZIP archive, held in its compressed form."""
+
+    __slots__ = ("name", "method", "time", "date", "crc", "size", "data")
+
+    def __init__(self, name, method, time, date, crc, size, data):
+        """Initialize the object.
+
+        Parameters
+        ----------
+        name : str
+            Path of the member in the archive
+        method : int
+            Compression method (zipfile.ZIP_STORED or ZIP_DEFLATED)
+        time : int
+            Modification time, in MS-DOS format
+        date : int
+            Modification date, in MS-DOS format
+        crc : int
+            CRC-32 of the uncompressed data
+        size : int
+            Size of the uncompressed data
+        data : bytes
+            The compressed data
+        """
+        self.name = name
+        self.method = method
+        self.time = time
+        self.date = date
+        self.crc = crc
+        self.size = size
+        self.data = data
+
+    @classmethod
+    def deflate(cls, name, data):
+        """Compress data into a member.
+
+        Parameters
+        ----------
+        name : str
+            Path of the member in the archive
+        data : bytes
+            The uncompressed data
+
+        Returns
+        -------
+        ZipMember
+            The member
+        """
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+
+        return cls(
+            name,
+            zipfile.ZIP_DEFLATED,
+            *DOS_EPOCH,
+            zlib.crc32(data),
+            len(data),
+            compressed,
+        )
+
+
+def read_members(path):
+    """Read the members of a ZIP archive without decompressing them.
+
+    Parameters
+    ----------
+    path : Path
+        The archive
+
+    Returns
+    -------
+    list[ZipMember]
+        The members, in archive order
+
+    Raises
+    ------
+    ValueError
+        If a member is encrypted or not stored or deflated
+    """
+    members = []
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            if info.flag_bits & 0x1:
+                raise ValueError(f"{info.filename} is encrypted")
+            if info.compress_type not in (
+                zipfile.ZIP_STORED,
+                zipfile.ZIP_DEFLATED,
+            ):
+                raise ValueError(
+                    f"{info.filename} uses compression method "
+                    f"{info.compress_type}"
+                )
+
+            # The local header's name and extra field can differ in length
+            # from the central directory's, so they are read from it
+            f.seek(info.header_offset)
+            header = LOCAL_HEADER.unpack(f.read(LOCAL_HEADER.size))
+            f.seek(header[9] + header[10], 1)
+
+            time = info.date_time[3] << 11 | info.date_time[4] << 5
+            time |= info.date_time[5] // 2
+            date = (info.date_time[0] - 1980) << 9 | info.date_time[1] << 5
+            date |= info.date_time[2]
+            members.append(
+                ZipMember(
+                    info.filename,
+                    info.compress_type,
+                    time,
+                    date,
+                    info.CRC,
+                    info.file_size,
+                    f.read(info.compress_size),
+                )
+            )
+
+    return members
+
+
+def iter_zip(members):
+    """Write a ZIP archive.
+
+    Compressed data is copied as it is, so members that were read with
+    read_members are never decompressed.
+
+    Parameters
+    ----------
+    members : iterable[ZipMember]
+        The members, in order
+
+    Yields
+    ------
+    bytes
+        The archive, in chunks
+    """
+    central = []
+    offset = 0
+    for member in members:
+        name = member.name.encode()
+        flags = 0 if name.isascii() else 0x800
+        header = LOCAL_HEADER.pack(
+            0x04034B50,
+            20,
+            flags,
+            member.method,
+            member.time,
+            member.date,
+            member.crc,
+            len(member.data),
+            member.size,
+            len(name),
+            0,
+        )
+        central.append(
+            CENTRAL_HEADER.pack(
+                0x02014B50,
+                20,
+                20,
+                flags,
+                member.method,
+                member.time,
+                member.date,
+                member.crc,
+                len(member.data),
+                member.size,
+                len(name),
+                0,
+                0,
+                0,
+                0,
+                0,
+                offset,
+            )
+            + name
+        )
+        yield header + name
+        yield member.data
+        offset += len(header) + len(name) + len(member.data)
+
+    if len(central) > 0xFFFF or offset > 0xFFFFFFFF:
+        raise ValueError("Archive is too large for ZIP without ZIP64")
+
+    directory = b"".join(central)
+    yield directory
+    yield END_RECORD.pack(
+        0x06054B50,
+        0,
+        0,
+        len(central),
+        len(central),
+        len(directory),
+        offset,
+        0,
+    )
+
+
+def _text(text):
+    """Escape text for XML.
+
+    Parameters
+    ----------
+    text : str
+        The text
+
+    Returns
+    -------
+    str
+        Escaped text, without characters XML doesn't allow
+    """
+    return escape(INVALID_XML.sub("", text))
+
+
+def _end_of(xml, tag):
+    """Find the end of the last element with some tag.
+
+    Parameters
+    ----------
+    xml : str
+        The XML
+    tag : str
+        Qualified name of the element
+
+    Returns
+    -------
+    tuple[int, int]
+        Start and end index of the element, or (-1, -1) if there is none
+    """
+    start = xml.rfind(f"<{tag}")
+    if start < 0:
+        return -1, -1
+
+    close = xml.find(f"</{tag}>", start)
+    if close >= 0:
+        return start, close + len(f"</{tag}>")
+
+    return start, xml.index("/>", start) + 2
+
+
+class ReferencePackage:
+    """The parts of a reference .docx that every syllabus shares.
+
+    The package is read once. Members that don't depend on the content
+    (styles, the theme, headers and footers, settings) are kept compressed
+    and copied into each document as they are. The main document, its
+    relationships, and the numbering are kept as text, since each document
+    writes its own.
+    """
+
+    def __init__(self, path):
+        """Initialize the object.
+
+        Parameters
+        ----------
+        path : Path
+            The reference .docx
+
+        Raises
+        ------
+        ValueError
+            If the package has no main document
+        """
+        self.path = Path(path)
+        self.members = read_members(self.path)
+        with zipfile.ZipFile(self.path) as archive:
+            names = set(archive.namelist())
+
+            def read(name):
+                return archive.read(name).decode() if name in names else None
+
+            self.content_types = read("[Content_Types].xml")
+            self.document_path = self._main_part(read("_rels/.rels"))
+            document = read(self.document_path)
+            if self.content_types is None or document is None:
+                raise ValueError(f"{self.path} has no main document")
+
+            directory, _, name = self.document_path.rpartition("/")
+            prefix = f"{directory}/" if directory else ""
+            self.rels_path = f"{prefix}_rels/{name}.rels"
+            self.numbering_path = f"{prefix}numbering.xml"
+            self.rels = read(self.rels_path)
+            self.numbering = read(self.numbering_path)
+            styles = read(f"{prefix}styles.xml") or ""
+
+        if self.rels is None:
+            self.rels = (
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                f'<Relationships xmlns="{PACKAGE_REL_NS}"></Relationships>'
+            )
+
+        # Everything up to the end of the root's start tag, which declares
+        # the namespaces
+        root = document.index("<w:document")
+        self.document_start = document[: document.index(">", root) + 1]
+        if "xmlns:r=" not in self.document_start:
+            self.document_start = self.document_start.replace(
+                "<w:document", f'<w:document xmlns:r="{REL_NS}"', 1
+            )
+
+        # The last section's properties hold the page size, margins, and
+        # headers and footers
+        start, end = _end_of(document, "w:sectPr")
+        self.section = document[start:end] if start >= 0 else ""
+
+        self.styles = set(re.findall(r'w:styleId="([^"]+)"', styles))
+        self.rel_ids = set(re.findall(r'\bId="([^"]+)"', self.rels))
+
+    @staticmethod
+    def _main_part(rels):
+        """Find the main document of a package.
+
+        Parameters
+        ----------
+        rels : str or None
+            The package relationships (_rels/.rels)
+
+        Returns
+        -------
+        str
+            Path of the main document in the archive
+        """
+        for rel in re.findall(r"<Relationship\b[^>]*>", rels or ""):
+            if re.search(r'Type="[^"]*/officeDocument"', rel):
+                target = re.search(r'Target="/?([^"]+)"', rel)
+                if target:
+                    return target.group(1)
+
+        return "word/document.xml"
+
+    def numbering_xml(self, abstracts, nums):
+        """Add list definitions to the package's numbering.
+
+        Parameters
+        ----------
+        abstracts : callable
+            Takes the first free abstractNumId and returns the abstractNum
+            elements
+        nums : callable
+            Takes the first free abstractNumId and numId and returns the
+            num elements
+
+        Returns
+        -------
+        str
+            The numbering part
+        """
+        numbering = self.numbering or (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<w:numbering xmlns:w="{WORD_NS}"></w:numbering>'
+        )
+        abstract_id = 1 + max(
+            map(int, re.findall(r'w:abstractNumId="(\d+)"', numbering)),
+            default=0,
+        )
+        num_id = 1 + max(
+            map(int, re.findall(r'w:numId="(\d+)"', numbering)), default=0
+        )
+
+        # Every abstractNum must come before the first num
+        first_num = re.search(r"<w:num[ >]", numbering)
+        end = numbering.rindex("</w:numbering>")
+        split = first_num.start() if first_num else end
+
+        return "".join(
+            (
+                numbering[:split],
+                abstracts(abstract_id),
+                numbering[split:end],
+                nums(abstract_id, num_id),
+                numbering[end:],
+            )
+        )
+
+
+class DocumentBuilder:
+    """Writes the OOXML of a single document from its pandoc AST.
+
+    The mapping follows pandoc's docx writer: the same paragraph, run, and
+    table styles, and the same table widths, so the reference document
+    styles the result as it would pandoc's.
+
+    Elements that pandoc writes with parts of their own (notes, images,
+    math) aren't supported, and raise NotImplementedError.
+    """
+
+    def __init__(self, package):
+        """Initialize the object.
+
+        Parameters
+        ----------
+        package : ReferencePackage
+            The reference package
+        """
+        self.package = package
+        self.links = {}
+        self.lists = []
+        self._bookmarks = 0
+        self._after_header = False
+
+    def _rel(self, url):
+        """Get the relationship id of an external link.
+
+        Parameters
+        ----------
+        url : str
+            The link target
+
+        Returns
+        -------
+        str
+            Relationship id
+        """
+        if url not in self.links:
+            n = len(self.links) + 1
+            while f"rIdLink{n}" in self.package.rel_ids:
+                n += 1
+            self.links[url] = f"rIdLink{n}"
+
+        return self.links[url]
+
+    def _style(self, tag, style):
+        """Refer to a style, if the reference package defines it.
+
+        Parameters
+        ----------
+        tag : str
+            w:pStyle or w:rStyle
+        style : str or None
+            Style id
+
+        Returns
+        -------
+        str
+            The style element, or nothing
+        """
+        if style is None:
+            return ""
+        if self.package.styles and style not in self.package.styles:
+            return ""
+
+        return f'<{tag} w:val="{style}"/>'
+
+    def _run(self, props, content):
+        """Write a run.
+
+        Parameters
+        ----------
+        props : tuple[str or None, frozenset[str]]
+            Character style and marks
+        content : str
+            Run content
+
+        Returns
+        -------
+        str
+            The run
+        """
+        style, marks = props
+        rpr = self._style("w:rStyle", style)
+        for mark, xml in (
+            ("b", "<w:b/><w:bCs/>"),
+            ("i", "<w:i/><w:iCs/>"),
+            ("smallcaps", "<w:smallCaps/>"),
+            ("strike", "<w:strike/>"),
+            ("u", '<w:u w:val="single"/>'),
+        ):
+            if mark in marks:
+                rpr += xml
+        if "sup" in marks:
+            rpr += '<w:vertAlign w:val="superscript"/>'
+        elif "sub" in marks:
+            rpr += '<w:vertAlign w:val="subscript"/>'
+
+        rpr = f"<w:rPr>{rpr}</w:rPr>" if rpr else ""
+
+        return f"<w:r>{rpr}{content}</w:r>"
+
+    def _items(self, inlines, props):
+        """Flatten inline elements into text and markup.
+
+        Parameters
+        ----------
+        inlines : list[dict]
+            Inline elements
+        props : tuple[str or None, frozenset[str]]
+            Character style and marks of the enclosing elements
+
+        Yields
+        ------
+        tuple
+            (props, text) for text, or (None, xml) for markup
+        """
+        style, marks = props
+        for inline in inlines:
+            kind, content = inline["t"], inline.get("c")
+            match kind:
+                case "Str":
+                    yield props, content
+                case "Space" | "SoftBreak":
+                    yield props, " "
+                case "LineBreak":
+                    yield None, "<w:r><w:br/></w:r>"
+                case _ if kind in MARKS:
+                    inner = (style, marks | {MARKS[kind]})
+                    yield from self._items(content, inner)
+                case "Quoted":
+                    kind, inner = content
+                    left, right = QUOTES[kind["t"]]
+                    yield props, left
+                    yield from self._items(inner, props)
+                    yield props, right
+                case "Cite":
+                    yield from self._items(content[1], props)
+                case "Code":
+                    yield ("VerbatimChar", marks), content[1]
+                case "Span":
+                    (_, classes, attrs), inner = content
+                    custom = dict(attrs).get("custom-style", style)
+                    extra = {"smallcaps"} if "smallcaps" in classes else set()
+                    yield from self._items(inner, (custom, marks | extra))
+                case "Link":
+                    _, inner, (url, _) = content
+                    if url.startswith("#"):
+                        target = f"w:anchor={quoteattr(url[1:])}"
+                    else:
+                        target = f'r:id="{self._rel(url)}"'
+                    yield None, f"<w:hyperlink {target}>"
+                    yield from self._items(inner, ("Hyperlink", marks))
+                    yield None, "</w:hyperlink>"
+                case "RawInline":
+                    fmt, text = content
+                    if fmt == "openxml":
+                        yield None, text
+                case _:
+                    raise NotImplementedError(f"Unsupported inline: {kind}")
+
+    def _runs(self, inlines, props=(None, frozenset())):
+        """Write inline elements as runs, merging text with equal formatting.
+
+        Parameters
+        ----------
+        inlines : list[dict]
+            Inline elements
+        props : tuple[str or None, frozenset[str]]
+            Character style and marks
+
+        Returns
+        -------
+        str
+            The runs
+        """
+        runs = []
+        text, current = [], None
+        for item_props, content in self._items(inlines, props):
+            if text and item_props != current:
+                runs.append(self._text_run(current, "".join(text)))
+                text = []
+            if item_props is None:
+                runs.append(content)
+            else:
+                text.append(content)
+                current = item_props
+        if text:
+            runs.append(self._text_run(current, "".join(text)))
+
+        return "".join(runs)
+
+    def _text_run(self, props, text):
+        """Write a run of text.
+
+        Parameters
+        ----------
+        props : tuple[str or None, frozenset[str]]
+            Character style and marks
+        text : str
+            The text
+
+        Returns
+        -------
+        str
+            The run
+        """
+        return self._run(
+            props, f'<w:t xml:space="preserve">{_text(text)}</w:t>'
+        )
+
+    def _para(self, style, runs, numbering="", indent=0, extra=""):
+        """Write a paragraph.
+
+        Parameters
+        ----------
+        style : str or None
+            Paragraph style
+        runs : str
+            Paragraph content
+        numbering : str
+            The list numbering (w:numPr) of the paragraph
+        indent : int
+            Left indent in twips
+        extra : str
+            Further paragraph properties, which go after the indent (a
+            w:jc)
+
+        Returns
+        -------
+        str
+            The paragraph
+        """
+        ppr = self._style("w:pStyle", style) + numbering
+        if indent:
+            ppr += f'<w:ind w:left="{indent}"/>'
+        ppr += extra
+        ppr = f"<w:pPr>{ppr}</w:pPr>" if ppr else ""
+
+        return f"<w:p>{ppr}{runs}</w:p>"
+
+    def _list_levels(self, fmt, text, start, depth):
+        """Write the levels of a list definition.
+
+        Parameters
+        ----------
+        fmt : callable
+            Takes a level and returns its number format
+        text : callable
+            Takes a level and returns its label
+        start : int
+            First number of the list
+        depth : int
+            Level the list starts at
+
+        Returns
+        -------
+        str
+            The w:lvl elements
+        """
+        levels = []
+        for lvl in range(9):
+            first = start if lvl == depth else 1
+            levels.append(
+                f'<w:lvl w:ilvl="{lvl}"><w:start w:val="{first}"/>'
+                f'<w:numFmt w:val="{fmt(lvl)}"/>'
+                f'<w:lvlText w:val="{text(lvl)}"/><w:lvlJc w:val="left"/>'
+                f'<w:pPr><w:ind w:left="{720 * (lvl + 1)}" w:hanging="360"/>'
+                "</w:pPr></w:lvl>"
+            )
+
+        return "".join(levels)
+
+    def _abstracts(self, first_id):
+        """Write a list definition for each list.
+
+        Parameters
+        ----------
+        first_id : int
+            First free abstractNumId
+
+        Returns
+        -------
+        str
+            The w:abstractNum elements
+        """
+        abstracts = []
+        for i, (depth, attrs) in enumerate(self.lists):
+            if attrs is None:
+                levels = self._list_levels(
+                    lambda lvl: "bullet",
+                    lambda lvl: BULLETS[lvl % len(BULLETS)],
+                    1,
+                    depth,
+                )
+            else:
+                start, style, delim = attrs
+                fmt = NUMBER_FORMATS.get(style["t"], "decimal")
+                label = DELIMITERS.get(delim["t"], "{}.")
+                levels = self._list_levels(
+                    lambda lvl: fmt,
+                    lambda lvl: label.format(f"%{lvl + 1}"),
+                    start,
+                    depth,
+                )
+
+            abstracts.append(
+                f'<w:abstractNum w:abstractNumId="{first_id + i}">'
+                f'<w:multiLevelType w:val="multilevel"/>{levels}'
+                "</w:abstractNum>"
+            )
+
+        return "".join(abstracts)
+
+    def _nums(self, first_abstract, first_num):
+        """Write a numbering instance for each list.
+
+        Parameters
+        ----------
+        first_abstract : int
+            abstractNumId of the first list's definition
+        first_num : int
+            numId of the first list
+
+        Returns
+        -------
+        str
+            The w:num elements
+        """
+        return "".join(
+            f'<w:num w:numId="{first_num + i}">'
+            f'<w:abstractNumId w:val="{first_abstract + i}"/></w:num>'
+            for i in range(len(self.lists))
+        )
+
+    def _list(self, items, attrs, depth, style):
+        """Write a bullet or ordered list.
+
+        The first paragraph of each item carries the list number, and the
+        rest are indented to line up with it.
+
+        Parameters
+        ----------
+        items : list[list[dict]]
+            Blocks of each item
+        attrs : list or None
+            Start, style, and delimiter of an ordered list, or None for a
+            bullet list
+        depth : int
+            Nesting level
+        style : str or None
+            Paragraph style of the enclosing blocks
+
+        Returns
+        -------
+        str
+            The list
+        """
+        # Each list is numbered on its own, which means its own w:num, whose
+        # id is only known once the numbering part is written
+        self.lists.append((depth, attrs))
+        index = len(self.lists) - 1
+        numbering = (
+            f'<w:numPr><w:ilvl w:val="{depth}"/>'
+            f'<w:numId w:val="{{num{index}}}"/></w:numPr>'
+        )
+
+        parts = []
+        for blocks in items:
+            first = True
+            for block in blocks:
+                if first and block["t"] in ("Plain", "Para"):
+                    if block["t"] == "Plain":
+                        para_style = "Compact"
+                    else:
+                        para_style = style or "BodyText"
+                    runs = self._runs(block["c"])
+                    parts.append(self._para(para_style, runs, numbering))
+                else:
+                    parts.append(
+                        self._block(block, depth + 1, style, indent=True)
+                    )
+                first = False
+
+        return "".join(parts)
+
+    def _cell(self, blocks, align, colspan, depth):
+        """Write a table cell.
+
+        Parameters
+        ----------
+        blocks : list[dict]
+            Blocks of the cell
+        align : str or None
+            Horizontal alignment
+        colspan : int
+            Number of columns the cell spans
+        depth : int
+            Nesting level
+
+        Returns
+        -------
+        str
+            The cell
+        """
+        tcpr = f'<w:gridSpan w:val="{colspan}"/>' if colspan > 1 else ""
+        tcpr = f"<w:tcPr>{tcpr}</w:tcPr>" if tcpr else ""
+        jc = f'<w:jc w:val="{align}"/>' if align else ""
+
+        paras = []
+        for block in blocks:
+            if block["t"] in ("Plain", "Para"):
+                runs = self._runs(block["c"])
+                paras.append(self._para("Compact", runs, extra=jc))
+            else:
+                paras.append(self._block(block, depth, None))
+
+        # Word rejects cells without a paragraph
+        body = "".join(paras) or self._para("Compact", "", extra=jc)
+
+        return f"<w:tc>{tcpr}{body}</w:tc>"
+
+    def _table(self, content, depth):
+        """Write a table with pandoc's widths.
+
+        Columns with a relative width get that share of the text width, and
+        the table is as wide as its columns together, as pandoc writes it.
+
+        Parameters
+        ----------
+        content : list
+            Contents of the Table element
+        depth : int
+            Nesting level
+
+        Returns
+        -------
+        str
+            The caption and the table
+        """
+        _, (_, caption), colspecs, head, bodies, foot = content
+
+        widths = [
+            width["c"] if width["t"] == "ColWidth" else 0
+            for _, width in colspecs
+        ]
+        aligns = [ALIGNMENTS.get(align["t"]) for align, _ in colspecs]
+
+        if all(widths):
+            total = round(FULL_ROW * sum(widths))
+            tblw = f'<w:tblW w:type="pct" w:w="{total}"/>'
+            layout = '<w:tblLayout w:type="fixed"/>'
+            grid = "".join(
+                f'<w:gridCol w:w="{int(TEXT_WIDTH * width)}"/>'
+                for width in widths
+            )
+        else:
+            tblw = '<w:tblW w:type="auto" w:w="0"/>'
+            layout = ""
+            grid = "<w:gridCol/>" * len(colspecs)
+
+        rows = []
+        header_rows = head[1]
+        body_rows = [
+            row for _, _, inter, body in bodies for row in inter + body
+        ]
+        for is_header, row in (
+            *((True, row) for row in header_rows),
+            *((False, row) for row in body_rows + foot[1]),
+        ):
+            cells = []
+            column = 0
+            for _, align, rowspan, colspan, blocks in row[1]:
+                if rowspan > 1:
+                    raise NotImplementedError("Unsupported table: rowspan")
+
+                default = aligns[column] if column < len(aligns) else None
+                align = ALIGNMENTS.get(align["t"], default)
+                cells.append(self._cell(blocks, align, colspan, depth))
+                column += colspan
+
+            trpr = "<w:trPr><w:tblHeader/></w:trPr>" if is_header else ""
+            rows.append(f"<w:tr>{trpr}{''.join(cells)}</w:tr>")
+
+        caption_xml = "".join(
+            self._para("TableCaption", self._runs(block["c"]))
+            for block in caption
+            if block["t"] in ("Plain", "Para")
+        )
+
+        return (
+            f"{caption_xml}<w:tbl><w:tblPr>"
+            f"{self._style('w:tblStyle', 'Table')}{tblw}{layout}"
+            '<w:tblLook w:firstRow="1" w:lastRow="0" w:firstColumn="0" '
+            'w:lastColumn="0" w:noHBand="0" w:noVBand="0" w:val="0420"/>'
+            f"</w:tblPr><w:tblGrid>{grid}</w:tblGrid>{''.join(rows)}</w:tbl>"
+        )
+
+    def _header(self, content):
+        """Write a header, with a bookmark for links to it.
+
+        Parameters
+        ----------
+        content : list
+            Contents of the Header element
+
+        Returns
+        -------
+        str
+            The heading paragraph
+        """
+        level, (ident, _, _), inlines = content
+        runs = self._runs(inlines)
+        if ident:
+            self._bookmarks += 1
+            n = self._bookmarks
+            runs = (
+                f'<w:bookmarkStart w:id="{n}" w:name={quoteattr(ident)}/>'
+                f'{runs}<w:bookmarkEnd w:id="{n}"/>'
+            )
+
+        return self._para(f"Heading{level}", runs)
+
+    def _block(self, block, depth=0, style=None, indent=False):
+        """Write a block element.
+
+        Parameters
+        ----------
+        block : dict
+            The element
+        depth : int
+            List nesting level
+        style : str, optional
+            Paragraph style of the enclosing blocks (e.g. BlockText)
+        indent : bool
+            If True, the block continues a list item and is indented
+
+        Returns
+        -------
+        str
+            The block's OOXML
+        """
+        kind, content = block["t"], block.get("c")
+        after_header, self._after_header = self._after_header, False
+        left = 720 * depth if indent else 0
+
+        match kind:
+            case "Header":
+                self._after_header = True
+                return self._header(content)
+            case "Para":
+                if style is None:
+                    style = "FirstParagraph" if after_header else "BodyText"
+                return self._para(style, self._runs(content), indent=left)
+            case "Plain":
+                return self._para(
+                    style or "Compact", self._runs(content), indent=left
+                )
+            case "LineBlock":
+                lines = "<w:r><w:br/></w:r>".join(
+                    self._runs(line) for line in content
+                )
+                return self._para(style or "BodyText", lines, indent=left)
+            case "CodeBlock":
+                lines = content[1].split("\n")
+                runs = "<w:r><w:br/></w:r>".join(
+                    self._runs([{"t": "Code", "c": [None, line]}])
+                    for line in lines
+                )
+                return self._para("SourceCode", runs, indent=left)
+            case "RawBlock":
+                fmt, text = content
+                return text if fmt == "openxml" else ""
+            case "BlockQuote":
+                return "".join(
+                    self._block(child, depth, "BlockText", indent)
+                    for child in content
+                )
+            case "BulletList":
+                return self._list(content, None, depth, style)
+            case "OrderedList":
+                return self._list(content[1], content[0], depth, style)
+            case "DefinitionList":
+                parts = []
+                for term, definitions in content:
+                    runs = self._runs(term)
+                    parts.append(self._para("DefinitionTerm", runs))
+                    for blocks in definitions:
+                        parts.extend(
+                            self._block(child, depth, "Definition", indent)
+                            for child in blocks
+                        )
+                return "".join(parts)
+            case "HorizontalRule":
+                border = (
+                    '<w:pBdr><w:bottom w:val="single" w:sz="6" '
+                    'w:space="1" w:color="auto"/></w:pBdr>'
+                )
+                return self._para(None, "", extra=border)
+            case "Table":
+                return self._table(content, depth)
+            case "Div":
+                (_, _, attrs), blocks = content
+                custom = dict(attrs).get("custom-style", style)
+                self._after_header = after_header
+                return "".join(
+                    self._block(child, depth, custom, indent)
+                    for child in blocks
+                )
+            case "Null":
+                return ""
+            case _:
+                raise NotImplementedError(f"Unsupported block: {kind}")
+
+    def _meta(self, meta):
+        """Write the title block from the document metadata.
+
+        Parameters
+        ----------
+        meta : dict
+            Document metadata
+
+        Returns
+        -------
+        str
+            Title, subtitle, author, and date paragraphs
+        """
+
+        def inlines(value):
+            match value["t"]:
+                case "MetaString":
+                    return [{"t": "Str", "c": value["c"]}]
+                case "MetaInlines":
+                    return value["c"]
+                case "MetaBlocks":
+                    return [
+                        inline
+                        for block in value["c"]
+                        if block["t"] in ("Plain", "Para")
+                        for inline in block["c"]
+                    ]
+            return []
+
+        parts = []
+        for key, style in (
+            ("title", "Title"),
+            ("subtitle", "Subtitle"),
+            ("author", "Author"),
+            ("date", "Date"),
+        ):
+            value = meta.get(key)
+            if value is None:
+                continue
+
+            values = value["c"] if value["t"] == "MetaList" else [value]
+            for item in values:
+                parts.append(self._para(style, self._runs(inlines(item))))
+
+        return "".join(parts)
+
+    def document(self, ast):
+        """Write the main document part.
+
+        Parameters
+        ----------
+        ast : dict
+            The document AST
+
+        Returns
+        -------
+        str
+            The document, with list numbers still to fill in (see
+            numbering)
+        """
+        body = self._meta(ast.get("meta", {})) + "".join(
+            self._block(block) for block in ast["blocks"]
+        )
+
+        return (
+            f"{self.package.document_start}<w:body>{body}"
+            f"{self.package.section}</w:body></w:document>"
+        )
+
+    def parts(self, ast):
+        """Write the parts of the document that differ from the reference.
+
+        Parameters
+        ----------
+        ast : dict
+            The document AST
+
+        Returns
+        -------
+        dict[str, str]
+            Part paths and their contents
+        """
+        package = self.package
+        document = self.document(ast)
+        rels = [
+            f'<Relationship Id="{rel_id}" Type="{HYPERLINK_REL}" '
+            f'Target={quoteattr(url)} TargetMode="External"/>'
+            for url, rel_id in self.links.items()
+        ]
+        parts = {}
+
+        if self.lists:
+            first_num = []
+
+            def nums(first_abstract, first_id):
+                first_num.append(first_id)
+                return self._nums(first_abstract, first_id)
+
+            parts[package.numbering_path] = package.numbering_xml(
+                self._abstracts, nums
+            )
+            document = re.sub(
+                r'w:val="\{num(\d+)\}"',
+                lambda m: f'w:val="{first_num[0] + int(m.group(1))}"',
+                document,
+            )
+
+            if package.numbering is None:
+                target = package.numbering_path.rpartition("/")[2]
+                n = 1
+                while f"rIdNumbering{n}" in package.rel_ids:
+                    n += 1
+                rels.append(
+                    f'<Relationship Id="rIdNumbering{n}" '
+                    f'Type="{NUMBERING_REL}" Target="{target}"/>'
+                )
+                parts["[Content_Types].xml"] = package.content_types.replace(
+                    "</Types>",
+                    f'<Override PartName="/{package.numbering_path}" '
+                    f'ContentType="{NUMBERING_TYPE}"/></Types>',
+                )
+
+        parts[package.document_path] = document
+        if rels:
+            end = package.rels.rindex("</Relationships>")
+            parts[package.rels_path] = "".join(
+                (package.rels[:end], *rels, package.rels[end:])
+            )
+
+        return parts
+
+
+class DocxWriter:
+    """Writes .docx files without pandoc.
+
+    The reference document is read once and reused for every document:
+    its members are copied into each new package still compressed, and
+    only the main document (plus its relationships and list numbering,
+    when the content needs them) is generated. ASTs should already have
+    the docx layout rules applied (see pandoc_ast.apply_docx_layout).
+    """
+
+    def __init__(self, reference_doc=None):
+        """Initialize the object.
+
+        Parameters
+        ----------
+        reference_doc : Path, optional
+            Reference .docx for styles (defaults to pandoc's)
+        """
+        self.reference_doc = reference_doc
+        self._package = None
+        self._stamp = None
+        self._default = None
+
+    def _path(self):
+        """Find the reference document.
+
+        Without one, pandoc's own reference document is written to a
+        temporary file once.
+
+        Returns
+        -------
+        Path
+            The reference .docx
+        """
+        if self.reference_doc:
+            return Path(self.reference_doc)
+
+        if self._default is None:
+            import subprocess
+            import tempfile
+
+            data = subprocess.run(
+                ["pandoc", "--print-default-data-file", "reference.docx"],
+                capture_output=True,
+                check=True,
+            ).stdout
+            with tempfile.NamedTemporaryFile(
+                suffix=".docx", delete=False
+            ) as f:
+                f.write(data)
+            self._default = Path(f.name)
+
+        return self._default
+
+    @property
+    def package(self):
+        """Read the reference package, reusing it until the file changes.
+
+        Returns
+        -------
+        ReferencePackage
+            The reference package
+        """
+        path = self._path()
+        st = path.stat()
+        stamp = (st.st_mtime_ns, st.st_size)
+        if self._package is None or stamp != self._stamp:
+            self._package = ReferencePackage(path)
+            self._stamp = stamp
+
+        return self._package
+
+    def iter_bytes(self, ast):
+        """Write a .docx from an AST.
+
+        Parameters
+        ----------
+        ast : dict
+            The document AST
+
+        Yields
+        ------
+        bytes
+            The .docx, in chunks
+
+        Raises
+        ------
+        NotImplementedError
+            If the AST has elements the writer doesn't support
+        """
+        package = self.package
+        parts = DocumentBuilder(package).parts(ast)
+
+        members = []
+        for member in package.members:
+            if member.name in parts:
+                data = parts.pop(member.name).encode()
+                member = ZipMember.deflate(member.name, data)
+            members.append(member)
+        for name, text in parts.items():
+            members.append(ZipMember.deflate(name, text.encode()))
+
+        yield from iter_zip(members)
+
+    def to_bytes(self, ast):
+        """Write a .docx from an AST into memory.
+
+        Parameters
+        ----------
+        ast : dict
+            The document AST
+
+        Returns
+        -------
+        bytes
+            The .docx
+        """
+        return b"".join(self.iter_bytes(ast))
+
+    def write(self, ast, path):
+        """Write a .docx from an AST to a file.
+
+        The file is replaced all at once, once the document is complete.
+
+        Parameters
+        ----------
+        ast : dict
+            The document AST
+        path : Path
+            Where to write the .docx
+
+        Returns
+        -------
+        str
+            SHA-256 of the file
+        """
+        # Build the parts first, so an unsupported element leaves no file
+        data = self.to_bytes(ast)
+
+        return atomic_write_chunks(path, [data])
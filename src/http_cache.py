@@ -0,0 +1,678 @@
+import hashlib
+import http.client
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+from email.utils import formatdate
+from pathlib import Path
+from urllib.error import HTTPError, URLError
+from urllib.parse import urljoin, urlsplit, urlunsplit
+from urllib.request import Request, urlopen
+
+from output import atomic_write, atomic_write_chunks
+
+CHUNK_SIZE = 64 * 1024
+
+CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+REDIRECTS = {301, 302, 303, 307, 308}
+
+# The same User-Agent as urllib, so that servers treat both alike
+USER_AGENT = "Python-urllib/{}.{}".format(*sys.version_info[:2])
+
+
+def iter_file(path, chunk_size=CHUNK_SIZE):
+    """Read a file in chunks.
+
+    Parameters
+    ----------
+    path : Path
+        Path to the file
+    chunk_size : int
+        Bytes per chunk
+
+    Yields
+    ------
+    bytes
+        A chunk of the file
+    """
+    with Path(path).open("rb") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+def iter_response(response, chunk_size=CHUNK_SIZE):
+    """Read a response body in chunks, as it arrives.
+
+    Parameters
+    ----------
+    response : http.client.HTTPResponse
+        The response
+    chunk_size : int
+        Bytes per chunk
+
+    Yields
+    ------
+    bytes
+        A chunk of the body
+    """
+    while chunk := response.read(chunk_size):
+        yield chunk
+
+
+def _read_json(path):
+    """Read a JSON file.
+
+    Parameters
+    ----------
+    path : Path
+        Path to the file
+
+    Returns
+    -------
+    dict or None
+        The data, or None if the file is missing or unreadable
+    """
+    try:
+        return json.loads(path.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _expected_size(response, offset):
+    """Get the size a download should have once complete.
+
+    Parameters
+    ----------
+    response : http.client.HTTPResponse
+        The response
+    offset : int
+        Bytes already downloaded, for a 206
+
+    Returns
+    -------
+    int or None
+        Size of the complete file, if the server says
+    """
+    if response.status == 206:
+        match = CONTENT_RANGE.fullmatch(
+            response.headers.get("Content-Range", "")
+        )
+        if match and match.group(3) != "*":
+            return int(match.group(3))
+        return None
+
+    length = response.headers.get("Content-Length")
+    return int(length) if length is not None else None
+
+
+def download_file(
+    url,
+    path,
+    headers=None,
+    timeout=30,
+    chunk_size=CHUNK_SIZE,
+    opener=urlopen,
+):
+    """Stream a URL to a file, resuming a partial download.
+
+    The content streams into a hidden .part file next to the destination,
+    which replaces the destination once it is complete. If a download is
+    interrupted, its .part file is kept, and the next attempt asks only for
+    the rest with a Range request. If-Range makes the server send the whole
+    file instead if it changed in the meantime.
+
+    Parameters
+    ----------
+    url : str
+        The URL
+    path : Path
+        Destination file
+    headers : dict, optional
+        Request headers (e.g. conditional ones)
+    timeout : float
+        Seconds to wait for the server
+    chunk_size : int
+        Bytes per chunk
+    opener : callable
+        Sends the request: urlopen, or a ConnectionPool's open
+
+    Returns
+    -------
+    email.message.Message or None
+        Headers of the response, or None if the server answered 304 to the
+        conditional headers, in which case the destination is untouched
+
+    Raises
+    ------
+    URLError
+        If the request fails or the download is cut short
+    """
+    path = Path(path)
+    part = path.with_name(f".{path.name}.part")
+    part_meta = path.with_name(f".{path.name}.part.json")
+
+    request_headers = dict(headers or {})
+    offset = 0
+    meta = _read_json(part_meta)
+    if part.exists() and meta is not None and meta.get("url") == url:
+        validator = meta.get("etag") or meta.get("last_modified")
+        offset = part.stat().st_size
+        if validator and offset:
+            request_headers["Range"] = f"bytes={offset}-"
+            request_headers["If-Range"] = validator
+        else:
+            offset = 0
+
+    try:
+        response = opener(
+            Request(url, headers=request_headers), timeout=timeout
+        )
+    except HTTPError as e:
+        if e.code == 304:
+            part.unlink(missing_ok=True)
+            part_meta.unlink(missing_ok=True)
+            return None
+
+        # The partial download is no use to the server; start over
+        if e.code == 416 and offset:
+            part.unlink(missing_ok=True)
+            part_meta.unlink(missing_ok=True)
+            return download_file(
+                url, path, headers, timeout, chunk_size, opener
+            )
+
+        raise
+
+    with response:
+        resumed = False
+        if response.status == 206:
+            match = CONTENT_RANGE.fullmatch(
+                response.headers.get("Content-Range", "")
+            )
+            resumed = match is not None and int(match.group(1)) == offset
+            if not resumed:
+                raise URLError(f"Unexpected range from {url}")
+
+        # The validator is recorded first, so that the download can resume
+        # from wherever it stops
+        part.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(
+            part_meta,
+            json.dumps(
+                {
+                    "url": url,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                }
+            ).encode(),
+        )
+        with part.open("ab" if resumed else "wb") as f:
+            for chunk in iter_response(response, chunk_size):
+                f.write(chunk)
+
+        expected = _expected_size(response, offset)
+        if expected is not None and part.stat().st_size != expected:
+            raise URLError(
+                f"Download of {url} stopped at {part.stat().st_size} of "
+                f"{expected} bytes; run again to resume"
+            )
+
+    os.replace(part, path)
+    part_meta.unlink(missing_ok=True)
+
+    return response.headers
+
+
+class ConnectionPool:
+    """Keep-alive connections, shared by the requests of each thread.
+
+    urlopen opens a new connection, and for HTTPS does a new TLS handshake,
+    for every request. A pool keeps one connection per host in each thread
+    and sends that thread's requests over it. open takes the place of
+    urlopen: redirects are followed, and error statuses raise HTTPError.
+    """
+
+    def __init__(self, timeout=30, max_redirects=5):
+        """Initialize the object.
+
+        Parameters
+        ----------
+        timeout : float
+            Seconds to wait for a server
+        max_redirects : int
+            Redirects to follow before giving up
+        """
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _connection(self, scheme, netloc):
+        """Get this thread's connection to a host.
+
+        Parameters
+        ----------
+        scheme : str
+            http or https
+        netloc : str
+            Host and port
+
+        Returns
+        -------
+        http.client.HTTPConnection
+            The connection. It is closed first if the last response on it
+            wasn't read to the end, since the rest would be read as the
+            next response
+        """
+        slots = self._local.__dict__.setdefault("slots", {})
+        slot = slots.get((scheme, netloc))
+        if slot is None:
+            if scheme == "https":
+                connection = http.client.HTTPSConnection(
+                    netloc, timeout=self.timeout
+                )
+            elif scheme == "http":
+                connection = http.client.HTTPConnection(
+                    netloc, timeout=self.timeout
+                )
+            else:
+                raise URLError(f"Unsupported scheme: {scheme}")
+
+            slot = slots[(scheme, netloc)] = [connection, None]
+            with self._lock:
+                self._connections.append(connection)
+
+        connection, last = slot
+        if last is not None and last.length != 0:
+            connection.close()
+
+        return connection
+
+    def _request(self, url, headers, timeout):
+        """Send one request.
+
+        Parameters
+        ----------
+        url : str
+            The URL
+        headers : dict
+            Request headers
+        timeout : float or None
+            Seconds to wait for the server
+
+        Returns
+        -------
+        http.client.HTTPResponse
+            The response
+        """
+        parts = urlsplit(url)
+        target = urlunsplit(("", "", parts.path or "/", parts.query, ""))
+        connection = self._connection(parts.scheme, parts.netloc)
+        if timeout is not None:
+            connection.timeout = timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(timeout)
+
+        # A reused connection may have been closed by the server while it
+        # sat idle; that only shows when it's used, so retry once
+        reused = connection.sock is not None
+        try:
+            connection.request("GET", target, headers=headers)
+            response = connection.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionError):
+            if not reused:
+                raise
+            connection.close()
+            connection.request("GET", target, headers=headers)
+            response = connection.getresponse()
+
+        slots = self._local.slots
+        slots[(parts.scheme, parts.netloc)][1] = response
+
+        return response
+
+    def open(self, request, timeout=None):
+        """Send a GET request over a pooled connection.
+
+        Parameters
+        ----------
+        request : urllib.request.Request or str
+            The request
+        timeout : float, optional
+            Seconds to wait for the server (defaults to the pool's)
+
+        Returns
+        -------
+        http.client.HTTPResponse
+            The response
+
+        Raises
+        ------
+        HTTPError
+            If the server answers with an error status or 304
+        URLError
+            If the request fails
+        """
+        if isinstance(request, str):
+            request = Request(request)
+
+        url = request.full_url
+        headers = {"User-Agent": USER_AGENT, **request.headers}
+        for _ in range(self.max_redirects + 1):
+            try:
+                response = self._request(url, headers, timeout)
+            except (OSError, http.client.HTTPException) as e:
+                raise URLError(e) from e
+
+            location = response.headers.get("Location")
+            if response.status in REDIRECTS and location:
+                response.read()
+                url = urljoin(url, location)
+                continue
+
+            if response.status >= 300:
+                body = response.read()
+                raise HTTPError(
+                    url,
+                    response.status,
+                    response.reason,
+                    response.headers,
+                    io.BytesIO(body),
+                )
+
+            return response
+
+        raise URLError(f"Too many redirects from {request.full_url}")
+
+    def close(self):
+        """Close every connection."""
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+
+
+class HttpCache:
+    """Cache of downloaded files, revalidated with conditional GETs.
+
+    Entries are keyed by URL. Each stores the response body with its hash
+    and the server's validators (ETag and Last-Modified). A cached URL is
+    requested with If-None-Match/If-Modified-Since, and a 304 reuses the
+    stored body. In offline mode, nothing is requested and only cached
+    bodies are served.
+    """
+
+    def __init__(self, root, offline=False, timeout=30):
+        """Initialize the object.
+
+        Parameters
+        ----------
+        root : Path
+            Directory for the cache
+        offline : bool
+            If True, serve only from the cache
+        timeout : float
+            Seconds to wait for the server
+        """
+        self.root = Path(root)
+        self.offline = offline
+        self.timeout = timeout
+        self.events = []
+
+    def _paths(self, url):
+        """Get the files of a URL's entry.
+
+        Parameters
+        ----------
+        url : str
+            The URL
+
+        Returns
+        -------
+        tuple[Path, Path]
+            Paths to the entry's metadata (.json) and body
+        """
+        key = hashlib.sha256(url.encode()).hexdigest()
+        directory = self.root / key[:2]
+
+        return directory / f"{key}.json", directory / f"{key}.body"
+
+    def _read_entry(self, url):
+        """Read a URL's entry.
+
+        Parameters
+        ----------
+        url : str
+            The URL
+
+        Returns
+        -------
+        dict or None
+            The entry's metadata, or None if the entry is missing or its
+            body doesn't match its hash
+        """
+        meta_path, body_path = self._paths(url)
+        meta = _read_json(meta_path)
+        if meta is None or meta.get("url") != url:
+            return None
+
+        try:
+            with body_path.open("rb") as f:
+                digest = hashlib.file_digest(f, "sha256").hexdigest()
+        except FileNotFoundError:
+            return None
+
+        return meta if digest == meta.get("sha256") else None
+
+    def _write_meta(self, url, digest, size, headers):
+        """Store the metadata of a body that is already in place.
+
+        Parameters
+        ----------
+        url : str
+            The URL
+        digest : str
+            Hex digest of the body
+        size : int
+            Size of the body in bytes
+        headers : email.message.Message
+            Response headers
+        """
+        meta_path, _ = self._paths(url)
+        meta = {
+            "url": url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "sha256": digest,
+            "size": size,
+            "fetched": formatdate(usegmt=True),
+        }
+        atomic_write(meta_path, json.dumps(meta, indent=2).encode())
+
+    def _validators(self, meta):
+        """Get the conditional headers for a cached entry.
+
+        Parameters
+        ----------
+        meta : dict or None
+            The entry's metadata
+
+        Returns
+        -------
+        dict
+            Request headers
+        """
+        headers = {}
+        if meta is None:
+            return headers
+
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        return headers
+
+    def stream(self, url, chunk_size=CHUNK_SIZE, opener=urlopen):
+        """Generate a URL's content in chunks, revalidating a cached copy.
+
+        A full response is stored as it streams through. If the consumer
+        stops early, the partial body is discarded and the cache is left as
+        it was.
+
+        Parameters
+        ----------
+        url : str
+            The URL
+        chunk_size : int
+            Bytes per chunk
+        opener : callable
+            Sends the request: urlopen, or a ConnectionPool's open
+
+        Yields
+        ------
+        bytes
+            A chunk of the content
+
+        Raises
+        ------
+        URLError
+            If the request fails, or the URL isn't cached in offline mode
+        """
+        meta = self._read_entry(url)
+        _, body_path = self._paths(url)
+        if self.offline:
+            if meta is None:
+                raise URLError(f"{url} is not cached (offline)")
+
+            self.events.append((url, "offline"))
+            yield from iter_file(body_path, chunk_size)
+            return
+
+        request = Request(url, headers=self._validators(meta))
+        try:
+            response = opener(request, timeout=self.timeout)
+        except HTTPError as e:
+            if e.code != 304 or meta is None:
+                raise
+
+            self.events.append((url, "revalidated"))
+            yield from iter_file(body_path, chunk_size)
+            return
+
+        body_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(
+            dir=body_path.parent, prefix=f".{body_path.name}."
+        )
+        digest = hashlib.sha256()
+        size = 0
+        complete = False
+        try:
+            with response, os.fdopen(fd, "wb") as f:
+                for chunk in iter_response(response, chunk_size):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+                    yield chunk
+
+            os.replace(tmp, body_path)
+            complete = True
+        finally:
+            if not complete:
+                Path(tmp).unlink(missing_ok=True)
+
+        self._write_meta(url, digest.hexdigest(), size, response.headers)
+        self.events.append((url, "downloaded"))
+
+    def fetch(self, url):
+        """Get a URL's content, revalidating a cached copy.
+
+        Parameters
+        ----------
+        url : str
+            The URL
+
+        Returns
+        -------
+        bytes
+            The content
+
+        Raises
+        ------
+        URLError
+            If the request fails, or the URL isn't cached in offline mode
+        """
+        return b"".join(self.stream(url))
+
+    def download(self, url, path, chunk_size=CHUNK_SIZE, opener=urlopen):
+        """Download a URL to a file, revalidating a cached copy.
+
+        A new download streams to the file as download_file does, resuming
+        a partial one, and is then copied into the cache. A cached copy is
+        written to the file atomically.
+
+        Parameters
+        ----------
+        url : str
+            The URL
+        path : Path
+            Destination file
+        chunk_size : int
+            Bytes per chunk
+        opener : callable
+            Sends the request: urlopen, or a ConnectionPool's open
+
+        Raises
+        ------
+        URLError
+            If the request fails, or the URL isn't cached in offline mode
+        """
+        path = Path(path)
+        meta = self._read_entry(url)
+        _, body_path = self._paths(url)
+        if self.offline and meta is None:
+            raise URLError(f"{url} is not cached (offline)")
+
+        headers = None
+        if not self.offline:
+            headers = download_file(
+                url,
+                path,
+                headers=self._validators(meta),
+                timeout=self.timeout,
+                chunk_size=chunk_size,
+                opener=opener,
+            )
+
+        if headers is None:
+            self.events.append(
+                (url, "offline" if self.offline else "revalidated")
+            )
+            atomic_write_chunks(path, iter_file(body_path, chunk_size))
+            return
+
+        digest = atomic_write_chunks(body_path, iter_file(path, chunk_size))
+        self._write_meta(url, digest, path.stat().st_size, headers)
+        self.events.append((url, "downloaded"))
+
+    @property
+    def hits(self):
+        """Count the responses served from the cache."""
+        return sum(status != "downloaded" for _, status in self.events)
+
+    @property
+    def misses(self):
+        """Count the downloaded responses."""
+        return len(self.events) - self.hits
@@ -0,0 +1,228 @@
+import json
+import os
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+from output import atomic_write
+
+
+def _labels(**labels):
+    """Format Prometheus labels.
+
+    Parameters
+    ----------
+    labels : dict
+        Label values; None values are left out
+
+    Returns
+    -------
+    str
+        The labels in braces
+    """
+    pairs = []
+    for key, value in labels.items():
+        if value is None:
+            continue
+
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        value = value.replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+
+    return "{" + ",".join(pairs) + "}"
+
+
+class BuildMetrics:
+    """Metrics of one build run.
+
+    Each syllabus a command builds is recorded with its time, output size,
+    and status. Runs are appended to a JSON lines log, so that build times
+    can be charted across terms, and the latest run of each command is
+    written as a Prometheus textfile (for node_exporter's textfile
+    collector).
+    """
+
+    log_name = "builds.jsonl"
+
+    def __init__(self, command):
+        """Initialize the object.
+
+        Parameters
+        ----------
+        command : str
+            The CLI command of the run
+        """
+        self.command = command
+        self.started = datetime.now(timezone.utc)
+        self.run = f"{self.started:%Y%m%dT%H%M%SZ}-{os.getpid()}"
+        self.records = []
+        self.caches = {}
+        self._start = time.perf_counter()
+
+    def record(
+        self,
+        syllabus,
+        stage,
+        status,
+        seconds=None,
+        size=None,
+        error=None,
+        fmt=None,
+    ):
+        """Record a syllabus built in the run.
+
+        Parameters
+        ----------
+        syllabus : str
+            Name of the syllabus
+        stage : str
+            Build stage: schedule, compile, or pandoc
+        status : str
+            Outcome: built, unchanged, skipped, or failed
+        seconds : float, optional
+            Time the stage took
+        size : int, optional
+            Size of the output in bytes
+        error : str, optional
+            Why the stage failed
+        fmt : str, optional
+            Output format
+        """
+        self.records.append(
+            {
+                "syllabus": syllabus,
+                "stage": stage,
+                "format": fmt,
+                "status": status,
+                "seconds": seconds,
+                "bytes": size,
+                "error": error,
+            }
+        )
+
+    def cache(self, name, hits, misses):
+        """Add to the hit and miss counts of a cache.
+
+        Parameters
+        ----------
+        name : str
+            Name of the cache
+        hits : int
+            Number of lookups that reused an entry
+        misses : int
+            Number of lookups that had to build the entry
+        """
+        counts = self.caches.setdefault(name, {"hits": 0, "misses": 0})
+        counts["hits"] += hits
+        counts["misses"] += misses
+
+    def summary(self):
+        """Summarize the run.
+
+        Returns
+        -------
+        dict
+            Run duration, syllabus counts by status, and cache counts
+        """
+        statuses = Counter(record["status"] for record in self.records)
+        return {
+            "seconds": time.perf_counter() - self._start,
+            "statuses": dict(sorted(statuses.items())),
+            "caches": self.caches,
+        }
+
+    def to_jsonl(self):
+        """Format the run as JSON lines.
+
+        Returns
+        -------
+        str
+            One line per record, then a line for the run
+        """
+        common = {
+            "run": self.run,
+            "time": self.started.isoformat(timespec="seconds"),
+            "command": self.command,
+        }
+        lines = [
+            json.dumps({**common, "kind": "syllabus", **record})
+            for record in self.records
+        ]
+        lines.append(json.dumps({**common, "kind": "run", **self.summary()}))
+
+        return "".join(f"{line}\n" for line in lines)
+
+    def to_prometheus(self):
+        """Format the run in the Prometheus text format.
+
+        Returns
+        -------
+        str
+            The metrics
+        """
+        summary = self.summary()
+        metrics = {
+            "syllabus_stage_seconds": ("Time a build stage took", []),
+            "syllabus_output_bytes": ("Size of a build output", []),
+            "syllabus_stage_status": ("Outcome of a build stage", []),
+            "syllabus_run_seconds": ("Duration of a build run", []),
+            "syllabus_run_timestamp_seconds": ("Start of a build run", []),
+            "syllabus_run_syllabi": ("Syllabi in a run, by outcome", []),
+            "syllabus_cache_hits": ("Cache lookups that reused an entry", []),
+            "syllabus_cache_misses": ("Cache lookups that built an entry", []),
+        }
+
+        def add(name, value, **labels):
+            labels = _labels(command=self.command, **labels)
+            metrics[name][1].append(f"{name}{labels} {value}")
+
+        for record in self.records:
+            labels = {
+                "syllabus": record["syllabus"],
+                "stage": record["stage"],
+                "format": record["format"],
+            }
+            if record["seconds"] is not None:
+                add("syllabus_stage_seconds", record["seconds"], **labels)
+            if record["bytes"] is not None:
+                add("syllabus_output_bytes", record["bytes"], **labels)
+            add("syllabus_stage_status", 1, status=record["status"], **labels)
+
+        add("syllabus_run_seconds", summary["seconds"])
+        add("syllabus_run_timestamp_seconds", self.started.timestamp())
+        for status, count in summary["statuses"].items():
+            add("syllabus_run_syllabi", count, status=status)
+        for cache, counts in self.caches.items():
+            add("syllabus_cache_hits", counts["hits"], cache=cache)
+            add("syllabus_cache_misses", counts["misses"], cache=cache)
+
+        lines = []
+        for name, (help, samples) in metrics.items():
+            if not samples:
+                continue
+
+            lines.extend([f"# HELP {name} {help}", f"# TYPE {name} gauge"])
+            lines.extend(samples)
+
+        return "".join(f"{line}\n" for line in lines)
+
+    def save(self, directory):
+        """Append the run to the log and replace the command's textfile.
+
+        Parameters
+        ----------
+        directory : Path
+            Directory for the log (builds.jsonl) and the textfiles
+            (<command>.prom)
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        with (directory / self.log_name).open("a") as f:
+            f.write(self.to_jsonl())
+
+        # The textfile collector may read at any moment, so the file is
+        # replaced whole
+        prom_path = directory / f"{self.command}.prom"
+        atomic_write(prom_path, self.to_prometheus().encode())
@@ -0,0 +1,234 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+
+def _create_temp(directory, prefix):
+    """Create a uniquely named temporary file for writing.
+
+    Unlike mkstemp, which makes files readable only by their owner, the
+    file gets the permissions of any other new file: the kernel applies the
+    process umask to mode 0o666, so the umask is never read or changed.
+
+    Parameters
+    ----------
+    directory : Path
+        Directory for the file
+    prefix : str
+        Start of the file's name
+
+    Returns
+    -------
+    tuple[int, str]
+        File descriptor and path of the file
+    """
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+    while True:
+        tmp = os.path.join(directory, f"{prefix}{os.urandom(6).hex()}")
+        try:
+            return os.open(tmp, flags, 0o666), tmp
+        except FileExistsError:
+            continue
+
+
+def atomic_write(path, data):
+    """Write bytes to a file through a temporary file and a rename.
+
+    Parameters
+    ----------
+    path : Path
+        Path to the file
+    data : bytes
+        Contents of the file
+    """
+    atomic_write_chunks(path, [data])
+
+
+def atomic_write_chunks(path, chunks, keep=None):
+    """Stream bytes to a file through a temporary file and a rename.
+
+    Parameters
+    ----------
+    path : Path
+        Path to the file
+    chunks : iterable[bytes]
+        Contents of the file, in chunks
+    keep : callable, optional
+        Called with the hash of the contents once they are written. If it
+        returns False, the temporary file is discarded and the file is left
+        as it was
+
+    Returns
+    -------
+    str
+        Hex digest of the contents
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    digest = hashlib.sha256()
+    fd, tmp = _create_temp(path.parent, f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                digest.update(chunk)
+                f.write(chunk)
+
+        if keep is None or keep(digest.hexdigest()):
+            os.replace(tmp, path)
+        else:
+            os.unlink(tmp)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+    return digest.hexdigest()
+
+
+class OutputWriter:
+    """Writes build outputs, leaving files with unchanged content alone.
+
+    A manifest in the output directory records the hash, size, and mtime of
+    each file this writer produced. If new content hashes the same as the
+    file on disk, the file is not touched, so its mtime stays put and
+    anything that depends on it (e.g. pandoc runs in make) is not rebuilt.
+    """
+
+    manifest_name = ".manifest.json"
+
+    def __init__(self, directory):
+        """Initialize the object.
+
+        Parameters
+        ----------
+        directory : Path
+            Directory for the outputs and the manifest
+        """
+        self.directory = Path(directory)
+        self.manifest_path = self.directory / self.manifest_name
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        """Read the manifest.
+
+        Returns
+        -------
+        dict
+            File records, by file name
+        """
+        try:
+            with self.manifest_path.open() as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _is_current(self, path, digest):
+        """Check whether a file already has the content with this digest.
+
+        Parameters
+        ----------
+        path : Path
+            Path to the file
+        digest : str
+            Hash of the new content
+
+        Returns
+        -------
+        bool
+            If True, the file doesn't need to be written
+        """
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return False
+
+        record = self.manifest.get(path.name)
+        if record and (record["size"], record["mtime_ns"]) == (
+            st.st_size,
+            st.st_mtime_ns,
+        ):
+            return record["sha256"] == digest
+
+        # Without a matching record, hash what's on disk
+        return hashlib.sha256(path.read_bytes()).hexdigest() == digest
+
+    def write(self, name, text):
+        """Write an output file unless its content is unchanged.
+
+        Parameters
+        ----------
+        name : str
+            Name of the file in the output directory
+        text : str
+            Contents of the file
+
+        Returns
+        -------
+        bool
+            If True, the file was written
+        """
+        path = self.directory / name
+        data = text.encode()
+        digest = hashlib.sha256(data).hexdigest()
+
+        written = not self._is_current(path, digest)
+        if written:
+            atomic_write(path, data)
+
+        self._record(path, digest)
+        return written
+
+    def write_chunks(self, name, chunks):
+        """Stream an output file, unless its content is unchanged.
+
+        The content is hashed as it is written to a temporary file, which
+        replaces the file only if the hash differs.
+
+        Parameters
+        ----------
+        name : str
+            Name of the file in the output directory
+        chunks : iterable[str]
+            Contents of the file, in chunks
+
+        Returns
+        -------
+        bool
+            If True, the file was written
+        """
+        path = self.directory / name
+        written = False
+
+        def keep(digest):
+            nonlocal written
+            written = not self._is_current(path, digest)
+            return written
+
+        encoded = (chunk.encode() for chunk in chunks)
+        digest = atomic_write_chunks(path, encoded, keep=keep)
+
+        self._record(path, digest)
+        return written
+
+    def _record(self, path, digest):
+        """Add a file to the manifest.
+
+        Parameters
+        ----------
+        path : Path
+            Path to the file
+        digest : str
+            Hash of its contents
+        """
+        st = path.stat()
+        self.manifest[path.name] = {
+            "sha256": digest,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+        }
+
+    def save(self):
+        """Write the manifest."""
+        data = json.dumps(self.manifest, indent=2, sort_keys=True)
+        atomic_write(self.manifest_path, data.encode())
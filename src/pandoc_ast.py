@@ -0,0 +1,293 @@
+import json
+
+# Relative widths that filters/tables.lua gives table columns in docx: every
+# column but the last is narrow, and the last takes up the rest
+NARROW_COLUMN = 0.2
+WIDE_COLUMN = 1.0
+
+
+def markdown_to_ast(text):
+    """Parse markdown into a pandoc JSON AST.
+
+    Parameters
+    ----------
+    text : str
+        Markdown
+
+    Returns
+    -------
+    dict
+        The document AST
+
+    Raises
+    ------
+    subprocess.CalledProcessError
+        If pandoc fails
+    """
+    # Only JSON output runs pandoc, so markdown builds skip this import
+    import subprocess
+
+    result = subprocess.run(
+        ["pandoc", "-f", "markdown", "-t", "json"],
+        input=text,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    return json.loads(result.stdout)
+
+
+def _walk(node, func):
+    """Apply a function to every element of an AST, bottom up.
+
+    The walk builds a new tree, so the function may modify the elements it
+    receives without touching the original.
+
+    Parameters
+    ----------
+    node : any
+        An AST node
+    func : callable
+        Function that takes and returns an element (a dict with a "t" key)
+
+    Returns
+    -------
+    any
+        The transformed node
+    """
+    if isinstance(node, list):
+        return [_walk(item, func) for item in node]
+
+    if isinstance(node, dict):
+        node = {key: _walk(val, func) for key, val in node.items()}
+        if "t" in node:
+            node = func(node)
+
+    return node
+
+
+def _docx_element(elem):
+    """Apply the docx layout rules to a single element.
+
+    Headers and paragraphs end with a line break (filters/linebreaks.lua).
+    As in the filter, which builds a new Header from the level and content
+    alone, headers lose their attributes (identifier and classes). Table
+    columns without a set width get a relative one (filters/tables.lua).
+
+    Parameters
+    ----------
+    elem : dict
+        An AST element
+
+    Returns
+    -------
+    dict
+        The element
+    """
+    match elem["t"]:
+        case "Para":
+            elem["c"].append({"t": "LineBreak"})
+        case "Header":
+            level, _, inlines = elem["c"]
+            inlines.append({"t": "LineBreak"})
+            elem["c"] = [level, ["", [], []], inlines]
+        case "Table":
+            colspecs = elem["c"][2]
+            for i, (align, width) in enumerate(colspecs):
+                if width["t"] != "ColWidthDefault":
+                    continue
+
+                is_last = i == len(colspecs) - 1
+                rel = WIDE_COLUMN if is_last else NARROW_COLUMN
+                colspecs[i] = [align, {"t": "ColWidth", "c": rel}]
+
+    return elem
+
+
+def apply_docx_layout(doc):
+    """Apply the docx-only transforms of the Lua filters to an AST.
+
+    Parameters
+    ----------
+    doc : dict
+        The document AST, which is left unchanged
+
+    Returns
+    -------
+    dict
+        A transformed copy of the AST
+    """
+    return {**doc, "blocks": _walk(doc["blocks"], _docx_element)}
+
+
+def _stringify(inlines):
+    """Get the plain text of inline elements, as pandoc's stringify does.
+
+    Parameters
+    ----------
+    inlines : list[dict]
+        Inline elements
+
+    Returns
+    -------
+    str
+        The text
+    """
+    parts = []
+    for inline in inlines:
+        kind, content = inline["t"], inline.get("c")
+        match kind:
+            case "Str":
+                parts.append(content)
+            case "Space" | "SoftBreak" | "LineBreak":
+                parts.append(" ")
+            case "Code" | "Math":
+                parts.append(content[1])
+            case "Quoted" | "Cite" | "Span" | "Link" | "Image":
+                parts.append(_stringify(content[1]))
+            case "Note" | "RawInline":
+                continue
+            case _:
+                parts.append(_stringify(content))
+
+    return "".join(parts)
+
+
+def auto_identifier(inlines):
+    """Derive the identifier pandoc gives a header from its text.
+
+    This is pandoc's auto_identifiers extension: keep letters, numbers,
+    spaces, and ``_-.``, lowercase, join the words with hyphens, and drop
+    everything before the first letter.
+
+    Parameters
+    ----------
+    inlines : list[dict]
+        The header's inline elements
+
+    Returns
+    -------
+    str
+        The identifier, before any numbering for uniqueness
+    """
+    text = "".join(
+        char
+        for char in _stringify(inlines).lower()
+        if char.isspace() or char.isalnum() or char in "_-."
+    )
+    ident = "-".join(text.split())
+    for i, char in enumerate(ident):
+        if char.isalpha():
+            return ident[i:]
+
+    return ""
+
+
+def _unique(base, used):
+    """Number an identifier until it is unused, as pandoc does.
+
+    Parameters
+    ----------
+    base : str
+        The identifier pandoc derives from a header's text
+    used : set[str]
+        Identifiers already taken
+
+    Returns
+    -------
+    str
+        The first of ``base``, ``base-1``, ``base-2``, ... not in used
+    """
+    base = base or "section"
+    ident, n = base, 0
+    while ident in used:
+        n += 1
+        ident = f"{base}-{n}"
+
+    return ident
+
+
+def _renumber(block, local, used):
+    """Number the header identifiers of a block for the whole document.
+
+    A parse of part of a document numbers repeated headers among that part
+    alone. Replaying that numbering tells the identifiers pandoc generated
+    (which are numbered again against the whole document) from explicit
+    ones (which pandoc keeps, as it keeps the identifiers of other
+    elements).
+
+    Parameters
+    ----------
+    block : dict
+        A block of the part
+    local : set[str]
+        Identifiers taken so far in the part's own parse
+    used : set[str]
+        Identifiers taken so far in the whole document
+
+    Returns
+    -------
+    dict
+        The block, copied
+    """
+
+    def renumber(elem):
+        if elem["t"] != "Header" or not elem["c"][1][0]:
+            return elem
+
+        level, (ident, *attr), inlines = elem["c"]
+        base = auto_identifier(inlines)
+        generated = ident == _unique(base, local)
+        local.add(ident)
+        if generated:
+            ident = _unique(base, used)
+        used.add(ident)
+        elem["c"] = [level, [ident, *attr], inlines]
+
+        return elem
+
+    # The walk visits headers in document order, since they never nest
+    return _walk(block, renumber)
+
+
+def splice_blocks(blocks, fragments, marker):
+    """Replace marker divs with the blocks of prerendered fragments.
+
+    Fragments parsed apart from the rest of a document can't see its
+    headers, so header identifiers are numbered again the way pandoc
+    numbers them in a single parse (``policies``, ``policies-1``, ...),
+    nested headers included.
+
+    Parameters
+    ----------
+    blocks : list[dict]
+        Top-level blocks of a document
+    fragments : list[list[dict]]
+        Blocks of each fragment
+    marker : str
+        Identifier prefix of the marker divs, which are numbered by fragment
+
+    Returns
+    -------
+    list[dict]
+        The spliced blocks, copied rather than modified
+    """
+    used = set()
+    local = set()
+    spliced = []
+    for block in blocks:
+        if block["t"] == "Div":
+            ident = block["c"][0][0]
+            prefix, _, num = ident.rpartition("-")
+            if prefix == marker and num.isdigit():
+                fragment_local = set()
+                spliced.extend(
+                    _renumber(child, fragment_local, used)
+                    for child in fragments[int(num)]
+                )
+                continue
+
+        spliced.append(_renumber(block, local, used))
+
+    return spliced
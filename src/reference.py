@@ -1,10 +1,20 @@
-import shutil
+import codecs
+import hashlib
+import json
+import os
 import sys
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
+from fnmatch import fnmatch
 from html.parser import HTMLParser
 from pathlib import Path
 from urllib.error import URLError
 from urllib.parse import urljoin
-from urllib.request import urlretrieve
+from urllib.request import urlopen
+
+from http_cache import ConnectionPool, download_file, iter_response
+from output import atomic_write
 
 SENATE_PAGE = "https://facultysenate.tamu.edu"
 MSR_PAGE = urljoin(
@@ -12,13 +22,169 @@ MSR_PAGE = urljoin(
 )
 
 
+def stream(url, cache=None, opener=urlopen):
+    """Download a URL in chunks, as they arrive.
+
+    Parameters
+    ----------
+    url : str
+        The URL
+    cache : HttpCache, optional
+        Cache of downloads, revalidated with conditional GETs
+    opener : callable
+        Sends the request: urlopen, or a ConnectionPool's open
+
+    Yields
+    ------
+    bytes
+        A chunk of the content
+
+    Raises
+    ------
+    URLError
+        If the request fails
+    """
+    if cache is not None:
+        yield from cache.stream(url, opener=opener)
+        return
+
+    with opener(url) as response:
+        yield from iter_response(response)
+
+
+def download(url, path, cache=None, opener=urlopen):
+    """Download a URL to a file, resuming a partial download.
+
+    Parameters
+    ----------
+    url : str
+        The URL
+    path : Path
+        Destination file
+    cache : HttpCache, optional
+        Cache of downloads, revalidated with conditional GETs
+    opener : callable
+        Sends the request: urlopen, or a ConnectionPool's open
+
+    Raises
+    ------
+    URLError
+        If the request fails or the download is cut short
+    """
+    if cache is not None:
+        cache.download(url, path, opener=opener)
+    else:
+        download_file(url, path, opener=opener)
+
+
+def verify_docx(path):
+    """Check that a download is a whole .docx file.
+
+    The download's size was checked against Content-Length as it was
+    written. Here, every part of the .docx (a ZIP archive) is checked
+    against its CRC, which catches truncation and HTML error pages served
+    in place of the file.
+
+    Parameters
+    ----------
+    path : Path
+        Path to the file
+
+    Returns
+    -------
+    dict
+        Size and SHA-256 of the file
+
+    Raises
+    ------
+    ValueError
+        If the file isn't a valid .docx
+    """
+    try:
+        with zipfile.ZipFile(path) as docx:
+            bad = docx.testzip()
+            names = docx.namelist()
+    except zipfile.BadZipFile as e:
+        raise ValueError(f"Not a .docx file: {e}") from e
+
+    if bad is not None:
+        raise ValueError(f"Corrupt .docx file: {bad} fails its CRC")
+    if "word/document.xml" not in names:
+        raise ValueError("Not a .docx file: no word/document.xml")
+
+    with path.open("rb") as f:
+        digest = hashlib.file_digest(f, "sha256").hexdigest()
+
+    return {"size": path.stat().st_size, "sha256": digest}
+
+
+def fetch_docx(url, path, cache=None, opener=urlopen):
+    """Download a .docx file, verifying it before it replaces the file.
+
+    Parameters
+    ----------
+    url : str
+        The URL
+    path : Path
+        Destination file
+    cache : HttpCache, optional
+        Cache of downloads, revalidated with conditional GETs
+    opener : callable
+        Sends the request: urlopen, or a ConnectionPool's open
+
+    Returns
+    -------
+    dict
+        Size and SHA-256 of the file
+
+    Raises
+    ------
+    URLError
+        If the request fails or the download is cut short
+    ValueError
+        If the download isn't a valid .docx; the file is left as it was
+    """
+    path = Path(path)
+    staged = path.with_name(f".{path.name}.download")
+    download(url, staged, cache=cache, opener=opener)
+    try:
+        record = verify_docx(staged)
+    except ValueError:
+        staged.unlink()
+        raise
+
+    os.replace(staged, path)
+
+    return record
+
+
 class MSRParser(HTMLParser):
-    """Parser for the Minimum Syllabus Requirements page."""
+    """Parser for the Minimum Syllabus Requirements page.
 
-    def __init__(self):
-        """Initialize the parser."""
+    Links are kept in the order the page lists them, so that the numbers
+    shown in the prompt, and those passed as an index, stay the same from
+    run to run.
+    """
+
+    manifest_name = "manifest.json"
+
+    def __init__(self, match=None, index=None):
+        """Initialize the parser.
+
+        Parameters
+        ----------
+        match : str, optional
+            Glob for the name of the file to download (e.g. "*.docx"). The
+            first link that matches is stored in found
+        index : int, optional
+            Number of the file to download, counting from 1 in page order.
+            That link is stored in found
+        """
         super().__init__()
-        self.links = set()
+        self.match = match
+        self.index = index
+        self.links = []
+        self.found = None
 
     def handle_starttag(self, tag, attrs):
         """Store .docx links from hrefs in an HTML document.
@@ -36,7 +202,30 @@ class MSRParser(HTMLParser):
         for attr, val in attrs:
             if attr == "href" and val.endswith("docx"):
                 link = Path(val)
-                self.links.add(link)
+                if link in self.links:
+                    continue
+
+                self.links.append(link)
+                if self.found is not None:
+                    continue
+                if self.index is not None:
+                    if len(self.links) == self.index:
+                        self.found = link
+                elif self.match is not None and fnmatch(link.name, self.match):
+                    self.found = link
+
+    def matching(self):
+        """Get the links whose names match the glob.
+
+        Returns
+        -------
+        list[Path]
+            The links, in page order (all of them, if there is no glob)
+        """
+        if self.match is None:
+            return list(self.links)
+
+        return [link for link in self.links if fnmatch(link.name, self.match)]
 
     def _prompt_user(self):
         """Prompt a user to download a .docx file.
@@ -82,51 +271,232 @@ class MSRParser(HTMLParser):
             print("\nDownload cancelled")
             sys.exit(0)
 
-    def download(self, filename=None):
+    def download(self, filename=None, cache=None, opener=urlopen):
         """Download a .docx file.
 
+        The matched file is downloaded if there is one; otherwise, the user
+        is prompted to select a file.
+
         Parameters
         ----------
         filename : Path, optional
             Name of the output file
+        cache : HttpCache, optional
+            Cache of downloads
+        opener : callable
+            Sends the request: urlopen, or a ConnectionPool's open
 
         Raises
         ------
         SystemExit
             If download fails or user cancels during selection
         """
-        select = self._prompt_user()
-        available = list(self.links)
-        request = urljoin(SENATE_PAGE, str(available[select]))
-        path = None
+        if self.found is not None:
+            link = self.found
+        elif not sys.stdin.isatty():
+            # Nobody is there to answer a prompt (e.g. on a build machine)
+            print(
+                "No file selected; pass --match or --index", file=sys.stderr
+            )
+            sys.exit(1)
+        else:
+            link = self.links[self._prompt_user()]
+        request = urljoin(SENATE_PAGE, str(link))
 
+        filename = Path(link.name if not filename else filename)
         try:
-            path, headers = urlretrieve(request)
-            filename = available[select].name if not filename else filename
-            shutil.move(path, filename)
-            print(f"Successfully downloaded: {available[select].name}")
-
-        except URLError as e:
+            fetch_docx(request, filename, cache=cache, opener=opener)
+        except (URLError, ValueError) as e:
             print(f"Download failed: {e}\nRequested: {request}")
             sys.exit(1)
 
-        finally:
-            if path:
-                Path(path).unlink(missing_ok=True)
+        print(f"Successfully downloaded: {link.name}")
+
+    def _download_one(self, link, directory, cache, opener):
+        """Download and verify one .docx file into a directory.
+
+        Parameters
+        ----------
+        link : Path
+            Link to the file
+        directory : Path
+            Output directory
+        cache : HttpCache or None
+            Cache of downloads
+        opener : callable
+            Sends the request
+
+        Returns
+        -------
+        dict
+            The file's manifest record
+        """
+        url = urljoin(SENATE_PAGE, str(link))
+        record = fetch_docx(
+            url, directory / link.name, cache=cache, opener=opener
+        )
+
+        return {"url": url, **record}
+
+    def download_all(self, directory, cache=None, opener=urlopen, jobs=4):
+        """Download every matching .docx file at once.
+
+        Files are fetched by a bounded pool of threads and verified. A
+        manifest in the directory lists the URL, size, and hash of each
+        file on the page; a file that failed keeps its record from an
+        earlier run, if it had one.
+
+        Parameters
+        ----------
+        directory : Path
+            Output directory
+        cache : HttpCache, optional
+            Cache of downloads
+        opener : callable
+            Sends the requests: urlopen, or a ConnectionPool's open
+        jobs : int
+            Maximum number of downloads at once
+
+        Raises
+        ------
+        SystemExit
+            If no file matches, or any download fails
+        """
+        links = self.matching()
+        if not links:
+            print("No .docx files found", file=sys.stderr)
+            sys.exit(1)
+
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        manifest_path = directory / self.manifest_name
+        try:
+            previous = json.loads(manifest_path.read_text())["files"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            previous = {}
+
+        files = {}
+        failures = []
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = {
+                executor.submit(
+                    self._download_one, link, directory, cache, opener
+                ): link.name
+                for link in links
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    files[name] = future.result()
+                except (URLError, ValueError) as e:
+                    failures.append(name)
+                    print(f"Download failed: {name}: {e}", file=sys.stderr)
+                    if name in previous:
+                        files[name] = previous[name]
+                    continue
 
+                print(f"Successfully downloaded: {directory / name}")
 
-def get_reference_docx(filename):
+        manifest = {
+            "source": MSR_PAGE,
+            "files": dict(sorted(files.items())),
+        }
+        atomic_write(manifest_path, json.dumps(manifest, indent=2).encode())
+
+        if failures:
+            sys.exit(1)
+
+
+def read_page(parser, cache=None, opener=urlopen, stop=True):
+    """Feed the requirements page to a parser as it arrives.
+
+    Parameters
+    ----------
+    parser : MSRParser
+        The parser
+    cache : HttpCache, optional
+        Cache of downloads
+    opener : callable
+        Sends the request: urlopen, or a ConnectionPool's open
+    stop : bool
+        If True, stop reading once the parser has found its file
+
+    Raises
+    ------
+    SystemExit
+        If the requirements page can't be fetched
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    try:
+        with closing(stream(MSR_PAGE, cache=cache, opener=opener)) as chunks:
+            for chunk in chunks:
+                parser.feed(decoder.decode(chunk))
+                if stop and parser.found is not None:
+                    return
+
+            parser.feed(decoder.decode(b"", final=True))
+            parser.close()
+    except URLError as e:
+        print(f"Could not fetch {MSR_PAGE}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+def get_reference_docx(
+    filename=None,
+    cache=None,
+    match=None,
+    index=None,
+    directory=None,
+    jobs=4,
+):
     """Download reference .docx file.
 
+    The requirements page is parsed as it arrives. With a match or an
+    index, the rest of the page isn't downloaded once the file is found.
+    All requests share keep-alive connections.
+
     Parameters
     ----------
-    filename : Path
+    filename : Path, optional
         Name of the output file
+    cache : HttpCache, optional
+        Cache of downloads. Unchanged files are served from the cache after
+        the server confirms them with a 304
+    match : str, optional
+        Glob for the name of the file to download, instead of prompting.
+        With a directory, only the files that match are downloaded
+    index : int, optional
+        Number of the file to download in page order, instead of prompting
+    directory : Path, optional
+        If given, download every listed file into this directory
+    jobs : int
+        Maximum number of downloads at once, with a directory
+
+    Raises
+    ------
+    SystemExit
+        If the requirements page can't be fetched, or no file matches
     """
-    path, headers = urlretrieve(MSR_PAGE)
-    with open(path, "r") as fin:
-        html = fin.read()
+    timeout = cache.timeout if cache is not None else 30
+    with ConnectionPool(timeout=timeout) as pool:
+        if directory is not None:
+            parser = MSRParser(match=match)
+            read_page(parser, cache=cache, opener=pool.open, stop=False)
+            parser.download_all(
+                directory, cache=cache, opener=pool.open, jobs=jobs
+            )
+            return
+
+        parser = MSRParser(match=match, index=index)
+        read_page(parser, cache=cache, opener=pool.open)
+        if match is not None and parser.found is None:
+            print(f"No .docx file matches {match}", file=sys.stderr)
+            sys.exit(1)
+        if index is not None and parser.found is None:
+            print(
+                f"The page lists only {len(parser.links)} .docx files",
+                file=sys.stderr,
+            )
+            sys.exit(1)
 
-    parser = MSRParser()
-    parser.feed(html)
-    parser.download(filename)
+        parser.download(filename, cache=cache, opener=pool.open)
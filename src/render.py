@@ -0,0 +1,496 @@
+import asyncio
+import base64
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from urllib.request import Request, urlopen
+
+from docx_writer import DocxWriter
+from output import atomic_write
+from pandoc_ast import apply_docx_layout
+
+
+class PandocJob:
+    """A single pandoc conversion of compiled markdown."""
+
+    def __init__(self, source, fmt, output):
+        """Initialize the object.
+
+        Parameters
+        ----------
+        source : Path
+            Compiled markdown
+        fmt : str
+            Output format (docx or html)
+        output : Path
+            Where to write the rendered file
+        """
+        self.source = Path(source)
+        self.fmt = fmt
+        self.output = Path(output)
+
+    @property
+    def name(self):
+        """Label the job in logs."""
+        return f"{self.source.stem}.{self.fmt}"
+
+    def is_stale(self):
+        """Check whether the output is missing or older than its source.
+
+        Returns
+        -------
+        bool
+            If True, the job needs to run
+        """
+        if not self.output.exists():
+            return True
+
+        return self.output.stat().st_mtime_ns < self.source.stat().st_mtime_ns
+
+
+class PandocRunner:
+    """Runs pandoc jobs concurrently.
+
+    Each syllabus is parsed once into a pandoc JSON AST, which is cached on
+    disk and feeds every output format. The docx layout rules of the Lua
+    filters run as a Python pass over the AST, so pandoc itself only reads
+    JSON and writes the output. Jobs run as pandoc subprocesses, or are
+    posted to a running ``pandoc server``, which doesn't pay pandoc's startup
+    cost per document. With a docx writer, docx jobs skip pandoc and patch
+    the reference document directly, falling back to pandoc for documents
+    it can't write.
+    """
+
+    # Formats the server writes. docx needs the reference document, which
+    # lives on this machine
+    server_formats = ("html",)
+
+    def __init__(
+        self,
+        ast_dir,
+        reference_doc=None,
+        concurrency=None,
+        server=None,
+        metrics=None,
+        docx_writer=None,
+    ):
+        """Initialize the object.
+
+        Parameters
+        ----------
+        ast_dir : Path
+            Directory for the cached ASTs (.json)
+        reference_doc : Path, optional
+            Reference .docx for styles
+        concurrency : int, optional
+            Maximum number of jobs at once (defaults to the CPU count)
+        server : str, optional
+            URL of a pandoc server
+        metrics : BuildMetrics, optional
+            Records the time, output size, and status of each pandoc run
+        docx_writer : DocxWriter, optional
+            Writes docx output without pandoc
+        """
+        self.ast_dir = Path(ast_dir)
+        self.reference_doc = reference_doc
+        self.concurrency = concurrency or os.cpu_count() or 1
+        self.server = server
+        self.metrics = metrics
+        self.docx_writer = docx_writer
+        self._asts = {}
+
+    def args(self, job):
+        """Build the pandoc command line for writing a job's output.
+
+        Parameters
+        ----------
+        job : PandocJob
+            The job
+
+        Returns
+        -------
+        list[str]
+            pandoc arguments
+        """
+        args = ["-s", "-f", "json", "-t", job.fmt]
+        if job.fmt == "docx" and self.reference_doc:
+            args.append(f"--reference-doc={self.reference_doc}")
+
+        args.extend(["-o", str(job.output)])
+
+        return args
+
+    async def _stream(self, name, stream):
+        """Print a job's stderr line by line as it arrives.
+
+        Parameters
+        ----------
+        name : str
+            Label for the job
+        stream : asyncio.StreamReader
+            The job's stderr
+        """
+        async for line in stream:
+            text = line.decode(errors="replace").rstrip()
+            print(f"[{name}] {text}", file=sys.stderr)
+
+    async def _pandoc(self, name, args, data):
+        """Run pandoc on some input.
+
+        Parameters
+        ----------
+        name : str
+            Label for the job
+        args : list[str]
+            pandoc arguments
+        data : bytes
+            Input, sent to pandoc's stdin
+
+        Returns
+        -------
+        tuple[int, bytes]
+            pandoc's exit code and stdout
+        """
+        proc = await asyncio.create_subprocess_exec(
+            "pandoc",
+            *args,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+
+        async def feed():
+            proc.stdin.write(data)
+            await proc.stdin.drain()
+            proc.stdin.close()
+
+        _, _, stdout = await asyncio.gather(
+            feed(), self._stream(name, proc.stderr), proc.stdout.read()
+        )
+
+        return await proc.wait(), stdout
+
+    async def _parse(self, source, semaphore):
+        """Parse a syllabus into a pandoc AST, reusing the cached AST.
+
+        Parameters
+        ----------
+        source : Path
+            Compiled markdown
+        semaphore : asyncio.Semaphore
+            Limits the number of jobs at once
+
+        Returns
+        -------
+        dict
+            The document AST
+
+        Raises
+        ------
+        RuntimeError
+            If pandoc fails
+        """
+        path = self.ast_dir / f"{source.stem}.json"
+        if (
+            path.exists()
+            and path.stat().st_mtime_ns >= source.stat().st_mtime_ns
+        ):
+            self._cache_lookup(hit=True)
+            return json.loads(path.read_text())
+
+        self._cache_lookup(hit=False)
+        async with semaphore:
+            start = time.perf_counter()
+            code, stdout = await self._pandoc(
+                f"{source.stem}.json",
+                ["-f", "markdown", "-t", "json"],
+                source.read_bytes(),
+            )
+            seconds = time.perf_counter() - start
+
+        if code != 0:
+            error = f"Could not parse {source} (exit {code})"
+            self._record(source.stem, "json", "failed", error=error)
+            raise RuntimeError(error)
+
+        atomic_write(path, stdout)
+        self._record(
+            source.stem, "json", "built", seconds=seconds, size=len(stdout)
+        )
+        return json.loads(stdout)
+
+    def _cache_lookup(self, hit):
+        """Count a lookup of the AST cache in the metrics, if there are any.
+
+        Parameters
+        ----------
+        hit : bool
+            If True, the cached AST was reused
+        """
+        if self.metrics is not None:
+            self.metrics.cache("ast", int(hit), int(not hit))
+
+    def _record(self, name, fmt, status, **kwargs):
+        """Record a pandoc run in the metrics, if there are any.
+
+        Parameters
+        ----------
+        name : str
+            Name of the syllabus
+        fmt : str
+            Output format
+        status : str
+            Outcome of the run
+        kwargs : dict
+            Keywords for BuildMetrics.record
+        """
+        if self.metrics is not None:
+            self.metrics.record(name, "pandoc", status, fmt=fmt, **kwargs)
+
+    def _ast(self, source, semaphore):
+        """Get the task that parses a syllabus, so it's parsed only once.
+
+        Parameters
+        ----------
+        source : Path
+            Compiled markdown
+        semaphore : asyncio.Semaphore
+            Limits the number of jobs at once
+
+        Returns
+        -------
+        asyncio.Task
+            Task that returns the document AST
+        """
+        if source not in self._asts:
+            self._asts[source] = asyncio.ensure_future(
+                self._parse(source, semaphore)
+            )
+
+        return self._asts[source]
+
+    def _post(self, job, ast):
+        """Convert a job's AST with a pandoc server.
+
+        Parameters
+        ----------
+        job : PandocJob
+            The job
+        ast : dict
+            The document AST
+
+        Returns
+        -------
+        int
+            0 on success, 1 on failure
+        """
+        payload = {
+            "text": json.dumps(ast),
+            "from": "json",
+            "to": job.fmt,
+            "standalone": True,
+        }
+        request = Request(
+            self.server,
+            data=json.dumps(payload).encode(),
+            headers={
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+            },
+        )
+        with urlopen(request) as response:
+            result = json.load(response)
+
+        for message in result.get("messages", []):
+            text = f"{message.get('verbosity')}: {message.get('message')}"
+            print(f"[{job.name}] {text}", file=sys.stderr)
+
+        if result.get("error"):
+            print(f"[{job.name}] {result['error']}", file=sys.stderr)
+            return 1
+
+        output = result["output"]
+        if result.get("base64"):
+            data = base64.b64decode(output)
+        else:
+            data = output.encode()
+        atomic_write(job.output, data)
+
+        return 0
+
+    async def _write(self, job, ast):
+        """Write a job's output from its AST.
+
+        Parameters
+        ----------
+        job : PandocJob
+            The job
+        ast : dict
+            The document AST
+
+        Returns
+        -------
+        int
+            0 on success, otherwise pandoc's exit code
+        """
+        if self.server and job.fmt in self.server_formats:
+            return await asyncio.to_thread(self._post, job, ast)
+
+        if self.docx_writer is not None and job.fmt == "docx":
+            try:
+                await asyncio.to_thread(
+                    self.docx_writer.write, ast, job.output
+                )
+                return 0
+            except NotImplementedError as e:
+                print(f"[{job.name}] {e}; using pandoc", file=sys.stderr)
+
+        data = json.dumps(ast).encode()
+        code, _ = await self._pandoc(job.name, self.args(job), data)
+
+        return code
+
+    async def _run(self, job, semaphore):
+        """Run a job once its AST is ready and a slot is free.
+
+        Parameters
+        ----------
+        job : PandocJob
+            The job
+        semaphore : asyncio.Semaphore
+            Limits the number of jobs at once
+
+        Returns
+        -------
+        bool
+            If True, the job succeeded
+        """
+        name = job.source.stem
+        try:
+            ast = await self._ast(job.source, semaphore)
+            if job.fmt == "docx":
+                ast = apply_docx_layout(ast)
+
+            async with semaphore:
+                start = time.perf_counter()
+                job.output.parent.mkdir(parents=True, exist_ok=True)
+                code = await self._write(job, ast)
+                seconds = time.perf_counter() - start
+
+        except Exception as e:
+            print(f"[{job.name}] {e}", file=sys.stderr)
+            self._record(name, job.fmt, "failed", error=str(e))
+            return False
+
+        if code == 0:
+            print(f"Rendered: {job.output}")
+            self._record(
+                name,
+                job.fmt,
+                "built",
+                seconds=seconds,
+                size=job.output.stat().st_size,
+            )
+        else:
+            print(f"Failed: {job.name} (exit {code})", file=sys.stderr)
+            self._record(
+                name, job.fmt, "failed", seconds=seconds, error=f"exit {code}"
+            )
+
+        return code == 0
+
+    async def run_all(self, jobs):
+        """Run jobs concurrently.
+
+        Parameters
+        ----------
+        jobs : list[PandocJob]
+            The jobs
+
+        Returns
+        -------
+        list[PandocJob]
+            Failed jobs
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(
+            *(self._run(job, semaphore) for job in jobs)
+        )
+
+        return [job for job, ok in zip(jobs, results) if not ok]
+
+
+def render_all(
+    md_dir,
+    output_dir,
+    formats=("docx", "html"),
+    reference_doc=None,
+    concurrency=None,
+    server=None,
+    force=False,
+    metrics=None,
+    docx_writer="pandoc",
+):
+    """Render every compiled syllabus with pandoc.
+
+    Parameters
+    ----------
+    md_dir : Path
+        Directory of compiled markdown
+    output_dir : Path
+        Directory with one subdirectory per format, plus json/ for the ASTs
+    formats : tuple[str]
+        Output formats
+    reference_doc : Path, optional
+        Reference .docx for styles
+    concurrency : int, optional
+        Maximum number of pandoc jobs at once
+    server : str, optional
+        URL of a pandoc server
+    force : bool
+        If True, render outputs that are newer than their markdown
+    metrics : BuildMetrics, optional
+        Records the time, output size, and status of each pandoc run
+    docx_writer : str
+        Write docx with "pandoc", or "native" to patch the reference
+        document in Python
+
+    Raises
+    ------
+    SystemExit
+        If any job fails
+    """
+    output_dir = Path(output_dir)
+    jobs = [
+        PandocJob(source, fmt, output_dir / fmt / f"{source.stem}.{fmt}")
+        for source in sorted(Path(md_dir).glob("*.md"))
+        for fmt in formats
+    ]
+    if not force:
+        stale = []
+        for job in jobs:
+            if job.is_stale():
+                stale.append(job)
+            elif metrics is not None:
+                metrics.record(
+                    job.source.stem, "pandoc", "unchanged", fmt=job.fmt
+                )
+        jobs = stale
+
+    runner = PandocRunner(
+        output_dir / "json",
+        reference_doc=reference_doc,
+        concurrency=concurrency,
+        server=server,
+        metrics=metrics,
+        docx_writer=(
+            DocxWriter(reference_doc) if docx_writer == "native" else None
+        ),
+    )
+
+    failures = asyncio.run(runner.run_all(jobs))
+    if failures:
+        print(f"{len(failures)} job(s) failed", file=sys.stderr)
+        sys.exit(1)
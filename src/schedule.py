@@ -1,16 +1,289 @@
-import calendar
-from datetime import datetime, timedelta
+import re
+import sys
+from datetime import date
+from pathlib import Path
 
+from academic import load_calendar
 from templates import ScheduleEntry
 
 
+def _check(value, kind, where):
+    """Check the type of a schedule value.
+
+    Parameters
+    ----------
+    value : any
+        The value
+    kind : type or tuple[type]
+        Expected type(s)
+    where : str
+        Location of the value, for the error message
+
+    Returns
+    -------
+    any
+        The value
+
+    Raises
+    ------
+    ValueError
+        If the value has the wrong type
+    """
+    # bool is an int, but never a valid week number
+    if not isinstance(value, kind) or (
+        isinstance(value, bool) and kind is int
+    ):
+        raise ValueError(f"{where} is {value!r}; expected {kind.__name__}")
+
+    return value
+
+
+class Day:
+    """A class meeting.
+
+    Strings are interned, so the dates, weekday names, and repeated agenda
+    items of many schedules share storage.
+    """
+
+    __slots__ = ("date", "weekday", "no_class", "agenda", "ordinal")
+
+    def __init__(self, date, weekday, no_class=False, agenda=(), ordinal=None):
+        """Initialize the object.
+
+        Parameters
+        ----------
+        date : str
+            Date as written in the schedule (M/D)
+        weekday : str
+            Name of the weekday
+        no_class : bool
+            If True, the class doesn't meet
+        agenda : iterable[str]
+            Agenda items
+        ordinal : int, optional
+            Date ordinal, if the year is known
+        """
+        self.date = sys.intern(date)
+        self.weekday = sys.intern(weekday)
+        self.no_class = no_class
+        self.agenda = tuple(sys.intern(item) for item in agenda)
+        self.ordinal = ordinal
+
+    @classmethod
+    def from_toml(cls, data, where):
+        """Build a day from its TOML table.
+
+        Parameters
+        ----------
+        data : dict
+            Day data
+        where : str
+            Location of the day, for error messages
+
+        Returns
+        -------
+        Day
+            The day
+
+        Raises
+        ------
+        ValueError
+            If a value has the wrong type
+        """
+        _check(data, dict, where)
+        agenda = _check(data.get("agenda", []), list, f"{where}.agenda")
+
+        return cls(
+            _check(data.get("date", ""), str, f"{where}.date"),
+            _check(data.get("weekday", ""), str, f"{where}.weekday"),
+            _check(data.get("no_class", False), bool, f"{where}.no_class"),
+            [_check(item, str, f"{where}.agenda") for item in agenda],
+        )
+
+
+class Week:
+    """A week of class meetings."""
+
+    __slots__ = ("num", "title", "days")
+
+    def __init__(self, num, title="", days=()):
+        """Initialize the object.
+
+        Parameters
+        ----------
+        num : int
+            Week number
+        title : str
+            Title of the week
+        days : iterable[Day]
+            Class meetings
+        """
+        self.num = num
+        self.title = sys.intern(title)
+        self.days = tuple(days)
+
+    @classmethod
+    def from_toml(cls, data, where):
+        """Build a week from its TOML table.
+
+        Parameters
+        ----------
+        data : dict
+            Week data
+        where : str
+            Location of the week, for error messages
+
+        Returns
+        -------
+        Week
+            The week
+
+        Raises
+        ------
+        ValueError
+            If a value has the wrong type
+        """
+        _check(data, dict, where)
+        num = data.get("num", "")
+        if num != "":
+            _check(num, int, f"{where}.num")
+
+        days = _check(data.get("days", []), list, f"{where}.days")
+
+        return cls(
+            num,
+            _check(data.get("title", ""), str, f"{where}.title"),
+            [
+                Day.from_toml(day, f"{where}.days[{i}]")
+                for i, day in enumerate(days)
+            ],
+        )
+
+
+class Schedule:
+    """A course schedule, validated as it is built from its TOML."""
+
+    __slots__ = ("weeks",)
+
+    def __init__(self, weeks):
+        """Initialize the object.
+
+        Parameters
+        ----------
+        weeks : iterable[Week]
+            Weeks, in order
+        """
+        self.weeks = tuple(weeks)
+
+    @classmethod
+    def from_toml(cls, data, year=None):
+        """Build a schedule from its TOML data.
+
+        Parameters
+        ----------
+        data : dict
+            Schedule data, with one table per week
+        year : int or str, optional
+            Year the schedule starts in. If given, each day's date is parsed
+            into an ordinal, and a date earlier than the one before it falls
+            in the following year
+
+        Returns
+        -------
+        Schedule
+            The schedule
+
+        Raises
+        ------
+        ValueError
+            If a value has the wrong type, or a date can't be parsed
+        """
+        schedule = cls(
+            Week.from_toml(week, key) for key, week in data.items()
+        )
+        if year is not None:
+            schedule._set_ordinals(int(year))
+
+        return schedule
+
+    def _set_ordinals(self, year):
+        """Parse each day's date into an ordinal.
+
+        Parameters
+        ----------
+        year : int
+            Year the schedule starts in
+
+        Raises
+        ------
+        ValueError
+            If a date isn't M/D
+        """
+        previous = 0
+        for _, day in self.days():
+            try:
+                month, dom = map(int, day.date.split("/"))
+                ordinal = date(year, month, dom).toordinal()
+                if ordinal < previous:
+                    year += 1
+                    ordinal = date(year, month, dom).toordinal()
+            except ValueError:
+                raise ValueError(
+                    f"Invalid date in schedule: {day.date!r} (expected M/D)"
+                ) from None
+
+            day.ordinal = previous = ordinal
+
+    def __iter__(self):
+        """Iterate over the weeks."""
+        return iter(self.weeks)
+
+    def __len__(self):
+        """Count the weeks.
+
+        Returns
+        -------
+        int
+            Number of weeks
+        """
+        return len(self.weeks)
+
+    def days(self):
+        """Iterate over every class meeting.
+
+        Yields
+        ------
+        tuple[Week, Day]
+            A day and its week
+        """
+        for week in self.weeks:
+            for day in week.days:
+                yield week, day
+
+
 class Scheduler:
     """Scheduler for compiling and rendering TOML schedules."""
 
-    date_format = "%Y-%m-%d"
-    day_abbr = list(calendar.day_abbr)
+    # The same values calendar.day_abbr and calendar.day_name have in the C
+    # locale, written out so that scheduling doesn't import calendar, locale,
+    # and _strptime
+    day_abbr = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+    day_name = [
+        "Monday",
+        "Tuesday",
+        "Wednesday",
+        "Thursday",
+        "Friday",
+        "Saturday",
+        "Sunday",
+    ]
     weekday_map = {"M": "Mon", "T": "Tue", "W": "Wed", "R": "Thu", "F": "Fri"}
 
+    # What strptime accepts for %m-%d
+    month_day = re.compile(
+        r"(1[0-2]|0?[1-9])-(3[01]|[12][0-9]|0?[1-9]| [1-9])"
+    )
+
     def _convert_weekdays(self, *weekdays):
         """Convert abbreviated weekdays to integer values.
 
@@ -35,8 +308,192 @@ class Scheduler:
 
         return {self.day_abbr.index(self.weekday_map[day]) for day in weekdays}
 
+    def _parse_date(self, value, year, after=None):
+        """Parse a date.
+
+        Parameters
+        ----------
+        value : str
+            Date in MM-DD or YYYY-MM-DD format
+        year : str
+            Year in YYYY format, used for MM-DD dates
+        after : date, optional
+            A MM-DD date that falls before this one is moved to the next year,
+            which lets a schedule span two calendar years
+
+        Returns
+        -------
+        date
+            The parsed date
+
+        Raises
+        ------
+        ValueError
+            If the date is invalid
+        """
+        if value.count("-") == 2:
+            return date.fromisoformat(value)
+
+        match = self.month_day.fullmatch(value)
+        if match is None:
+            raise ValueError(f"Invalid date (expected MM-DD): {value!r}")
+
+        month, day = map(int, match.groups())
+        parsed = date(int(year), month, day)
+        if after is not None and parsed < after:
+            parsed = date(parsed.year + 1, month, day)
+
+        return parsed
+
+    def iter_weeks(
+        self,
+        year,
+        start,
+        end,
+        weekdays="MTWRF",
+        exclude=None,
+        calendar=None,
+        **kwargs,
+    ):
+        """Generate the weeks of a schedule.
+
+        Meeting dates are computed from each week's Monday plus the offsets of
+        the requested weekdays, so only class days are visited.
+
+        Parameters
+        ----------
+        year : str
+            Year in YYYY format
+        start : str
+            Start date in MM-DD (or YYYY-MM-DD) format
+        end : str
+            End date in MM-DD (or YYYY-MM-DD) format; a MM-DD end date before
+            the start date falls in the following year
+        weekdays : str
+            Weekdays in shortcode format (e.g. MWF)
+        exclude : list[str]
+            Days to exclude in MM-DD (or YYYY-MM-DD) format
+        calendar : AcademicCalendar or Path or str, optional
+            Term calendar whose ranges are also excluded
+        kwargs : dict
+            Pass-through keywords
+
+        Yields
+        ------
+        Week
+            A week with at least one meeting
+        """
+        offsets = sorted(self._convert_weekdays(*weekdays))
+
+        start = self._parse_date(start, year)
+        end = self._parse_date(end, year, after=start)
+        first, last = start.toordinal(), end.toordinal()
+
+        excluded = {
+            self._parse_date(day, year, after=start).toordinal()
+            for day in exclude or []
+        }
+        if isinstance(calendar, (Path, str)):
+            calendar = load_calendar(calendar)
+
+        weeks = 0
+        monday = first - start.weekday()
+        for week_start in range(monday, last + 1, 7):
+            days = [
+                week_start + offset
+                for offset in offsets
+                if first <= week_start + offset <= last
+            ]
+            if not days:
+                continue
+
+            weeks += 1
+            meetings = [self._day(day, excluded, calendar) for day in days]
+            yield Week(weeks, days=meetings)
+
+    def _day(self, ordinal, excluded, calendar):
+        """Build a class meeting.
+
+        Parameters
+        ----------
+        ordinal : int
+            Date ordinal
+        excluded : set[int]
+            Ordinals of the days excluded by the config
+        calendar : AcademicCalendar or None
+            Term calendar
+
+        Returns
+        -------
+        Day
+            The meeting
+        """
+        day = date.fromordinal(ordinal)
+        return Day(
+            f"{day.month}/{day.day}",
+            self.day_name[day.weekday()],
+            no_class=self._is_excluded(ordinal, excluded, calendar),
+            ordinal=ordinal,
+        )
+
+    def iter_schedule(self, *args, **kwargs):
+        """Generate the TOML blocks of a schedule.
+
+        Parameters
+        ----------
+        args : tuple
+            Positional arguments for iter_weeks
+        kwargs : dict
+            Keywords for iter_weeks
+
+        Yields
+        ------
+        str
+            A TOML block for a week or a day
+        """
+        for week in self.iter_weeks(*args, **kwargs):
+            yield ScheduleEntry.WEEK.render(num=week.num)
+
+            for day in week.days:
+                yield ScheduleEntry.DAY.render(
+                    num=week.num,
+                    date=day.date,
+                    weekday=day.weekday,
+                    no_class="true" if day.no_class else "false",
+                )
+
+    @staticmethod
+    def _is_excluded(ordinal, excluded, calendar):
+        """Check whether a date is a no-class day.
+
+        Parameters
+        ----------
+        ordinal : int
+            Date ordinal
+        excluded : set[int]
+            Ordinals of the days excluded by the config
+        calendar : AcademicCalendar or None
+            Term calendar
+
+        Returns
+        -------
+        bool
+            If True, there is no class on the date
+        """
+        if ordinal in excluded:
+            return True
+
+        return calendar is not None and ordinal in calendar
+
     def make_schedule(
-        self, year, start, end, weekdays="MTWRF", exclude=None, **kwargs
+        self,
+        year,
+        start,
+        end,
+        weekdays="MTWRF",
+        exclude=None,
+        calendar=None,
+        **kwargs,
     ):
         """Create a schedule.
 
@@ -45,13 +502,15 @@ class Scheduler:
         year : str
             Year in YYYY format
         start : str
-            State date in MM-DD format
+            Start date in MM-DD (or YYYY-MM-DD) format
         end : str
-            End date in MM-DD format
+            End date in MM-DD (or YYYY-MM-DD) format
         weekdays : str
             Weekdays in shortcode format (e.g. MWF)
         exclude : list[str]
-            Days to exclude in MM-DD format
+            Days to exclude in MM-DD (or YYYY-MM-DD) format
+        calendar : AcademicCalendar or Path or str, optional
+            Term calendar whose ranges are also excluded
         kwargs : dict
             Pass-through keywords
 
@@ -60,63 +519,57 @@ class Scheduler:
         str
             Schedule formatted as TOML
         """
-        weekdays = self._convert_weekdays(*weekdays)
-
-        start = datetime.strptime(f"{year}-{start}", self.date_format)
-        end = datetime.strptime(f"{year}-{end}", self.date_format)
+        return "\n".join(
+            self.iter_schedule(
+                year, start, end, weekdays, exclude, calendar, **kwargs
+            )
+        )
 
-        if exclude is None:
-            exclude = []
-        else:
-            exclude = [
-                datetime.strptime(f"{year}-{date}", self.date_format)
-                for date in exclude
-            ]
 
-        weeks = 0
-        schedule = []
-        date = start
-        while date <= end:
-            # Is the day's weekday a target?
-            weekday = date.weekday()
-            if weekday not in weekdays:
-                date += timedelta(days=1)
-                continue
+def schedule_args(syllabus_data, config=None):
+    """Get the scheduling keywords of a syllabus config.
 
-            # If the schedule is empty, count the week and add it to the
-            # schedule. If the day's  weekday is the earliest in the weekdays,
-            # do the same
-            if not schedule or weekday == min(weekdays):
-                weeks += 1
-                week_md = ScheduleEntry.WEEK.render(num=weeks)
-                schedule.append(week_md)
-
-            # Get the weekday name, determine whether it's a no-class day, and
-            # format a line for the schedule
-            day = calendar.day_name[weekday]
-            no_class = "true" if date in exclude else "false"
-            day_md = ScheduleEntry.DAY.render(
-                num=weeks,
-                month=date.month,
-                day=date.day,
-                weekday=day,
-                no_class=no_class,
-            )
+    Parameters
+    ----------
+    syllabus_data : dict
+        Course metadata
+    config : Path, optional
+        Path to the config, whose directory a relative calendar path is
+        resolved against
 
-            schedule.append(day_md)
-            date += timedelta(days=1)
+    Returns
+    -------
+    dict
+        Keywords for Scheduler.iter_schedule and make_schedule
+    """
+    kwargs = dict(syllabus_data["schedule"])
+    if kwargs.get("calendar") is not None and config is not None:
+        kwargs["calendar"] = load_calendar(
+            kwargs["calendar"], base=Path(config).parent
+        )
 
-        return "\n".join(schedule)
+    return kwargs
 
 
-def build_schedule(syllabus_data):
+def build_schedule(syllabus_data, config=None):
     """Build schedule from syllabus config.
 
     Parameters
     ----------
     syllabus_data dict
         Course metadata
+    config : Path, optional
+        Path to the config, whose directory a relative calendar path is
+        resolved against
     """
     scheduler = Scheduler()
-    schedule = scheduler.make_schedule(**syllabus_data["schedule"])
-    print(schedule)
+    blocks = scheduler.iter_schedule(**schedule_args(syllabus_data, config))
+
+    # Stream the blocks rather than joining them, separating with newlines as
+    # make_schedule does
+    for i, block in enumerate(blocks):
+        if i:
+            sys.stdout.write("\n")
+        sys.stdout.write(block)
+
+    sys.stdout.write("\n")
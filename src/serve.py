@@ -0,0 +1,536 @@
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from compile import SyllabusCompiler, TemplateRenderer
+
+CONTENT_TYPES = {
+    "markdown": "text/markdown; charset=utf-8",
+    "json": "application/json",
+    "html": "text/html; charset=utf-8",
+    "docx": (
+        "application/"
+        "vnd.openxmlformats-officedocument.wordprocessingml.document"
+    ),
+}
+
+
+class ResultCache:
+    """LRU cache of rendered syllabi, bounded by their total size.
+
+    Entries are keyed by a hash of the request, so a repeated request is
+    answered without compiling anything. When the entries grow past the
+    bound, the least recently used ones are dropped.
+    """
+
+    def __init__(self, max_bytes):
+        """Initialize the object.
+
+        Parameters
+        ----------
+        max_bytes : int
+            Maximum total size of the cached outputs
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Look up an output, marking it as recently used.
+
+        Parameters
+        ----------
+        key : str
+            Hash of the request
+
+        Returns
+        -------
+        bytes or None
+            The output, or None if it isn't cached
+        """
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        """Store an output, dropping the least recently used ones to fit.
+
+        Parameters
+        ----------
+        key : str
+            Hash of the request
+        data : bytes
+            The output. Outputs larger than the whole cache aren't stored
+        """
+        if len(data) > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+
+            self._entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, dropped = self._entries.popitem(last=False)
+                self.size -= len(dropped)
+
+    def clear(self):
+        """Drop every output."""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """Summarize the cache.
+
+        Returns
+        -------
+        dict
+            Number of entries, their size, the bound, and lookup counts
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class SyllabusService:
+    """Compiles syllabi from request payloads.
+
+    A payload is a JSON object with a config and a schedule, each either a
+    table (as parsed from TOML) or TOML text, and an output format: markdown
+    (the default), json (a pandoc AST), html, or docx. The templates are
+    compiled once and shared by every request; outputs are cached by a hash
+    of the payload until a template file changes.
+    """
+
+    def __init__(
+        self,
+        template_paths,
+        reference_doc=None,
+        cache_bytes=64 * 1024 * 1024,
+        jobs=None,
+    ):
+        """Initialize the object.
+
+        Parameters
+        ----------
+        template_paths : list[Path]
+            Paths to template files
+        reference_doc : Path, optional
+            Reference .docx for styles
+        cache_bytes : int
+            Maximum total size of the cached outputs
+        jobs : int, optional
+            Maximum number of syllabi built at once (defaults to the CPU
+            count)
+        """
+        self.template_paths = template_paths
+        self.reference_doc = reference_doc
+        self.renderer = TemplateRenderer(template_paths)
+        self.cache = ResultCache(cache_bytes)
+        self.jobs = jobs or os.cpu_count() or 1
+        self._semaphore = threading.BoundedSemaphore(self.jobs)
+        self._plans = self.renderer.plans
+
+    @staticmethod
+    def key(payload):
+        """Hash a payload.
+
+        Parameters
+        ----------
+        payload : dict
+            The request
+
+        Returns
+        -------
+        str
+            Hex digest of the payload's canonical JSON, so that key order
+            and whitespace don't matter
+        """
+        data = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    @staticmethod
+    def _table(payload, name):
+        """Get a config or schedule from a payload.
+
+        Parameters
+        ----------
+        payload : dict
+            The request
+        name : str
+            config or schedule
+
+        Returns
+        -------
+        dict
+            The data
+
+        Raises
+        ------
+        ValueError
+            If the data is missing or isn't a table or TOML text
+        """
+        value = payload.get(name)
+        if isinstance(value, dict):
+            return value
+        if isinstance(value, str):
+            import tomllib
+
+            try:
+                return tomllib.loads(value)
+            except tomllib.TOMLDecodeError as e:
+                raise ValueError(f"Invalid {name} TOML: {e}") from e
+
+        raise ValueError(f"Missing {name}: expected a table or TOML text")
+
+    def _check_templates(self):
+        """Drop the cached outputs if a template file has changed."""
+        plans = self.renderer.plans
+        if plans is not self._plans:
+            self._plans = plans
+            self.cache.clear()
+            print("Templates changed; cache cleared", file=sys.stderr)
+
+    def render(self, payload):
+        """Render a payload, reusing a cached output.
+
+        Parameters
+        ----------
+        payload : dict
+            The request
+
+        Returns
+        -------
+        tuple[bytes, str, bool]
+            The output, the payload's hash, and whether the output came
+            from the cache
+
+        Raises
+        ------
+        ValueError
+            If the payload or its syllabus data is invalid
+        RuntimeError
+            If pandoc fails
+        """
+        to = payload.get("to", "markdown")
+        if to not in CONTENT_TYPES:
+            raise ValueError(
+                f"Unknown format: {to} (expected one of "
+                f"{', '.join(CONTENT_TYPES)})"
+            )
+
+        self._check_templates()
+        key = self.key(payload)
+        data = self.cache.get(key)
+        if data is not None:
+            return data, key, True
+
+        config = self._table(payload, "config")
+        schedule = self._table(payload, "schedule")
+        with self._semaphore:
+            data = self._build(config, schedule, to)
+
+        self.cache.put(key, data)
+        return data, key, False
+
+    def _build(self, config, schedule, to):
+        """Compile a syllabus.
+
+        Parameters
+        ----------
+        config : dict
+            Course metadata
+        schedule : dict
+            Schedule data
+        to : str
+            Output format
+
+        Returns
+        -------
+        bytes
+            The output
+        """
+        compiler = SyllabusCompiler(
+            config, schedule, self.template_paths, renderer=self.renderer
+        )
+        if to == "markdown":
+            return f"{compiler.compile()}\n".encode()
+
+        try:
+            ast = compiler.compile_ast(docx_layout=to == "docx")
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"pandoc failed: {e.stderr.strip()}") from e
+
+        if to == "json":
+            return json.dumps(ast).encode()
+
+        return self._pandoc(ast, to)
+
+    def _pandoc(self, ast, fmt):
+        """Convert an AST with pandoc.
+
+        Parameters
+        ----------
+        ast : dict
+            The document AST
+        fmt : str
+            Output format (html or docx)
+
+        Returns
+        -------
+        bytes
+            The output
+
+        Raises
+        ------
+        RuntimeError
+            If pandoc fails
+        """
+        args = ["pandoc", "-s", "-f", "json", "-t", fmt]
+        if fmt == "docx" and self.reference_doc:
+            args.append(f"--reference-doc={self.reference_doc}")
+        args.extend(["-o", "-"])
+
+        result = subprocess.run(
+            args, input=json.dumps(ast).encode(), capture_output=True
+        )
+        if result.returncode != 0:
+            error = result.stderr.decode(errors="replace").strip()
+            raise RuntimeError(
+                f"pandoc failed (exit {result.returncode}): {error}"
+            )
+
+        return result.stdout
+
+    def stats(self):
+        """Summarize the service.
+
+        Returns
+        -------
+        dict
+            Cache statistics, templates, and the build limit
+        """
+        return {
+            "cache": self.cache.stats(),
+            "templates": [str(path) for path in self.template_paths],
+            "jobs": self.jobs,
+        }
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    """Handles requests to the render server.
+
+    POST /render takes a payload (see SyllabusService) and answers with the
+    output. X-Cache says whether the output was cached, and ETag is the
+    payload's hash. GET /stats answers with the service's statistics.
+    """
+
+    protocol_version = "HTTP/1.1"
+    server_version = "syllabus-factory"
+
+    # Headers and body go out as separate writes; with Nagle's algorithm,
+    # the body waits on the client's delayed ACK of the headers (~40 ms)
+    disable_nagle_algorithm = True
+
+    # Configs and schedules are a few KiB; anything this big is a mistake
+    max_body = 4 * 1024 * 1024
+
+    def _send(self, status, data, content_type, headers=None):
+        """Send a response.
+
+        Parameters
+        ----------
+        status : HTTPStatus
+            Response status
+        data : bytes
+            Response body
+        content_type : str
+            Type of the body
+        headers : dict, optional
+            More response headers
+        """
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_json(self, status, data):
+        """Send a JSON response.
+
+        Parameters
+        ----------
+        status : HTTPStatus
+            Response status
+        data : dict
+            Response body
+        """
+        body = json.dumps(data).encode()
+        self._send(status, body, CONTENT_TYPES["json"])
+
+    def _error(self, status, message):
+        """Send an error as JSON.
+
+        Parameters
+        ----------
+        status : HTTPStatus
+            Response status
+        message : str
+            What went wrong
+        """
+        self._send_json(status, {"error": message})
+
+    def do_GET(self):
+        """Answer GET /stats."""
+        if urlsplit(self.path).path != "/stats":
+            self._error(HTTPStatus.NOT_FOUND, f"Not found: {self.path}")
+            return
+
+        self._send_json(HTTPStatus.OK, self.server.service.stats())
+
+    def do_POST(self):
+        """Answer POST /render."""
+        if urlsplit(self.path).path != "/render":
+            self._error(HTTPStatus.NOT_FOUND, f"Not found: {self.path}")
+            return
+
+        try:
+            length = int(self.headers["Content-Length"])
+        except (TypeError, ValueError):
+            self.close_connection = True
+            self._error(HTTPStatus.LENGTH_REQUIRED, "Missing Content-Length")
+            return
+        if length > self.max_body:
+            # The body is left unread, so the connection can't be reused
+            self.close_connection = True
+            self._error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Too large")
+            return
+
+        try:
+            payload = json.loads(self.rfile.read(length))
+            if not isinstance(payload, dict):
+                raise ValueError("Expected a JSON object")
+            data, key, hit = self.server.service.render(payload)
+        except (ValueError, KeyError, TypeError) as e:
+            # Missing or malformed syllabus data surfaces as one of these
+            self._error(HTTPStatus.BAD_REQUEST, f"{type(e).__name__}: {e}")
+            return
+        except Exception as e:
+            self._error(HTTPStatus.INTERNAL_SERVER_ERROR, str(e))
+            return
+
+        to = payload.get("to", "markdown")
+        self._send(
+            HTTPStatus.OK,
+            data,
+            CONTENT_TYPES[to],
+            headers={
+                "X-Cache": "HIT" if hit else "MISS",
+                "ETag": f'"{key}"',
+            },
+        )
+
+    def log_message(self, format, *args):
+        """Log a request to stderr, unless the server is quiet."""
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class RenderServer(ThreadingHTTPServer):
+    """HTTP server for a SyllabusService.
+
+    Each connection gets a thread, so slow clients don't hold up others;
+    the service limits how many syllabi are built at once.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, service, quiet=False):
+        """Initialize the object.
+
+        Parameters
+        ----------
+        address : tuple[str, int]
+            Host and port to listen on (port 0 picks a free one)
+        service : SyllabusService
+            Builds the syllabi
+        quiet : bool
+            If True, don't log requests
+        """
+        super().__init__(address, RenderHandler)
+        self.service = service
+        self.quiet = quiet
+
+    @property
+    def url(self):
+        """Get the server's base URL."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def serve(
+    template_paths,
+    host="127.0.0.1",
+    port=8000,
+    reference_doc=None,
+    cache_bytes=64 * 1024 * 1024,
+    jobs=None,
+    quiet=False,
+):
+    """Run the render server until interrupted.
+
+    Parameters
+    ----------
+    template_paths : list[Path]
+        Paths to template files
+    host : str
+        Host to listen on
+    port : int
+        Port to listen on
+    reference_doc : Path, optional
+        Reference .docx for styles
+    cache_bytes : int
+        Maximum total size of the cached outputs
+    jobs : int, optional
+        Maximum number of syllabi built at once (defaults to the CPU count)
+    quiet : bool
+        If True, don't log requests
+    """
+    service = SyllabusService(
+        template_paths,
+        reference_doc=reference_doc,
+        cache_bytes=cache_bytes,
+        jobs=jobs,
+    )
+    with RenderServer((host, port), service, quiet=quiet) as server:
+        print(f"Serving on {server.url} (Ctrl+C to stop)", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\nStopped", file=sys.stderr)
@@ -1,12 +1,160 @@
+from collections.abc import Iterator
 from enum import Enum
+from functools import cached_property
 from string import Template
 
 from utils import dedent
 
 
+class TemplatePlan:
+    """A template compiled into literal segments and placeholder slots.
+
+    Rendering a plan gives the same output as ``Template.safe_substitute``:
+    ``$$`` becomes ``$``, and placeholders missing from the context (as well
+    as invalid ones) are left as they are.
+    """
+
+    def __init__(self, source):
+        """Initialize the object.
+
+        Parameters
+        ----------
+        source : str
+            The template string
+        """
+        self.segments = []
+        self.index = {}
+        self.names = []
+
+        literal = []
+        pos = 0
+        for match in Template.pattern.finditer(source):
+            literal.append(source[pos : match.start()])
+            pos = match.end()
+
+            name = match.group("named") or match.group("braced")
+            if name is None:
+                # Escaped delimiters collapse; invalid ones stay as written
+                if match.group("escaped") is not None:
+                    literal.append(Template.delimiter)
+                else:
+                    literal.append(match.group())
+                continue
+
+            self.segments.append("".join(literal))
+            literal.clear()
+
+            # The slot holds the placeholder itself until a context fills it
+            self.index.setdefault(name, []).append(len(self.segments))
+            self.names.append(name)
+            self.segments.append(match.group())
+
+        literal.append(source[pos:])
+        self.segments.append("".join(literal))
+
+        self.repeated = [
+            name for name, slots in self.index.items() if len(slots) > 1
+        ]
+
+    @property
+    def is_static(self):
+        """Check whether the template has no placeholders.
+
+        Returns
+        -------
+        bool
+            If True, every rendering of the template is the same
+        """
+        return not self.index
+
+    def render(self, context):
+        """Fill the placeholder slots with context values.
+
+        Parameters
+        ----------
+        context : dict
+            Template context data
+
+        Returns
+        -------
+        str
+            The rendered template
+        """
+        parts = self.segments.copy()
+        for name, slots in self.index.items():
+            if name not in context:
+                continue
+
+            value = str(context[name])
+            for slot in slots:
+                parts[slot] = value
+
+        return "".join(parts)
+
+    def iter_render(self, context):
+        """Generate the rendered template in chunks.
+
+        A value that is an iterator of strings (e.g. a generator) is streamed
+        into its slot rather than joined first.
+
+        Parameters
+        ----------
+        context : dict
+            Template context data
+
+        Yields
+        ------
+        str
+            Literal segments and slot values, in order
+        """
+        # An iterator can only be consumed once, so one that fills several
+        # slots is joined up front
+        for name in self.repeated:
+            if isinstance(value := context.get(name), Iterator):
+                context = {**context, name: "".join(value)}
+
+        segments = self.segments
+        if segments[0]:
+            yield segments[0]
+
+        for i, name in enumerate(self.names):
+            slot = 2 * i + 1
+            if name not in context:
+                yield segments[slot]
+            elif isinstance(value := context[name], Iterator):
+                yield from value
+            else:
+                yield str(value)
+
+            if segments[slot + 1]:
+                yield segments[slot + 1]
+
+
 class SyllabusItem(Enum):
     """Base template class for Markdown entries."""
 
+    @cached_property
+    def template(self):
+        """Dedent and compile the entry once, on first use.
+
+        Returns
+        -------
+        Template
+            The compiled entry
+        """
+        return Template(dedent(self.value, indent=4))
+
+    @cached_property
+    def plan(self):
+        """Compile the entry into segments and slots once, on first use.
+
+        Returns
+        -------
+        TemplatePlan
+            The compiled entry
+        """
+        return TemplatePlan(self.template.template)
+
     def render(self, **kwargs):
         """Render an entry.
 
@@ -20,8 +168,23 @@ class SyllabusItem(Enum):
         str
             The rendered entry
         """
-        template_str = dedent(self.value, indent=4)
-        return Template(template_str).safe_substitute(**kwargs)
+        return self.template.safe_substitute(**kwargs)
+
+    def render_many(self, rows):
+        """Render an entry once for each set of keywords.
+
+        Parameters
+        ----------
+        rows : iterable[dict]
+            Keywords for each rendering of the template
+
+        Returns
+        -------
+        list[str]
+            The rendered entries
+        """
+        substitute = self.template.safe_substitute
+        return [substitute(row) for row in rows]
 
 
 class ScheduleEntry(SyllabusItem):
@@ -34,7 +197,7 @@ class ScheduleEntry(SyllabusItem):
     """
     DAY = """\
       [[week-$num.days]]
-      date = "$month/$day"
+      date = "$date"
       weekday = "$weekday"
       no_class = $no_class
       agenda = []
@@ -0,0 +1,153 @@
+import pickle
+import sys
+import time
+import zlib
+from pathlib import Path
+
+
+class TomlCache:
+    """Cache of parsed TOML files, pickled on disk.
+
+    Entries are keyed by the file's resolved path and validated against its
+    size and mtime. If those changed but the content hashes the same (e.g.
+    the file was touched), the parsed data is still reused.
+
+    A lookup whose stamp matches needs only pickle, so the modules for
+    hashing, parsing, and writing are imported on the first miss. Otherwise
+    importing them would cost a one-file command more than the parse it
+    saves.
+    """
+
+    # Pickles written by another Python might not load the same way
+    version = (2, *sys.version_info[:2])
+
+    def __init__(self, root):
+        """Initialize the object.
+
+        Parameters
+        ----------
+        root : Path
+            Directory for the cache
+        """
+        self.root = Path(root)
+
+        # Counters rather than a log of lookups, so a long-running watch
+        # doesn't grow without bound
+        self.hits = 0
+        self.misses = 0
+        self.seconds = 0.0
+
+    def _path(self, path):
+        """Get the cache entry for a file.
+
+        Parameters
+        ----------
+        path : Path
+            Resolved path to the TOML file
+
+        Returns
+        -------
+        Path
+            Path to the entry
+        """
+        # The name only needs to be stable and unique, not cryptographic
+        name = f"{path.name}-{zlib.crc32(str(path).encode()):08x}"
+        return self.root / f"{name}.pickle"
+
+    def _read_entry(self, entry_path):
+        """Read a cache entry.
+
+        Parameters
+        ----------
+        entry_path : Path
+            Path to the entry
+
+        Returns
+        -------
+        dict or None
+            The entry, or None if it's missing, unreadable, or stale
+        """
+        try:
+            with entry_path.open("rb") as f:
+                entry = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # A truncated or corrupt pickle can fail in many ways; any of
+            # them just means the file is parsed again
+            return None
+
+        if not isinstance(entry, dict) or entry.get("version") != self.version:
+            return None
+
+        return entry
+
+    def load(self, path):
+        """Load TOML, reusing the parsed data for an unchanged file.
+
+        Parameters
+        ----------
+        path : Path or str
+            Path to the file
+
+        Returns
+        -------
+        dict
+            TOML data
+        """
+        start = time.perf_counter()
+        path = Path(path).resolve()
+        st = path.stat()
+
+        entry_path = self._path(path)
+        entry = self._read_entry(entry_path)
+        if entry is not None and entry["path"] != str(path):
+            entry = None
+
+        stamp = (st.st_size, st.st_mtime_ns)
+        if entry is not None and entry["stamp"] == stamp:
+            self._record(path, True, start)
+            return entry["data"]
+
+        import hashlib
+        import tomllib
+
+        from output import atomic_write
+
+        raw = path.read_bytes()
+        digest = hashlib.sha256(raw).hexdigest()
+        hit = entry is not None and entry["sha256"] == digest
+        data = entry["data"] if hit else tomllib.loads(raw.decode())
+
+        entry = {
+            "version": self.version,
+            "path": str(path),
+            "stamp": stamp,
+            "sha256": digest,
+            "data": data,
+        }
+        try:
+            atomic_write(entry_path, pickle.dumps(entry))
+        except OSError as e:
+            print(f"Could not cache {path}: {e}", file=sys.stderr)
+        self._record(path, hit, start)
+
+        return data
+
+    def _record(self, path, hit, start):
+        """Count a lookup and how long it took.
+
+        Parameters
+        ----------
+        path : Path
+            Path to the TOML file
+        hit : bool
+            If True, the parsed data was reused
+        start : float
+            perf_counter value when the lookup started
+        """
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        self.seconds += time.perf_counter() - start
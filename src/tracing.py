@@ -0,0 +1,225 @@
+import io
+import json
+import os
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+from output import atomic_write
+
+
+class NullTracer:
+    """Tracer for builds that aren't instrumented.
+
+    Every span is the same do-nothing context manager, so an uninstrumented
+    stage costs one method call.
+    """
+
+    _span = nullcontext()
+
+    def span(self, name, **args):
+        """Get a span that records nothing.
+
+        Parameters
+        ----------
+        name : str
+            Name of the span
+        args : dict
+            Ignored
+
+        Returns
+        -------
+        contextlib.nullcontext
+            A do-nothing context manager
+        """
+        return self._span
+
+
+NULL_TRACER = NullTracer()
+
+
+class Tracer:
+    """Records the stages of a build as Chrome trace events.
+
+    Each span becomes a complete ("X") event, and spans nest. The file
+    written by save opens in chrome://tracing or ui.perfetto.dev. Optionally,
+    the build is also profiled with cProfile, and the memory each span
+    allocates is measured with tracemalloc.
+    """
+
+    def __init__(self, profile=False, trace_memory=False):
+        """Initialize the object.
+
+        Parameters
+        ----------
+        profile : bool
+            If True, profile the build with cProfile
+        trace_memory : bool
+            If True, record the memory allocated in each span
+        """
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.events = []
+        self.counters = []
+        self._depths = []
+        self._depth = 0
+        self._profiler = None
+        self._origin = time.perf_counter_ns()
+        self._pid = os.getpid()
+
+    def start(self):
+        """Start profiling and memory tracing, if requested."""
+        if self.trace_memory:
+            import tracemalloc
+
+            tracemalloc.start()
+
+        if self.profile:
+            import cProfile
+
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def stop(self):
+        """Stop profiling and memory tracing."""
+        if self._profiler is not None:
+            self._profiler.disable()
+
+        if self.trace_memory:
+            import tracemalloc
+
+            tracemalloc.stop()
+
+    def _memory(self):
+        """Get the size of the traced memory.
+
+        Returns
+        -------
+        int
+            Bytes currently allocated, or 0 if memory isn't traced
+        """
+        if not self.trace_memory:
+            return 0
+
+        import tracemalloc
+
+        return tracemalloc.get_traced_memory()[0]
+
+    def _timestamp(self, ns):
+        """Convert a perf_counter_ns reading to a trace timestamp.
+
+        Parameters
+        ----------
+        ns : int
+            Reading in nanoseconds
+
+        Returns
+        -------
+        float
+            Microseconds since the tracer was created
+        """
+        return (ns - self._origin) / 1000
+
+    @contextmanager
+    def span(self, name, **args):
+        """Record a span around a block.
+
+        Parameters
+        ----------
+        name : str
+            Name of the span
+        args : dict
+            Details shown with the span in the trace viewer
+        """
+        # Reserve the event's place, so that events stay in start order
+        index = len(self.events)
+        self.events.append(None)
+        self._depths.append(self._depth)
+        self._depth += 1
+
+        before = self._memory()
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            end = time.perf_counter_ns()
+            self._depth -= 1
+
+            if self.trace_memory:
+                after = self._memory()
+                args["allocated_kb"] = round((after - before) / 1024, 1)
+                self.counters.append(
+                    {
+                        "name": "memory",
+                        "ph": "C",
+                        "ts": self._timestamp(end),
+                        "pid": self._pid,
+                        "args": {"traced_kb": round(after / 1024, 1)},
+                    }
+                )
+
+            self.events[index] = {
+                "name": name,
+                "cat": "build",
+                "ph": "X",
+                "ts": self._timestamp(start),
+                "dur": (end - start) / 1000,
+                "pid": self._pid,
+                "tid": self._pid,
+                "args": args,
+            }
+
+    def save(self, path):
+        """Write the trace, and the profile next to it.
+
+        Parameters
+        ----------
+        path : Path
+            Trace file (.json). A profile is written with the suffix .prof,
+            for pstats or snakeviz
+        """
+        path = Path(path)
+        events = [event for event in self.events if event is not None]
+        trace = {
+            "traceEvents": events + self.counters,
+            "displayTimeUnit": "ms",
+        }
+        atomic_write(path, json.dumps(trace).encode())
+
+        if self._profiler is not None:
+            self._profiler.dump_stats(path.with_suffix(".prof"))
+
+    def report(self, limit=15):
+        """Summarize the spans, and the profile if there is one.
+
+        Parameters
+        ----------
+        limit : int
+            Number of functions to list from the profile
+
+        Returns
+        -------
+        str
+            One line per span, indented by depth
+        """
+        lines = []
+        for depth, event in zip(self._depths, self.events):
+            if event is None:
+                continue
+
+            label = f"{'  ' * depth}{event['name']}"
+            line = f"{label:<24} {event['dur'] / 1000:9.3f} ms"
+            if "allocated_kb" in event["args"]:
+                line += f" {event['args']['allocated_kb']:10.1f} KiB"
+            lines.append(line)
+
+        if self._profiler is not None:
+            import pstats
+
+            stream = io.StringIO()
+            stats = pstats.Stats(self._profiler, stream=stream)
+            stats.sort_stats("cumulative").print_stats(limit)
+            lines.append(stream.getvalue().rstrip())
+
+        return "\n".join(lines)
+
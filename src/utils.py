@@ -1,5 +1,6 @@
 import re
-from textwrap import TextWrapper
+from functools import lru_cache
+from pathlib import Path
 
 
 def dedent(text, indent=4):
@@ -20,6 +21,192 @@ def dedent(text, indent=4):
     return re.sub(rf"(?m)^{' ' * indent}", "", text)
 
 
+class ParagraphWrapper:
+    """Greedy paragraph wrapper.
+
+    Wraps exactly as ``textwrap.TextWrapper`` does with whitespace replaced
+    and dropped, and with neither long words nor hyphenated words broken.
+    Words are split once and filled onto lines in a single pass, without
+    TextWrapper's per-call setup or regex chunking.
+    """
+
+    # TextWrapper only treats ASCII whitespace as space between words
+    _whitespace = "\t\n\x0b\x0c\r "
+    _to_space = str.maketrans(_whitespace, " " * len(_whitespace))
+    _chunk_re = re.compile("( +)")
+
+    def __init__(self, width=79):
+        """Initialize the object.
+
+        Parameters
+        ----------
+        width : int
+            Wrap width
+
+        Raises
+        ------
+        ValueError
+            If the width isn't positive
+        """
+        if width <= 0:
+            raise ValueError(f"invalid width {width!r} (must be > 0)")
+
+        self.width = width
+
+    def wrap_lines(self, text):
+        """Wrap a single paragraph into lines.
+
+        Parameters
+        ----------
+        text : str
+            The paragraph
+
+        Returns
+        -------
+        list[str]
+            Wrapped lines
+        """
+        text = text.expandtabs(8).translate(self._to_space)
+        if not text:
+            return []
+
+        # Words separated by single spaces (no runs of spaces, no other
+        # whitespace) can be filled by word length alone
+        if (
+            text.isprintable()
+            and "  " not in text
+            and text[0] != " "
+            and text[-1] != " "
+        ):
+            return self._fill_words(text.split(" "))
+
+        chunks = [chunk for chunk in self._chunk_re.split(text) if chunk]
+        width = self.width
+
+        lines = []
+        i, n = 0, len(chunks)
+        while i < n:
+            # Whitespace that would start a line is dropped, except at the
+            # very beginning of the text
+            if lines and chunks[i].strip() == "":
+                i += 1
+
+            line, length = [], 0
+            while i < n and length + len(chunks[i]) <= width:
+                line.append(chunks[i])
+                length += len(chunks[i])
+                i += 1
+
+            # A word longer than the width gets a line to itself
+            if not line and i < n:
+                line.append(chunks[i])
+                i += 1
+
+            if line and line[-1].strip() == "":
+                line.pop()
+
+            if line:
+                lines.append("".join(line))
+
+        return lines
+
+    def _fill_words(self, words):
+        """Fill words separated by single spaces onto lines.
+
+        Parameters
+        ----------
+        words : list[str]
+            The words of a paragraph
+
+        Returns
+        -------
+        list[str]
+            Wrapped lines
+        """
+        width = self.width
+        lines = []
+        line, length = [words[0]], len(words[0])
+        for word in words[1:]:
+            if length + 1 + len(word) <= width:
+                line.append(word)
+                length += 1 + len(word)
+            else:
+                lines.append(" ".join(line))
+                line, length = [word], len(word)
+
+        lines.append(" ".join(line))
+
+        return lines
+
+    def wrap(self, text):
+        """Wrap text paragraph-by-paragraph, preserving blank lines.
+
+        Parameters
+        ----------
+        text : str
+            The text to wrap
+
+        Returns
+        -------
+        str
+            Wrapped text
+        """
+        out_lines = []
+        paragraph = []
+
+        def flush():
+            if not paragraph:
+                return
+
+            para_text = " ".join(line.strip() for line in paragraph).strip()
+            lines = self.wrap_lines(para_text)
+            out_lines.extend(line.rstrip() for line in lines)
+            paragraph.clear()
+
+        for line in text.splitlines():
+            if line.strip() == "":
+                flush()
+                out_lines.append("")
+            else:
+                paragraph.append(line)
+
+        flush()
+
+        return "\n".join(out_lines).rstrip("\n")
+
+    def wrap_many(self, texts):
+        """Wrap many texts.
+
+        Parameters
+        ----------
+        texts : iterable[str]
+            The texts to wrap
+
+        Returns
+        -------
+        list[str]
+            Wrapped texts
+        """
+        return [self.wrap(text) for text in texts]
+
+
+@lru_cache(maxsize=None)
+def get_wrapper(width=79):
+    """Get the shared wrapper for a width.
+
+    Parameters
+    ----------
+    width : int
+        Wrap width
+
+    Returns
+    -------
+    ParagraphWrapper
+        The wrapper
+    """
+    return ParagraphWrapper(width)
+
+
 def wrap_paragraphs(text, width=79):
     """Wrap text paragraph-by-paragraph, preserving blank lines.
 
@@ -35,34 +222,25 @@ def wrap_paragraphs(text, width=79):
     str
         Wrapped text
     """
-    wrapper = TextWrapper(
-        width=width,
-        replace_whitespace=True,
-        drop_whitespace=True,
-        break_long_words=False,
-        break_on_hyphens=False,
-    )
-    out_lines = []
-    paragraph = []
-
-    def flush():
-        if not paragraph:
-            return
-
-        para_text = " ".join(line.strip() for line in paragraph).strip()
-        out_lines.extend(line.rstrip() for line in wrapper.wrap(para_text))
-        paragraph.clear()
-
-    for line in text.splitlines():
-        if line.strip() == "":
-            flush()
-            out_lines.append("")
-        else:
-            paragraph.append(line)
+    return get_wrapper(width).wrap(text)
 
-    flush()
 
-    return "\n".join(out_lines).rstrip("\n")
+def wrap_many(texts, width=79):
+    """Wrap many texts paragraph-by-paragraph, preserving blank lines.
+
+    Parameters
+    ----------
+    texts : iterable[str]
+        The texts to wrap
+    width : int
+        Wrap width
+
+    Returns
+    -------
+    list[str]
+        Wrapped texts
+    """
+    return get_wrapper(width).wrap_many(texts)
 
 
 def flatten_config(config, parent_key="", sep="_"):
@@ -91,3 +269,31 @@ def flatten_config(config, parent_key="", sep="_"):
             items.append((new_key, v))
 
     return dict(items)
+
+
+def load_toml(path, cache=None):
+    """Load TOML file.
+
+    Parameters
+    ----------
+    path : Path or str
+        Path to the file
+    cache : TomlCache, optional
+        Cache of parsed TOML
+
+    Returns
+    -------
+    dict
+        TOML data
+    """
+    if cache is not None:
+        return cache.load(path)
+
+    # Imported here, since a warm cache never needs the parser
+    import tomllib
+
+    path = Path(path)
+    with path.open("rb") as f:
+        data = tomllib.load(f)
+
+    return data
@@ -0,0 +1,279 @@
+import sys
+import time
+from pathlib import Path
+
+from compile import SyllabusCompiler, TemplateRenderer
+from output import OutputWriter
+from utils import load_toml
+
+
+class Watcher:
+    """Polls syllabus inputs and recompiles the syllabi they feed.
+
+    The process stays warm between rebuilds: parsed TOML is kept until its
+    file changes, and the renderer keeps its compiled templates until a
+    template changes. With a TOML cache, a restarted watcher also skips
+    parsing files that haven't changed since the last run.
+    """
+
+    def __init__(
+        self,
+        config_dir,
+        schedule_dir,
+        template_dir,
+        output_dir,
+        interval=0.5,
+        debounce=0.2,
+        toml_cache=None,
+    ):
+        """Initialize the object.
+
+        Parameters
+        ----------
+        config_dir : Path
+            Directory of syllabus configs (.toml)
+        schedule_dir : Path
+            Directory of course schedules (.toml)
+        template_dir : Path
+            Directory of templates (.md)
+        output_dir : Path
+            Directory for the compiled markdown
+        interval : float
+            Seconds between polls
+        debounce : float
+            Seconds the inputs must stay unchanged before a rebuild
+        toml_cache : TomlCache, optional
+            Cache of parsed TOML
+        """
+        self.config_dir = Path(config_dir)
+        self.schedule_dir = Path(schedule_dir)
+        self.template_dir = Path(template_dir)
+        self.output_dir = Path(output_dir)
+        self.interval = interval
+        self.debounce = debounce
+        self.toml_cache = toml_cache
+
+        self._toml = {}
+        self._renderer = None
+
+    def _snapshot(self):
+        """Stat every watched file.
+
+        Returns
+        -------
+        dict[Path, tuple[int, int]]
+            Modification time and size of each file
+        """
+        paths = [
+            *self.config_dir.glob("*.toml"),
+            *self.schedule_dir.glob("*.toml"),
+            *self.template_dir.glob("*.md"),
+        ]
+        snapshot = {}
+        for path in paths:
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            snapshot[path] = (st.st_mtime_ns, st.st_size)
+
+        return snapshot
+
+    def _wait_for_quiet(self, snapshot):
+        """Wait until a burst of changes settles.
+
+        Parameters
+        ----------
+        snapshot : dict
+            The snapshot in which changes were first seen
+
+        Returns
+        -------
+        dict
+            The settled snapshot
+        """
+        while True:
+            time.sleep(self.debounce)
+            current = self._snapshot()
+            if current == snapshot:
+                return current
+
+            snapshot = current
+
+    def _load(self, path, stamp):
+        """Load TOML, reusing the parsed data if the file hasn't changed.
+
+        Parameters
+        ----------
+        path : Path
+            Path to the file
+        stamp : tuple[int, int]
+            Modification time and size of the file
+
+        Returns
+        -------
+        dict
+            TOML data
+        """
+        cached = self._toml.get(path)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, load_toml(path, cache=self.toml_cache))
+            self._toml[path] = cached
+
+        return cached[1]
+
+    def _affected(self, changed):
+        """Find the syllabi whose inputs are among the changed files.
+
+        Parameters
+        ----------
+        changed : set[Path]
+            Changed, added, or removed files
+
+        Returns
+        -------
+        list[str]
+            Names of the syllabi to rebuild
+        """
+        configs = sorted(p.stem for p in self.config_dir.glob("*.toml"))
+        if any(path.parent == self.template_dir for path in changed):
+            return configs
+
+        names = {path.stem for path in changed}
+        return [name for name in configs if name in names]
+
+    def _renderer_for(self, snapshot):
+        """Get a renderer for the current set of templates.
+
+        Parameters
+        ----------
+        snapshot : dict
+            The current snapshot
+
+        Returns
+        -------
+        TemplateRenderer
+            The renderer
+        """
+        paths = sorted(p for p in snapshot if p.parent == self.template_dir)
+        if self._renderer is None or self._renderer.template_paths != paths:
+            self._renderer = TemplateRenderer(paths)
+
+        return self._renderer
+
+    def rebuild(self, names, snapshot):
+        """Recompile a set of syllabi, logging each one's latency.
+
+        Parameters
+        ----------
+        names : list[str]
+            Names of the syllabi to rebuild
+        snapshot : dict
+            The current snapshot
+        """
+        renderer = self._renderer_for(snapshot)
+        writer = OutputWriter(self.output_dir)
+
+        for name in names:
+            config = self.config_dir / f"{name}.toml"
+            schedule = self.schedule_dir / f"{name}.toml"
+            output_path = self.output_dir / f"{name}.md"
+            if schedule not in snapshot:
+                print(f"Failed: {name}: missing {schedule}", file=sys.stderr)
+                continue
+
+            start = time.perf_counter()
+            try:
+                compiler = SyllabusCompiler(
+                    self._load(config, snapshot[config]),
+                    self._load(schedule, snapshot[schedule]),
+                    renderer.template_paths,
+                    renderer=renderer,
+                )
+                written = writer.write(
+                    output_path.name, f"{compiler.compile()}\n"
+                )
+            except Exception as e:
+                print(f"Failed: {name}: {e}", file=sys.stderr)
+                continue
+
+            elapsed = (time.perf_counter() - start) * 1000
+            status = "Rebuilt" if written else "Unchanged"
+            print(
+                f"{status}: {output_path} ({elapsed:.1f} ms)", file=sys.stderr
+            )
+
+        writer.save()
+
+    def run(self):
+        """Build every syllabus, then rebuild as inputs change.
+
+        Raises
+        ------
+        SystemExit
+            When the user stops watching with Ctrl+C
+        """
+        snapshot = self._snapshot()
+        self.rebuild(self._affected(set(snapshot)), snapshot)
+        print("Watching for changes (Ctrl+C to stop)", file=sys.stderr)
+
+        try:
+            while True:
+                time.sleep(self.interval)
+                current = self._snapshot()
+                if current == snapshot:
+                    continue
+
+                current = self._wait_for_quiet(current)
+                changed = {
+                    path
+                    for path in snapshot.keys() | current.keys()
+                    if snapshot.get(path) != current.get(path)
+                }
+                snapshot = current
+
+                # Forget parsed data for files that no longer exist
+                for path in changed - current.keys():
+                    self._toml.pop(path, None)
+
+                self.rebuild(self._affected(changed), snapshot)
+
+        except KeyboardInterrupt:
+            print("\nStopped watching", file=sys.stderr)
+            sys.exit(0)
+
+
+def watch(
+    config_dir,
+    schedule_dir,
+    template_dir,
+    output_dir,
+    interval=0.5,
+    toml_cache=None,
+):
+    """Watch syllabus inputs and recompile on change.
+
+    Parameters
+    ----------
+    config_dir : Path
+        Directory of syllabus configs (.toml)
+    schedule_dir : Path
+        Directory of course schedules (.toml)
+    template_dir : Path
+        Directory of templates (.md)
+    output_dir : Path
+        Directory for the compiled markdown
+    interval : float
+        Seconds between polls
+    toml_cache : TomlCache, optional
+        Cache of parsed TOML
+    """
+    watcher = Watcher(
+        config_dir,
+        schedule_dir,
+        template_dir,
+        output_dir,
+        interval=interval,
+        toml_cache=toml_cache,
+    )
+    watcher.run()
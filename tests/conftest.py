@@ -0,0 +1,18 @@
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# The modules in src/ import each other by name, as they do when the CLI
+# runs them
+sys.path.insert(0, str(ROOT / "src"))
+
+CONFIGS = sorted((ROOT / "config").glob("*.toml"))
+TEMPLATES = sorted((ROOT / "docs").glob("*.md"))
+
+requires_pandoc = pytest.mark.skipif(
+    shutil.which("pandoc") is None, reason="pandoc is not installed"
+)
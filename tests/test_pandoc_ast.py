@@ -0,0 +1,133 @@
+import pytest
+from conftest import CONFIGS, ROOT, TEMPLATES, requires_pandoc
+
+from compile import SyllabusCompiler, TemplateRenderer
+from pandoc_ast import (
+    apply_docx_layout,
+    auto_identifier,
+    markdown_to_ast,
+    splice_blocks,
+)
+from utils import load_toml
+
+
+def header(ident, text, level=2):
+    words = []
+    for i, word in enumerate(text.split()):
+        if i:
+            words.append({"t": "Space"})
+        words.append({"t": "Str", "c": word})
+
+    return {"t": "Header", "c": [level, [ident, [], []], words]}
+
+
+def idents(blocks):
+    found = []
+    for block in blocks:
+        if block["t"] == "Header":
+            found.append(block["c"][1][0])
+        elif block["t"] == "Div":
+            found.extend(idents(block["c"][1]))
+
+    return found
+
+
+@pytest.mark.parametrize(
+    "text, ident",
+    [
+        ("Hello, World!", "hello-world"),
+        ("2nd try: quotes & more", "nd-try-quotes-more"),
+        ("Über Straße", "über-straße"),
+        ("here_x.y", "here_x.y"),
+        ("123", ""),
+    ],
+)
+def test_auto_identifier(text, ident):
+    assert auto_identifier(header("", text)["c"][2]) == ident
+
+
+def marker(num):
+    para = {"t": "Para", "c": [{"t": "Str", "c": "section.md"}]}
+    return {"t": "Div", "c": [[f"static-{num}", [], []], [para]]}
+
+
+def test_splice_renumbers_fragment_suffixes():
+    # The fragment was parsed on its own, so it numbered its second
+    # "Policies" among its own headers alone
+    blocks = [header("policies", "Policies"), marker(0)]
+    fragment = [
+        header("policies", "Policies"),
+        header("policies-1", "Policies"),
+    ]
+
+    assert idents(splice_blocks(blocks, [fragment], "static")) == [
+        "policies",
+        "policies-1",
+        "policies-2",
+    ]
+
+
+def test_splice_renumbers_nested_headers():
+    div = {"t": "Div", "c": [["", [], []], [header("policies", "Policies")]]}
+    blocks = [header("policies", "Policies"), marker(0)]
+
+    assert idents(splice_blocks(blocks, [[div]], "static")) == [
+        "policies",
+        "policies-1",
+    ]
+    assert idents([div]) == ["policies"]
+
+
+def test_splice_keeps_explicit_identifiers():
+    blocks = [header("x", "X"), header("custom", "Policies"), marker(0)]
+    fragment = [
+        header("x", "X"),
+        header("x-9", "X"),
+        header("custom", "Policies"),
+    ]
+
+    assert idents(splice_blocks(blocks, [fragment], "static")) == [
+        "x",
+        "custom",
+        "x-1",
+        "x-9",
+        "custom",
+    ]
+
+
+@requires_pandoc
+@pytest.mark.parametrize("config", CONFIGS, ids=lambda path: path.stem)
+def test_splice_matches_single_parse(config):
+    schedule = ROOT / "schedules" / config.name
+    compiler = SyllabusCompiler(
+        load_toml(config), load_toml(schedule), TEMPLATES
+    )
+    full = markdown_to_ast(compiler.compile())
+
+    assert compiler.compile_ast() == full
+    assert compiler.compile_ast(docx_layout=True) == apply_docx_layout(full)
+
+
+@requires_pandoc
+def test_splice_matches_single_parse_with_repeated_headers(tmp_path):
+    sections = {
+        "01.md": "## Policies\n\n$title",
+        "02.md": (
+            "## Policies\n\nStatic.\n\n## Policies\n\n"
+            "::: note\n## Policies\n:::\n\n## Policies-1"
+        ),
+        "03.md": "## Policies\n\n$title",
+        "04.md": "## Policies\n\n## Policies {#policies-9}",
+    }
+    paths = []
+    for name, text in sections.items():
+        path = tmp_path / name
+        path.write_text(text)
+        paths.append(path)
+
+    renderer = TemplateRenderer(paths)
+    context = {"title": "Title"}
+
+    assert renderer.render_ast(context) == markdown_to_ast(
+        renderer.render(context)
+    )
@@ -0,0 +1,128 @@
+from textwrap import TextWrapper
+
+import pytest
+from conftest import CONFIGS, ROOT
+
+from templates import MarkdownEntry
+from utils import ParagraphWrapper, load_toml, wrap_many, wrap_paragraphs
+
+WIDTHS = (79, 40, 12)
+
+
+def textwrap_paragraphs(text, width=79):
+    """Wrap text with TextWrapper, as wrap_paragraphs did before."""
+    wrapper = TextWrapper(
+        width=width,
+        replace_whitespace=True,
+        drop_whitespace=True,
+        break_long_words=False,
+        break_on_hyphens=False,
+    )
+    out_lines = []
+    paragraph = []
+
+    def flush():
+        if not paragraph:
+            return
+
+        para_text = " ".join(line.strip() for line in paragraph).strip()
+        out_lines.extend(line.rstrip() for line in wrapper.wrap(para_text))
+        paragraph.clear()
+
+    for line in text.splitlines():
+        if line.strip() == "":
+            flush()
+            out_lines.append("")
+        else:
+            paragraph.append(line)
+
+    flush()
+
+    return "\n".join(out_lines).rstrip("\n")
+
+
+def strings(value):
+    """Collect every string in TOML data."""
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from strings(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from strings(item)
+
+
+def config_texts(config):
+    """Collect the texts of a config and its schedule, and its entries."""
+    data = load_toml(config)
+    texts = list(strings(data))
+    texts.extend(strings(load_toml(ROOT / "schedules" / config.name)))
+    for item_type in ("assignment", "book", "objective"):
+        if item_type in data:
+            entries = MarkdownEntry[item_type.upper()].render_many(
+                data[item_type]
+            )
+            texts.extend(entries)
+
+    return texts
+
+
+def spaced(text):
+    """Vary a text's whitespace, so it can't take the single-space path."""
+    return "\t" + text.replace(" ", "  ", 3).replace(" ", "\t", 1) + "  "
+
+
+@pytest.mark.parametrize("config", CONFIGS, ids=lambda path: path.stem)
+@pytest.mark.parametrize("width", WIDTHS)
+def test_wrap_paragraphs_matches_textwrap(config, width):
+    for text in config_texts(config):
+        assert wrap_paragraphs(text, width) == textwrap_paragraphs(
+            text, width
+        )
+
+
+@pytest.mark.parametrize("config", CONFIGS, ids=lambda path: path.stem)
+@pytest.mark.parametrize("width", WIDTHS)
+def test_wrap_paragraphs_chunk_path_matches_textwrap(config, width):
+    for text in map(spaced, config_texts(config)):
+        assert wrap_paragraphs(text, width) == textwrap_paragraphs(
+            text, width
+        )
+
+
+@pytest.mark.parametrize("config", CONFIGS, ids=lambda path: path.stem)
+def test_wrap_many_matches_textwrap(config):
+    texts = config_texts(config)
+    texts += [spaced(text) for text in texts]
+
+    assert wrap_many(texts) == [textwrap_paragraphs(text) for text in texts]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "a-very-long-hyphenated-word that overflows",
+        "word " * 5 + "x" * 30 + " tail",
+        "  leading and  double   spaces  ",
+        "tabs\tand\x0bvertical\x0cfeeds\rhere",
+        "",
+        "   ",
+    ],
+)
+@pytest.mark.parametrize("width", (1, 8, 20))
+def test_wrap_lines_matches_textwrap(text, width):
+    expected = TextWrapper(
+        width=width,
+        replace_whitespace=True,
+        drop_whitespace=True,
+        break_long_words=False,
+        break_on_hyphens=False,
+    ).wrap(text)
+
+    assert ParagraphWrapper(width).wrap_lines(text) == expected
+
+
+def test_wrapper_rejects_bad_width():
+    with pytest.raises(ValueError):
+        ParagraphWrapper(0)